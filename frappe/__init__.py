@@ -141,6 +141,8 @@ def init(site, sites_path=None, new_site=False):
 	local.message_log = []
 	local.debug_log = []
 	local.realtime_log = []
+	local.version_log = []
+	local.after_commit = []
 	local.flags = _dict({
 		"ran_schedulers": [],
 		"currently_saving": [],
@@ -546,19 +548,17 @@ def whitelist(allow_guest=False, xss_safe=False):
 	return innerfn
 
 def read_only():
+	"""Run the decorated function on a read replica, see `frappe.database.replica`"""
 	def innfn(fn):
 		def wrapper_fn(*args, **kwargs):
-			if conf.read_from_replica:
-				connect_replica()
+			from frappe.database.replica import use_replica, release_replica
+			switched = conf.read_from_replica and use_replica()
 
 			try:
 				retval = fn(*args, **get_newargs(fn, kwargs))
-			except Exception:
-				raise
 			finally:
-				if local and hasattr(local, 'primary_db'):
-					local.db.close()
-					local.db = local.primary_db
+				if switched:
+					release_replica()
 
 			return retval
 		return wrapper_fn
@@ -720,43 +720,31 @@ def set_value(doctype, docname, fieldname, value=None):
 	return frappe.client.set_value(doctype, docname, fieldname, value)
 
 def get_cached_doc(*args, **kwargs):
+	"""Return a `frappe.model.document.Document` of the given type and name from the document
+	cache (see `frappe.model.utils.document_cache`). Changes to it are not saved to the cache."""
 	if args and len(args) > 1 and isinstance(args[1], text_type):
-		key = get_document_cache_key(args[0], args[1])
-		# local cache
-		doc = local.document_cache.get(key)
-		if doc:
-			return doc
-
-		# redis cache
-		doc = cache().hget('document_cache', key)
-		if doc:
-			doc = get_doc(doc)
-			local.document_cache[key] = doc
-			return doc
+		from frappe.model.utils.document_cache import get_doc as get_cached
+		return get_cached(args[0], args[1])
 
 	# database
-	doc = get_doc(*args, **kwargs)
-
-	return doc
+	return get_doc(*args, **kwargs)
 
 def get_document_cache_key(doctype, name):
 	return '{0}::{1}'.format(doctype, name)
 
 def clear_document_cache(doctype, name):
+	from frappe.model.utils.document_cache import invalidate
 	cache().hdel("last_modified", doctype)
-	key = get_document_cache_key(doctype, name)
-	if key in local.document_cache:
-		del local.document_cache[key]
-	cache().hdel('document_cache', key)
+	invalidate(doctype, name)
 
 def get_cached_value(doctype, name, fieldname, as_dict=False):
-	doc = get_cached_doc(doctype, name)
+	from frappe.model.utils.document_cache import get_values
 	if isinstance(fieldname, string_types):
 		if as_dict:
 			throw('Cannot make dict for single fieldname')
-		return doc.get(fieldname)
+		return get_values(doctype, name, [fieldname])[0]
 
-	values = [doc.get(f) for f in fieldname]
+	values = get_values(doctype, name, fieldname)
 	if as_dict:
 		return _dict(zip(fieldname, values))
 	return values
@@ -778,15 +766,16 @@ def get_doc(*args, **kwargs):
 
 	"""
 	import frappe.model.document
-	doc = frappe.model.document.get_doc(*args, **kwargs)
+	return frappe.model.document.get_doc(*args, **kwargs)
 
-	# set in cache
-	if args and len(args) > 1:
-		key = get_document_cache_key(args[0], args[1])
-		local.document_cache[key] = doc
-		cache().hset('document_cache', key, doc.as_dict())
+def get_docs(doctype, names):
+	"""Return a list of `frappe.model.document.Document` objects of the given names, loaded
+	with one query for the parents and one query per child DocType.
 
-	return doc
+	:param doctype: DocType name as string.
+	:param names: List of document names."""
+	import frappe.model.document
+	return frappe.model.document.get_docs(doctype, names)
 
 def get_last_doc(doctype):
 	"""Get last created document of this type."""
@@ -1317,7 +1306,13 @@ def get_list(doctype, *args, **kwargs):
 		frappe.get_list("ToDo", fields="*", filters = {"description": ("like", "test%")})
 	"""
 	import frappe.model.db_query
-	return frappe.model.db_query.DatabaseQuery(doctype).execute(None, *args, **kwargs)
+	execute = frappe.model.db_query.DatabaseQuery(doctype).execute
+
+	# lists fetched in GET requests can be served from a replica
+	if conf.read_from_replica and getattr(local, "request", None) and local.request.method == "GET":
+		execute = read_only()(execute)
+
+	return execute(None, *args, **kwargs)
 
 def get_all(doctype, *args, **kwargs):
 	"""List database query via `frappe.model.db_query`. Will **not** check for permissions.
@@ -1346,6 +1341,23 @@ def get_all(doctype, *args, **kwargs):
 		kwargs["limit_page_length"] = 0
 	return get_list(doctype, *args, **kwargs)
 
+def iter_all(doctype, *args, **kwargs):
+	"""Like `frappe.get_all`, but streams the result with a server-side cursor instead of
+	loading it in memory. Parameters are same as `frappe.get_all`.
+
+	:param chunk_size: [optional] Yield lists of up to `chunk_size` records instead of single records.
+
+	Example usage:
+
+		for entry in frappe.iter_all("GL Entry", fields=["account", "debit"], chunk_size=10000):
+			process(entry)
+	"""
+	chunk_size = kwargs.pop("chunk_size", None)
+	as_list = kwargs.get("as_list")
+	kwargs["return_query"] = True
+	query = get_all(doctype, *args, **kwargs)
+	return db.iter_sql(query, as_dict=not as_list, chunk_size=chunk_size)
+
 def get_value(*args, **kwargs):
 	"""Returns a document property or list of properties.
 
@@ -9,6 +9,8 @@ from six import iteritems, text_type
 bootstrap client session
 """
 
+import copy
+import hashlib
 import frappe
 import frappe.defaults
 import frappe.desk.desk_page
@@ -20,70 +22,228 @@ from frappe.social.doctype.energy_point_settings.energy_point_settings import is
 from frappe.social.doctype.energy_point_log.energy_point_log import get_energy_points
 from frappe.social.doctype.post.post import frequently_visited_links
 
-def get_bootinfo():
-	"""build and return boot info"""
+# global cache keys read while building bootinfo, fetched together in `prefetch_cache`
+boot_cache_keys = ("app_hooks", "active_domains", "active_modules", "languages", "metadata_version")
+
+# bootinfo is assembled from fragments cached and versioned separately, by what they vary with:
+#	site, user_info: shared by all users
+#	translations: per language
+#	roles: per set of roles and language
+#	user: per user, including the changes made by `boot_session` hooks
+boot_fragments = ("site", "user_info", "translations", "roles", "user")
+
+# shared fragments are kept in this hash, user fragments in `bootinfo`
+boot_fragments_key = "boot_fragments"
+
+# shared fragments built from the documents of these DocTypes
+boot_fragment_doctypes = {
+	"DocType": ("site",),
+	"File": ("site",),
+	"Letter Head": ("site",),
+	"Print Settings": ("site",),
+	"Domain": ("site",),
+	"Language": ("site",),
+	"Success Action": ("site",),
+	"User": ("user_info",),
+	"Page": ("roles",),
+	"Report": ("roles",),
+	"Custom Role": ("roles",)
+}
+
+# set per request, never cached
+session_keys = ("sid", "ipinfo")
+
+def get_bootinfo(known_versions=None):
+	"""build and return boot info from its cached fragments
+
+	:param known_versions: `boot_fragments` ({fragment: version}) of the bootinfo held by the
+		client, fragments that have not changed since are left out"""
+	prefetch_cache()
 	frappe.set_user_lang(frappe.session.user)
+	known_versions = known_versions or {}
+	use_cache = not frappe.conf.disable_session_cache
+
+	fragments = get_shared_fragments(use_cache)
+
+	shared = frappe._dict()
+	for name in boot_fragments[:-1]:
+		if fragments.get(name):
+			shared.update(fragments[name].data)
+
+	fragments["user"] = use_cache and frappe.cache().hget("bootinfo", frappe.session.user)
+	from_cache = bool(fragments["user"])
+	if not from_cache:
+		fragments["user"] = make_fragment(get_user_fragment(shared))
+		if use_cache:
+			frappe.cache().hset("bootinfo", frappe.session.user, fragments["user"])
+
+	# messages are made of the translations and report names of the role set
+	changed = set(name for name in boot_fragments
+		if fragments.get(name) and known_versions.get(name) != fragments[name].version)
+	if changed & {"translations", "roles"}:
+		changed.update(("translations", "roles"))
+
+	# values of shared fragments changed by hooks are sent again with the shared values
+	if changed and set(fragments["user"].data) & set(shared):
+		changed.add("user")
+
+	bootinfo = frappe._dict(boot_fragments={})
+	for name in boot_fragments:
+		if fragments.get(name):
+			bootinfo.boot_fragments[name] = fragments[name].version
+			if name in changed:
+				bootinfo.update(fragments[name].data)
+
+	if "translations" in changed:
+		bootinfo["__messages"] = dict(bootinfo.pop("__messages"), **bootinfo.pop("__report_messages"))
+
+	set_session_info(bootinfo)
+	bootinfo.from_cache = 1 if from_cache else 0
+
+	return bootinfo
+
+def get_shared_fragments(use_cache=True):
+	"""Returns the fragments shared between users, building the ones not cached"""
+	fields = {
+		"site": "site",
+		"translations": "translations:" + frappe.lang,
+		"roles": "roles:" + get_roles_key() + ":" + frappe.lang
+	}
+	if frappe.session.user != "Guest":
+		fields["user_info"] = "user_info"
+
+	cached = frappe.cache().hget_many(boot_fragments_key, list(fields.values())) if use_cache else {}
+
+	fragments = {}
+	to_cache = {}
+	for name, field in fields.items():
+		fragments[name] = cached.get(field)
+		if not fragments[name]:
+			fragments[name] = to_cache[field] = make_fragment(boot_fragment_builders[name]())
+
+	if use_cache:
+		frappe.cache().hset_many(boot_fragments_key, to_cache)
+
+	return fragments
+
+def make_fragment(data):
+	return frappe._dict(version=frappe.generate_hash(length=10), data=data)
+
+def get_roles_key():
+	roles = sorted(set(frappe.get_roles()))
+	return hashlib.md5(frappe.safe_encode(",".join(roles))).hexdigest()
+
+def get_site_fragment():
+	bootinfo = frappe._dict()
+	bootinfo.sitename = frappe.local.site
+	bootinfo.letter_heads = get_letter_heads()
+	bootinfo.active_domains = frappe.get_active_domains()
+	bootinfo.all_domains = [d.get("name") for d in frappe.get_all("Domain")]
+
+	bootinfo.module_app = frappe.local.module_app
+	bootinfo.single_types = [d.name for d in frappe.get_all('DocType', {'issingle': 1})]
+	bootinfo.nested_set_doctypes = [d.parent for d in frappe.get_all('DocField', {'fieldname': 'lft'}, ['parent'])]
+	load_conf_settings(bootinfo)
+	load_print_css(bootinfo, frappe.db.get_singles_dict("Print Settings"))
+	bootinfo.home_folder = frappe.db.get_value("File", {"is_home_folder": 1})
+
+	bootinfo.versions = {k: v['version'] for k, v in get_versions().items()}
+	bootinfo.error_report_email = frappe.conf.error_report_email
+	bootinfo.calendars = sorted(frappe.get_hooks("calendars"))
+	bootinfo.treeviews = frappe.get_hooks("treeviews") or []
+	bootinfo.lang_dict = get_lang_dict()
+	bootinfo.success_action = get_success_action()
+	bootinfo.energy_points_enabled = is_energy_point_enabled()
+	bootinfo.link_preview_doctypes = get_link_preview_doctypes()
+
+	return bootinfo
+
+def get_user_info_fragment():
+	return frappe._dict(user_info=get_fullnames())
+
+def get_translations_fragment():
+	# only untranslated
+	messages = {k:v for k, v in iteritems(frappe.get_lang_dict("boot")) if k!=v}
+	return frappe._dict(__messages=messages)
+
+def get_roles_fragment():
 	bootinfo = frappe._dict()
-	hooks = frappe.get_hooks()
+	bootinfo.page_info = get_allowed_pages()
+
+	# load translated report names
+	bootinfo["__report_messages"] = {}
+	for name in get_allowed_reports():
+		message = frappe._(name)
+		if message != name:
+			bootinfo["__report_messages"][name] = message
+
+	return bootinfo
+
+def get_user_fragment(shared):
+	"""Returns the values of the user, and the values of shared fragments changed by
+	`boot_session` hooks"""
+	hooks = frappe.get_hooks("boot_session")
+	bootinfo = frappe._dict(copy.deepcopy(shared) if hooks else {})
 	doclist = []
 
 	# user
 	get_user(bootinfo)
 
 	# system info
-	bootinfo.sitename = frappe.local.site
 	bootinfo.sysdefaults = frappe.defaults.get_defaults()
 	bootinfo.server_date = frappe.utils.nowdate()
 
-	if frappe.session['user'] != 'Guest':
-		bootinfo.user_info = get_fullnames()
-		bootinfo.sid = frappe.session['sid']
-
 	bootinfo.modules = {}
 	bootinfo.module_list = []
 	load_desktop_icons(bootinfo)
-	bootinfo.letter_heads = get_letter_heads()
-	bootinfo.active_domains = frappe.get_active_domains()
-	bootinfo.all_domains = [d.get("name") for d in frappe.get_all("Domain")]
-
-	bootinfo.module_app = frappe.local.module_app
-	bootinfo.single_types = [d.name for d in frappe.get_all('DocType', {'issingle': 1})]
-	bootinfo.nested_set_doctypes = [d.parent for d in frappe.get_all('DocField', {'fieldname': 'lft'}, ['parent'])]
 	add_home_page(bootinfo, doclist)
-	bootinfo.page_info = get_allowed_pages()
-	load_translations(bootinfo)
+	bootinfo["lang"] = frappe.lang
 	add_timezone_info(bootinfo)
-	load_conf_settings(bootinfo)
 	load_print(bootinfo, doclist)
 	doclist.extend(get_meta_bundle("Page"))
-	bootinfo.home_folder = frappe.db.get_value("File", {"is_home_folder": 1})
-
-	# ipinfo
-	if frappe.session.data.get('ipinfo'):
-		bootinfo.ipinfo = frappe.session['data']['ipinfo']
 
 	# add docs
 	bootinfo.docs = doclist
 
-	for method in hooks.boot_session or []:
+	bootinfo.update(get_email_accounts(user=frappe.session.user))
+	bootinfo.points = get_energy_points(frappe.session.user)
+	bootinfo.frequently_visited_links = frequently_visited_links()
+
+	set_session_info(bootinfo)
+	for method in hooks:
 		frappe.get_attr(method)(bootinfo)
 
 	if bootinfo.lang:
 		bootinfo.lang = text_type(bootinfo.lang)
-	bootinfo.versions = {k: v['version'] for k, v in get_versions().items()}
 
-	bootinfo.error_report_email = frappe.conf.error_report_email
-	bootinfo.calendars = sorted(frappe.get_hooks("calendars"))
-	bootinfo.treeviews = frappe.get_hooks("treeviews") or []
-	bootinfo.lang_dict = get_lang_dict()
-	bootinfo.success_action = get_success_action()
-	bootinfo.update(get_email_accounts(user=frappe.session.user))
-	bootinfo.energy_points_enabled = is_energy_point_enabled()
-	bootinfo.points = get_energy_points(frappe.session.user)
-	bootinfo.frequently_visited_links = frequently_visited_links()
-	bootinfo.link_preview_doctypes = get_link_preview_doctypes()
+	return frappe._dict((key, value) for key, value in iteritems(bootinfo)
+		if key not in session_keys and (key not in shared or value != shared[key]))
 
-	return bootinfo
+def set_session_info(bootinfo):
+	if frappe.session['user'] != 'Guest':
+		bootinfo.sid = frappe.session['sid']
+
+	# ipinfo
+	if frappe.session.data.get('ipinfo'):
+		bootinfo.ipinfo = frappe.session['data']['ipinfo']
+
+def clear_boot_fragments(doc, method=None):
+	"""Clear the shared bootinfo fragments built from the document's DocType"""
+	for name in boot_fragment_doctypes.get(doc.doctype, ()):
+		clear_boot_fragment(name)
+
+def clear_boot_fragment(name):
+	cache = frappe.cache()
+	for field in cache.hkeys(boot_fragments_key):
+		field = frappe.safe_decode(field)
+		if field.split(":", 1)[0] == name:
+			cache.hdel(boot_fragments_key, field)
+
+def prefetch_cache():
+	"""Load the cache values needed to build bootinfo with a couple of round trips
+	instead of one per key"""
+	frappe.cache().get_values(boot_cache_keys)
+	frappe.cache().hget_many("defaults", ["__default", frappe.session.user])
 
 def get_letter_heads():
 	letter_heads = {}
@@ -189,20 +349,6 @@ def get_column(doctype):
 
 	return column
 
-def load_translations(bootinfo):
-	messages = frappe.get_lang_dict("boot")
-
-	bootinfo["lang"] = frappe.lang
-
-	# load translated report names
-	for name in bootinfo.user.all_reports:
-		messages[name] = frappe._(name)
-
-	# only untranslated
-	messages = {k:v for k, v in iteritems(messages) if k!=v}
-
-	bootinfo["__messages"] = messages
-
 def get_fullnames():
 	"""map of user fullnames"""
 	ret = frappe.db.sql("""select `name`, full_name as fullname,
@@ -250,7 +396,6 @@ def load_print(bootinfo, doclist):
 	print_settings = frappe.db.get_singles_dict("Print Settings")
 	print_settings.doctype = ":Print Settings"
 	doclist.append(print_settings)
-	load_print_css(bootinfo, print_settings)
 
 def load_print_css(bootinfo, print_settings):
 	import frappe.www.printview
@@ -266,4 +411,12 @@ def get_success_action():
 	return frappe.get_all("Success Action", fields=["*"])
 
 def get_link_preview_doctypes():
-	return [d.name for d in frappe.db.get_all('DocType', {'show_preview_popup': 1})]
\ No newline at end of file
+	return [d.name for d in frappe.db.get_all('DocType', {'show_preview_popup': 1})]
+
+
+boot_fragment_builders = {
+	"site": get_site_fragment,
+	"user_info": get_user_info_fragment,
+	"translations": get_translations_fragment,
+	"roles": get_roles_fragment
+}
@@ -13,14 +13,16 @@ common_default_keys = ["__default", "__global"]
 global_cache_keys = ("app_hooks", "installed_apps",
 		"app_modules", "module_app", "system_settings",
 		'scheduler_events', 'time_zone', 'webhooks', 'active_domains',
-		'active_modules', 'assignment_rule', 'server_script_map', 'wkhtmltopdf_version')
+		'active_modules', 'assignment_rule', 'server_script_map', 'wkhtmltopdf_version',
+		'boot_fragments')
 
 user_cache_keys = ("bootinfo", "user_recent", "roles", "user_doc", "lang",
 		"defaults", "user_permissions", "home_page", "linked_with",
 		"desktop_icons", 'portal_menu_items')
 
 doctype_cache_keys = ("meta", "form_meta", "table_columns", "last_modified",
-		"linked_doctypes", 'notifications', 'workflow' ,'energy_point_rule_map')
+		"linked_doctypes", 'notifications', 'workflow' ,'energy_point_rule_map',
+		"role_permissions")
 
 
 def clear_user_cache(user=None):
@@ -38,6 +40,7 @@ def clear_user_cache(user=None):
 	else:
 		for name in user_cache_keys:
 			cache.delete_key(name)
+		cache.delete_key("shared_docs")
 		clear_defaults_cache()
 		clear_global_cache()
 
@@ -57,8 +60,8 @@ def clear_defaults_cache(user=None):
 		frappe.cache().delete_key("defaults")
 
 def clear_document_cache():
-	frappe.local.document_cache = {}
-	frappe.cache().delete_key("document_cache")
+	from frappe.model.utils.document_cache import clear
+	clear()
 
 def clear_doctype_cache(doctype=None):
 	cache = frappe.cache()
@@ -93,6 +96,10 @@ def clear_doctype_cache(doctype=None):
 	# Clear all document's cache. To clear documents of a specific DocType document_cache should be restructured
 	clear_document_cache()
 
+	# single, nested set and link preview doctypes are in bootinfo
+	from frappe.boot import clear_boot_fragment
+	clear_boot_fragment("site")
+
 def get_doctype_map(doctype, name, filters, order_by=None):
 	cache = frappe.cache()
 	cache_key = frappe.scrub(doctype) + '_map'
@@ -9,3 +9,6 @@ from frappe.model.document import Document
 class CustomDocPerm(Document):
 	def on_update(self):
 		frappe.clear_cache(doctype = self.parent)
+
+	def on_trash(self):
+		frappe.clear_cache(doctype = self.parent)
@@ -5,27 +5,40 @@
 import io
 import os
 import json
+import time
 import timeit
 import frappe
 from datetime import datetime
+from six.moves import cPickle as pickle
 from frappe import _
 from frappe.utils import cint, flt, update_progress_bar, cstr
-from frappe.utils.csvutils import read_csv_content
-from frappe.utils.xlsxutils import (
-	read_xlsx_file_from_attached_file,
-	read_xls_file_from_attached_file,
-)
+from frappe.utils.background_jobs import enqueue
+from itertools import islice
+from frappe.utils.csvutils import read_csv_rows
+from frappe.utils.xlsxutils import read_xlsx_rows, read_xls_file_from_attached_file
 from frappe.model import no_value_fields, table_fields
+from frappe.model.base_document import get_link_values
+from frappe.model.document import db_insert_rows
 
 INVALID_VALUES = ["", None]
 MAX_ROWS_IN_PREVIEW = 10
+# rows kept in memory to guess date formats
+SAMPLE_ROW_COUNT = 10
 INSERT = "Insert New Records"
 UPDATE = "Update Existing Records"
+# seconds for which the state of a sharded import is kept in redis
+SHARD_EXPIRY = 86400
 
 # pylint: disable=R0201
 class Importer:
 	def __init__(
-		self, doctype, data_import=None, file_path=None, content=None, console=False
+		self,
+		doctype,
+		data_import=None,
+		file_path=None,
+		content=None,
+		console=False,
+		parse_template=True,
 	):
 		self.doctype = doctype
 		self.template_options = frappe._dict({"remap_column": {}})
@@ -48,129 +61,133 @@ class Importer:
 		self._guessed_date_formats = {}
 		# used to store eta during import
 		self.last_eta = 0
+		# used to throttle progress events
+		self.last_progress_at = 0
+		# redis key of the progress of a sharded import
+		self.shared_progress_key = None
+		# missing link values created in the current transaction, restored on rollback
+		self.uncommitted_link_values = []
 		# used to collect warnings during template parsing
 		# and show them to user
 		self.warnings = []
 		self.meta = frappe.get_meta(doctype)
-		self.prepare_content(file_path, content)
-		self.parse_data_from_template()
+		if parse_template:
+			self.prepare_content(file_path, content)
+			self.parse_data_from_template()
 
 	def prepare_content(self, file_path, content):
 		extension = None
-		if self.data_import and self.data_import.import_file:
+		if self.data_import and self.data_import.import_file and not file_path:
 			file_doc = frappe.get_doc("File", {"file_url": self.data_import.import_file})
 			parts = file_doc.get_extension()
-			extension = parts[1]
-			content = file_doc.get_content()
-			extension = extension.lstrip(".")
+			extension = parts[1].lstrip(".")
+			# the file is read lazily from the disk
+			file_path = file_doc.get_full_path()
 
 		if file_path:
-			content, extension = self.read_file(file_path)
+			extension = file_path.rsplit(".", 1)[-1]
 
 		if not extension:
 			extension = "csv"
 
-		if content:
-			self.read_content(content, extension)
-
-		self.validate_template_content()
-		self.remove_empty_rows_and_columns()
-
-	def read_file(self, file_path):
-		extn = file_path.split(".")[1]
-
-		file_content = None
-		with io.open(file_path, mode="rb") as f:
-			file_content = f.read()
-
-		return file_content, extn
-
-	def read_content(self, content, extension):
-		error_title = _("Template Error")
 		if extension not in ("csv", "xlsx", "xls"):
 			frappe.throw(
-				_("Import template should be of type .csv, .xlsx or .xls"), title=error_title
+				_("Import template should be of type .csv, .xlsx or .xls"), title=_("Template Error")
 			)
 
-		if extension == "csv":
-			data = read_csv_content(content)
-		elif extension == "xlsx":
-			data = read_xlsx_file_from_attached_file(fcontent=content)
-		elif extension == "xls":
-			data = read_xls_file_from_attached_file(content)
+		self.file_path = file_path
+		self.content = content
+		self.extension = extension
+
+		self.scan_content()
+
+	def read_rows(self):
+		"""Yields the rows of the file (or content) one by one, starting with the header row"""
+		if self.extension == "csv":
+			return read_csv_rows(fcontent=self.content, filepath=self.file_path)
+		elif self.extension == "xlsx":
+			return read_xlsx_rows(self.file_path or io.BytesIO(self.content))
+		elif self.extension == "xls":
+			content = self.content
+			if self.file_path:
+				with io.open(self.file_path, mode="rb") as f:
+					content = f.read()
+			return iter(read_xls_file_from_attached_file(content))
+
+	def scan_content(self):
+		"""Read the file once to validate the number of columns, find empty rows and columns
+		and count the rows. Only the first rows are kept (`self.data`), to guess date formats."""
+		rows = self.read_rows()
+		self.header_row = next(rows, None) or []
+		column_count = len(self.header_row)
+		empty_columns = set(
+			i for i, value in enumerate(self.header_row) if value in INVALID_VALUES
+		)
 
-		if len(data) <= 1:
-			frappe.throw(
-				_("Import template should contain a Header and atleast one row."), title=error_title
-			)
+		self.data = []
+		self.row_count = 0
+		has_rows = False
+		for row in rows:
+			has_rows = True
+			if len(row) != column_count and len(row) != 0:
+				frappe.throw(
+					_("Number of columns does not match with data"), title=_("Invalid Template")
+				)
 
-		self.header_row = data[0]
-		self.data = data[1:]
+			if all(v in INVALID_VALUES for v in row):
+				# empty row
+				continue
 
-	def validate_template_content(self):
-		column_count = len(self.header_row)
-		if any([len(row) != column_count and len(row) != 0 for row in self.data]):
+			self.row_count += 1
+			if len(self.data) < SAMPLE_ROW_COUNT:
+				self.data.append(row)
+
+			# a column with a header and no data is a valid column
+			# a column with no header and no data will be removed
+			if empty_columns:
+				empty_columns = set(i for i in empty_columns if row[i] in INVALID_VALUES)
+
+		if not has_rows:
 			frappe.throw(
-				_("Number of columns does not match with data"), title=_("Invalid Template")
+				_("Import template should contain a Header and atleast one row."),
+				title=_("Template Error"),
 			)
 
-	def remove_empty_rows_and_columns(self):
-		self.row_index_map = []
-		removed_rows = []
-		removed_columns = []
+		self.removed_columns = empty_columns
+		self.header_row = self.remove_empty_columns(self.header_row)
+		self.data = [self.remove_empty_columns(row) for row in self.data]
 
-		# remove empty rows
-		data = []
-		for i, row in enumerate(self.data):
-			if all(v in INVALID_VALUES for v in row):
-				# empty row
-				removed_rows.append(i)
-			else:
-				data.append(row)
-				self.row_index_map.append(i)
-
-		# remove empty columns
-		# a column with a header and no data is a valid column
-		# a column with no header and no data will be removed
-		header_row = []
-		for i, column in enumerate(self.header_row):
-			column_values = [row[i] for row in data]
-			values = [column] + column_values
-			if all(v in INVALID_VALUES for v in values):
-				# empty column
-				removed_columns.append(i)
-			else:
-				header_row.append(column)
+	def remove_empty_columns(self, row):
+		if not self.removed_columns:
+			return row
+		return [v for j, v in enumerate(row) if j not in self.removed_columns]
 
-		data_without_empty_columns = []
-		# remove empty columns from data
-		for i, row in enumerate(data):
-			new_row = [v for j, v in enumerate(row) if j not in removed_columns]
-			data_without_empty_columns.append(new_row)
+	def iter_rows(self):
+		"""Yields the rows with data without empty columns, prefixed with their row number"""
+		rows = self.read_rows()
+		# header
+		next(rows, None)
 
-		self.data = data_without_empty_columns
-		self.header_row = header_row
+		for i, row in enumerate(rows):
+			if all(v in INVALID_VALUES for v in row):
+				continue
+			yield [i + 1] + self.remove_empty_columns(row)
 
 	def get_data_for_import_preview(self):
 		out = frappe._dict()
-		out.data = list(self.rows)
+		out.data = list(islice(self.iter_rows(), MAX_ROWS_IN_PREVIEW))
 		out.columns = self.columns
 		out.warnings = self.warnings
-		total_number_of_rows = len(out.data)
-		if total_number_of_rows > MAX_ROWS_IN_PREVIEW:
-			out.data = out.data[:MAX_ROWS_IN_PREVIEW]
+		if self.row_count > MAX_ROWS_IN_PREVIEW:
 			out.max_rows_exceeded = True
 			out.max_rows_in_preview = MAX_ROWS_IN_PREVIEW
-			out.total_number_of_rows = total_number_of_rows
+			out.total_number_of_rows = self.row_count
 		return out
 
 	def parse_data_from_template(self):
 		columns = self.parse_columns_from_header_row()
 		columns = self.detect_date_formats(columns)
-		columns, data = self.add_serial_no_column(columns, self.data)
-
-		self.columns = columns
-		self.rows = data
+		self.columns = self.add_serial_no_column(columns)
 
 	def parse_columns_from_header_row(self):
 		remap_column = self.template_options.remap_column
@@ -329,7 +346,7 @@ class Importer:
 				col.date_format = self.guess_date_format_for_column(col, columns)
 		return columns
 
-	def add_serial_no_column(self, columns, data):
+	def add_serial_no_column(self, columns):
 		columns_with_serial_no = [
 			frappe._dict({"header_title": "Sr. No", "skip_import": True})
 		] + columns
@@ -338,11 +355,7 @@ class Importer:
 		for i, col in enumerate(columns_with_serial_no):
 			col.index = i
 
-		data_with_serial_no = []
-		for i, row in enumerate(data):
-			data_with_serial_no.append([self.row_index_map[i] + 1] + row)
-
-		return columns_with_serial_no, data_with_serial_no
+		return columns_with_serial_no
 
 	def parse_value(self, value, df):
 		value = cstr(value)
@@ -419,8 +432,32 @@ class Importer:
 		# prepare a map for missing link field values
 		self.prepare_missing_link_field_values()
 
-		# parse docs from rows
-		payloads = self.get_payloads_for_import()
+		# setup import log
+		if self.data_import.import_log:
+			import_log = frappe.parse_json(self.data_import.import_log)
+		else:
+			import_log = []
+
+		# remove previous failures from import log
+		import_log = [l for l in import_log if l.get("success") == True]
+
+		# get successfully imported rows
+		imported_rows = set()
+		for log in import_log:
+			log = frappe._dict(log)
+			if log.success:
+				imported_rows.update(log.row_indexes)
+
+		def is_imported(payload):
+			return imported_rows.intersection(row[0] for row in payload.rows)
+
+		# parse docs from rows once to validate them, payloads are not kept in memory
+		total_payload_count = 0
+		skipped = 0
+		for payload in self.iter_payloads():
+			total_payload_count += 1
+			if is_imported(payload):
+				skipped += 1
 
 		# dont import if there are non-ignorable warnings
 		warnings = [w for w in self.warnings if w.get("type") != "info"]
@@ -434,95 +471,43 @@ class Importer:
 				)
 			return
 
-		# setup import log
-		if self.data_import.import_log:
-			import_log = frappe.parse_json(self.data_import.import_log)
-		else:
-			import_log = []
+		if skipped:
+			print("Skipping {0} imported records".format(skipped))
+			if total_payload_count > 5:
+				frappe.publish_realtime(
+					"data_import_progress",
+					{
+						"current": skipped,
+						"total": total_payload_count,
+						"skipping": True,
+						"data_import": self.data_import.name,
+					},
+				)
 
-		# remove previous failures from import log
-		import_log = [l for l in import_log if l.get("success") == True]
+		# start import, rows are parsed again as they are imported
+		to_import = (p for p in self.iter_payloads() if not is_imported(p))
 
-		# get successfully imported rows
-		imported_rows = []
-		for log in import_log:
-			log = frappe._dict(log)
-			if log.success:
-				imported_rows += log.row_indexes
-
-		# start import
-		total_payload_count = len(payloads)
-		batch_size = frappe.conf.data_import_batch_size or 1000
-
-		for batch_index, batched_payloads in enumerate(
-			frappe.utils.create_batch(payloads, batch_size)
-		):
-			for i, payload in enumerate(batched_payloads):
-				doc = payload.doc
-				row_indexes = [row[0] for row in payload.rows]
-				current_index = (i + 1) + (batch_index * batch_size)
-
-				if set(row_indexes).intersection(set(imported_rows)):
-					print("Skipping imported rows", row_indexes)
-					if total_payload_count > 5:
-						frappe.publish_realtime(
-							"data_import_progress",
-							{
-								"current": current_index,
-								"total": total_payload_count,
-								"skipping": True,
-								"data_import": self.data_import.name,
-							},
-						)
-					continue
+		if self.get_shard_count(total_payload_count - skipped) > 1:
+			self.enqueue_shards(to_import, import_log, total_payload_count, skipped)
+			return import_log
 
-				try:
-					start = timeit.default_timer()
-					doc = self.process_doc(doc)
-					processing_time = timeit.default_timer() - start
-					eta = self.get_eta(current_index, total_payload_count, processing_time)
-
-					if total_payload_count > 5:
-						frappe.publish_realtime(
-							"data_import_progress",
-							{
-								"current": current_index,
-								"total": total_payload_count,
-								"docname": doc.name,
-								"data_import": self.data_import.name,
-								"success": True,
-								"row_indexes": row_indexes,
-								"eta": eta,
-							},
-						)
-					if self.console:
-						update_progress_bar(
-							"Importing {0} records".format(total_payload_count),
-							current_index,
-							total_payload_count,
-						)
-					import_log.append(
-						frappe._dict(success=True, docname=doc.name, row_indexes=row_indexes)
-					)
-					# commit after every successful import
-					frappe.db.commit()
-
-				except Exception:
-					import_log.append(
-						frappe._dict(
-							success=False,
-							exception=frappe.get_traceback(),
-							messages=frappe.local.message_log,
-							row_indexes=row_indexes,
-						)
-					)
-					frappe.clear_messages()
-					# rollback if exception
-					frappe.db.rollback()
+		try:
+			self.import_payloads(to_import, import_log, total_payload_count, skipped)
+		except Exception:
+			# rows imported so far are committed and logged, the rest are left out of the log
+			self.rollback()
+			frappe.log_error(title=_("Data Import"))
+			return self.finish_import(import_log, total_payload_count, errored=True)
 
+		return self.finish_import(import_log, total_payload_count)
+
+	def finish_import(self, import_log, total_payload_count, errored=False):
 		# set status
 		failures = [l for l in import_log if l.get("success") == False]
-		if len(failures) == total_payload_count:
+		if errored:
+			# rows were left out of the import log
+			status = "Error"
+		elif len(failures) == total_payload_count:
 			status = "Pending"
 		elif len(failures) > 0:
 			status = "Partial Success"
@@ -541,51 +526,415 @@ class Importer:
 
 		return import_log
 
+	def import_payloads(self, payloads, import_log, total_payload_count, offset=0):
+		"""Import payloads in batches of `data_import_batch_size`, appending to `import_log`"""
+		batch_size = cint(frappe.conf.data_import_batch_size) or 1000
+
+		for batch_index, batch in enumerate(frappe.utils.create_batch(payloads, batch_size)):
+			start = timeit.default_timer()
+			current = offset + batch_index * batch_size
+			if self.is_bulk_safe():
+				self.bulk_import_batch(batch, import_log)
+			else:
+				self.import_batch(batch, import_log, current, total_payload_count)
+
+			if self.shared_progress_key:
+				# progress of all shards
+				current = frappe.cache().incrby(self.shared_progress_key, len(batch))
+			else:
+				current += len(batch)
+
+			processing_time = (timeit.default_timer() - start) / len(batch)
+			self.publish_progress(current, total_payload_count, processing_time, force=True)
+
+	def import_batch(self, payloads, import_log, offset, total_payload_count):
+		"""Import a batch of payloads in one transaction. On MariaDB, a failing payload is
+		rolled back to its savepoint, on Postgres (autocommit) each payload is committed."""
+		use_savepoints = frappe.db.db_type == "mariadb"
+		link_values = self.get_link_values(payloads)
+		batch_log = []
+
+		if use_savepoints:
+			# see `abort_batch`
+			self.batch_rolled_back = False
+			frappe.local.rollback_observers.append(self)
+
+		for i, payload in enumerate(payloads):
+			row_indexes = [row[0] for row in payload.rows]
+			created_link_values = len(self.uncommitted_link_values)
+			if use_savepoints:
+				frappe.db.savepoint("data_import")
+
+			try:
+				start = timeit.default_timer()
+				doc = self.process_doc(payload.doc, link_values)
+				batch_log.append(
+					frappe._dict(success=True, docname=doc.name, row_indexes=row_indexes)
+				)
+				if not use_savepoints:
+					self.commit()
+
+			except Exception:
+				batch_log.append(
+					frappe._dict(
+						success=False,
+						exception=frappe.get_traceback(),
+						messages=frappe.local.message_log,
+						row_indexes=row_indexes,
+					)
+				)
+				frappe.clear_messages()
+
+				if not use_savepoints:
+					self.rollback()
+				elif not frappe.db.has_savepoint("data_import"):
+					self.abort_batch(batch_log, import_log, failed=True)
+				elif self.rollback_to_savepoint(batch_log):
+					self.restore_missing_link_values(since=created_link_values)
+				else:
+					# the whole transaction was rolled back, payloads logged as successful are lost
+					self.restore_missing_link_values()
+					use_savepoints = False
+
+			if use_savepoints and not frappe.db.has_savepoint("data_import"):
+				self.abort_batch(batch_log, import_log)
+
+			if not self.shared_progress_key:
+				processing_time = timeit.default_timer() - start
+				self.publish_progress(offset + i + 1, total_payload_count, processing_time)
+
+		if use_savepoints:
+			self.commit()
+
+		import_log.extend(batch_log)
+
+	def rollback_to_savepoint(self, batch_log):
+		"""Roll back the failed payload. If the database has already rolled back the
+		transaction (deadlock, lost connection), mark the rest of the batch as failed."""
+		try:
+			frappe.db.rollback(save_point="data_import")
+			return True
+		except Exception:
+			frappe.db.rollback()
+			self.fail_logged_rows(batch_log)
+			return False
+
+	def abort_batch(self, batch_log, import_log, failed=False):
+		"""Stop the import if a payload committed or rolled back the transaction of the batch
+		(DDL commits implicitly on MariaDB), its savepoints are gone with it"""
+		if self.batch_rolled_back:
+			self.rollback()
+			self.fail_logged_rows(batch_log)
+		elif failed:
+			# rows before the commit stay imported, the rest of the failed payload is dropped
+			self.rollback()
+		else:
+			self.commit()
+
+		import_log.extend(batch_log)
+		frappe.throw(
+			_("Import stopped as row {0} ended the transaction of the batch").format(
+				batch_log[-1].row_indexes[0]
+			)
+		)
+
+	def on_rollback(self):
+		self.batch_rolled_back = True
+
+	def fail_logged_rows(self, batch_log):
+		"""Mark the rows of the batch logged as imported as failed, once they are rolled back"""
+		for log in batch_log:
+			if log.success:
+				log.update(
+					success=False,
+					exception=frappe.get_traceback(),
+					messages=[_("Rolled back as the transaction of the batch failed")],
+				)
+				log.pop("docname", None)
+
+	def is_bulk_safe(self):
+		"""DocTypes listed in the `bulk_safe_doctypes` hook are inserted without running
+		controller methods and hooks"""
+		return (
+			self.import_type == INSERT
+			and not (self.meta.is_submittable and self.data_import.submit_after_import)
+			and self.doctype in frappe.get_hooks("bulk_safe_doctypes")
+		)
+
+	def bulk_import_batch(self, payloads, import_log):
+		"""Insert a batch of payloads of a bulk safe DocType with one multi-row `INSERT` per
+		DocType. Falls back to `import_batch` if the batch can't be inserted in one go."""
+		if not frappe.has_permission(self.doctype, "create"):
+			# permission errors are logged per row by `insert`
+			return self.import_batch(payloads, import_log, 0, 0)
+
+		link_values = self.get_link_values(payloads)
+		docs, batch_log = [], []
+
+		for payload in payloads:
+			row_indexes = [row[0] for row in payload.rows]
+			try:
+				self.create_missing_linked_records(payload.doc)
+				doc = frappe.new_doc(self.doctype)
+				doc.update(payload.doc)
+				doc.set("name", None)
+				doc.set("__islocal", True)
+				doc.flags.link_values = link_values
+				doc._set_defaults()
+				doc.set_user_and_timestamp()
+				doc.set_docstatus()
+				doc._validate_links()
+				doc.set_new_name()
+				doc.set_parent_in_children()
+				doc._validate_mandatory()
+				for d in [doc] + doc.get_all_children():
+					d._validate_selects()
+					d._validate_length()
+					d._sanitize_content()
+				docs.append(doc)
+				batch_log.append(
+					frappe._dict(success=True, docname=doc.name, row_indexes=row_indexes)
+				)
+			except Exception:
+				batch_log.append(
+					frappe._dict(
+						success=False,
+						exception=frappe.get_traceback(),
+						messages=frappe.local.message_log,
+						row_indexes=row_indexes,
+					)
+				)
+				frappe.clear_messages()
+
+		try:
+			db_insert_rows(docs + [d for doc in docs for d in doc.get_all_children()])
+			self.commit()
+		except Exception:
+			self.rollback()
+			frappe.clear_messages()
+			return self.import_batch(payloads, import_log, 0, 0)
+
+		import_log.extend(batch_log)
+
+	def get_link_values(self, payloads):
+		"""Resolve the links of all payloads of a batch with one query per linked DocType"""
+		docs = []
+		for payload in payloads:
+			try:
+				doc = frappe.get_doc(dict(payload.doc, doctype=self.doctype))
+			except Exception:
+				continue
+			docs.append(doc)
+			docs.extend(doc.get_all_children())
+
+		return get_link_values(docs)
+
+	def publish_progress(self, current, total, processing_time, force=False):
+		"""Publish import progress at most every `data_import_progress_interval` seconds"""
+		if self.console and total:
+			update_progress_bar("Importing {0} records".format(total), current, total)
+
+		if total <= 5:
+			return
+
+		now = timeit.default_timer()
+		interval = flt(frappe.conf.data_import_progress_interval) or 1
+		if not force and current < total and now - self.last_progress_at < interval:
+			return
+
+		self.last_progress_at = now
+		frappe.publish_realtime(
+			"data_import_progress",
+			{
+				"current": current,
+				"total": total,
+				"data_import": self.data_import.name,
+				"success": True,
+				"eta": self.get_eta(current, total, processing_time),
+			},
+		)
+
+	def get_shard_count(self, payload_count):
+		"""Imports are split across `data_import_workers` background jobs, one batch at least"""
+		if self.console or frappe.flags.in_test:
+			return 1
+
+		batch_size = cint(frappe.conf.data_import_batch_size) or 1000
+		workers = cint(frappe.conf.data_import_workers) or 1
+		return max(min(workers, -(-payload_count // batch_size)), 1)
+
+	def enqueue_shards(self, payloads, import_log, total_payload_count, offset):
+		"""Import the payloads in parallel background jobs. Batches of payloads are pushed to a
+		Redis list as they are parsed, that the jobs pop from. The list is bounded: when it is
+		full, this job imports the batch itself. The job finishing last sets the status and the
+		import log."""
+		name = self.data_import.name
+		cache = frappe.cache()
+		batch_size = cint(frappe.conf.data_import_batch_size) or 1000
+		workers = self.get_shard_count(total_payload_count - offset)
+
+		cache.delete_value([get_shard_key(name, key) for key in ("batches", "log", "done", "error")])
+		# the jobs and this one
+		cache.set(cache.make_key(get_shard_key(name, "pending")), workers + 1, ex=SHARD_EXPIRY)
+		cache.set(cache.make_key(get_shard_key(name, "progress")), offset, ex=SHARD_EXPIRY)
+		cache.rpush(get_shard_key(name, "log"), json.dumps(import_log))
+		self.shared_progress_key = cache.make_key(get_shard_key(name, "progress"))
+
+		for shard in range(workers):
+			enqueue(
+				"frappe.core.doctype.data_import.importer_new.import_shard",
+				queue="long",
+				timeout=6000,
+				data_import=name,
+				shard=shard,
+				total_payload_count=total_payload_count,
+			)
+
+		own_log = []
+		batch = []
+		try:
+			for batch in frappe.utils.create_batch(payloads, batch_size):
+				# jobs would race to create the same missing link values
+				self.create_all_missing_linked_records(batch)
+				self.commit()
+
+				if cache.llen(get_shard_key(name, "batches")) < workers * 2:
+					cache.rpush(get_shard_key(name, "batches"), pickle.dumps(batch))
+				else:
+					self.import_payloads(batch, own_log, total_payload_count)
+		except Exception:
+			self.log_failed_batch(batch, own_log)
+			# the rows after this batch were neither queued nor logged
+			cache.set(cache.make_key(get_shard_key(name, "error")), 1, ex=SHARD_EXPIRY)
+		finally:
+			cache.set(cache.make_key(get_shard_key(name, "done")), 1, ex=SHARD_EXPIRY)
+
+		self.finish_shard(own_log, total_payload_count)
+
+	def import_shard(self, total_payload_count):
+		"""Import batches queued by `enqueue_shards` until all are imported"""
+		name = self.data_import.name
+		cache = frappe.cache()
+
+		frappe.flags.in_import = True
+		frappe.flags.mute_emails = self.data_import.mute_emails
+		self.missing_link_values = {}
+		self.shared_progress_key = cache.make_key(get_shard_key(name, "progress"))
+
+		import_log = []
+		timeout = cint(frappe.conf.data_import_shard_timeout) or 1800
+		deadline = time.time() + timeout
+		while True:
+			batch = cache.lpop(get_shard_key(name, "batches"))
+			if batch is None:
+				if cache.get(cache.make_key(get_shard_key(name, "done"))):
+					break
+				if time.time() > deadline:
+					self.abort_shard()
+					break
+				time.sleep(0.5)
+				continue
+
+			deadline = time.time() + timeout
+			batch = pickle.loads(batch)
+			try:
+				self.import_payloads(batch, import_log, total_payload_count)
+			except Exception:
+				self.log_failed_batch(batch, import_log)
+
+		self.finish_shard(import_log, total_payload_count)
+
+	def abort_shard(self):
+		"""No batch was queued for `data_import_shard_timeout` seconds, the job queueing them
+		must have died. The rows it did not queue are not in the import log."""
+		name = self.data_import.name
+		cache = frappe.cache()
+		cache.set(cache.make_key(get_shard_key(name, "error")), 1, ex=SHARD_EXPIRY)
+		self.data_import.db_set("status", "Error")
+		frappe.db.commit()
+		frappe.publish_realtime("data_import_refresh", {"data_import": name})
+
+	def log_failed_batch(self, batch, import_log):
+		"""Log the rows of the batch not logged yet as failed, after an unexpected error"""
+		self.rollback()
+		logged_rows = set(i for log in import_log for i in log.row_indexes)
+		row_indexes = [row[0] for p in batch for row in p.rows if row[0] not in logged_rows]
+		if row_indexes:
+			import_log.append(
+				frappe._dict(
+					success=False,
+					exception=frappe.get_traceback(),
+					messages=frappe.local.message_log,
+					row_indexes=row_indexes,
+				)
+			)
+		frappe.clear_messages()
+
+	def finish_shard(self, import_log, total_payload_count):
+		name = self.data_import.name
+		cache = frappe.cache()
+		cache.rpush(get_shard_key(name, "log"), json.dumps(import_log))
+
+		if cache.decr(cache.make_key(get_shard_key(name, "pending"))) > 0:
+			return
+
+		import_log = []
+		for log in cache.lrange(get_shard_key(name, "log"), 0, -1):
+			import_log.extend(frappe._dict(l) for l in json.loads(frappe.safe_decode(log)))
+		errored = cache.get(cache.make_key(get_shard_key(name, "error")))
+		cache.delete_value(
+			[get_shard_key(name, key) for key in ("batches", "log", "done", "pending", "progress", "error")]
+		)
+		self.finish_import(import_log, total_payload_count, errored=bool(errored))
+		frappe.db.commit()
+
 	def get_payloads_for_import(self):
-		payloads = []
-		# make a copy
-		data = list(self.rows)
-		while data:
-			doc, rows, data = self.parse_next_row_for_import(data)
-			payloads.append(frappe._dict(doc=doc, rows=rows))
-		return payloads
-
-	def parse_next_row_for_import(self, data):
+		return list(self.iter_payloads())
+
+	def iter_payloads(self):
 		"""
-		Parses rows that make up a doc. A doc maybe built from a single row or multiple rows.
-		Returns the doc, rows, and data without the rows.
+		Yields payloads (doc and rows) parsed from the rows of the file one by one. A doc maybe
+		built from a single row or multiple rows.
 		"""
 		doctypes = set([col.df.parent for col in self.columns if col.df and col.df.parent])
+		parent_column_indexes = [
+			col.index
+			for col in self.columns
+			if not col.skip_import and col.df and col.df.parent == self.doctype
+		]
 
-		# first row is included by default
-		first_row = data[0]
-		rows = [first_row]
+		rows = []
+		parent_row_values = None
+		for row in self.iter_rows():
+			row_values = [row[i] for i in parent_column_indexes]
 
-		# if there are child doctypes, find the subsequent rows
-		if len(doctypes) > 1:
-			# subsequent rows either dont have any parent value set
+			# if there are child doctypes, subsequent rows either dont have any parent value set
 			# or have the same value as the parent row
 			# we include a row if either of conditions match
-			parent_column_indexes = [
-				col.index
-				for col in self.columns
-				if not col.skip_import and col.df and col.df.parent == self.doctype
-			]
-			parent_row_values = [first_row[i] for i in parent_column_indexes]
-
-			data_without_first_row = data[1:]
-			for row in data_without_first_row:
-				row_values = [row[i] for i in parent_column_indexes]
-				# if the row is blank, it's a child row doc
-				if all([v in INVALID_VALUES for v in row_values]):
-					rows.append(row)
-					continue
-				# if the row has same values as parent row, it's a child row doc
-				if row_values == parent_row_values:
-					rows.append(row)
-					continue
+			if rows and not (
+				len(doctypes) > 1
+				and (
+					all([v in INVALID_VALUES for v in row_values])
+					or row_values == parent_row_values
+				)
+			):
 				# if any of those conditions dont match, it's the next doc
-				break
+				yield frappe._dict(doc=self.parse_rows_for_import(rows), rows=rows)
+				rows = []
+
+			if not rows:
+				parent_row_values = row_values
+			rows.append(row)
+
+		if rows:
+			yield frappe._dict(doc=self.parse_rows_for_import(rows), rows=rows)
+
+	def parse_rows_for_import(self, rows):
+		"""
+		Parses the rows that make up a doc and returns the doc.
+		"""
+		doctypes = set([col.df.parent for col in self.columns if col.df and col.df.parent])
+		first_row = rows[0]
 
 		def get_column_indexes(doctype):
 			return [
@@ -765,19 +1114,20 @@ class Importer:
 			)
 			self.warnings.append({"row": first_row[0], "message": message})
 
-		return doc, rows, data[len(rows) :]
+		return doc
 
-	def process_doc(self, doc):
+	def process_doc(self, doc, link_values=None):
 		if self.import_type == INSERT:
-			return self.insert_record(doc)
+			return self.insert_record(doc, link_values)
 		elif self.import_type == UPDATE:
-			return self.update_record(doc)
+			return self.update_record(doc, link_values)
 
-	def insert_record(self, doc):
+	def insert_record(self, doc, link_values=None):
 		self.create_missing_linked_records(doc)
 
 		new_doc = frappe.new_doc(self.doctype)
 		new_doc.update(doc)
+		new_doc.flags.link_values = link_values
 		# name shouldn't be set when inserting a new record
 		new_doc.set("name", None)
 		new_doc.insert()
@@ -816,12 +1166,32 @@ class Importer:
 				new_doc.set(name_field, link_value)
 				new_doc.insert()
 				d.missing_values.remove(link_value)
+				self.uncommitted_link_values.append((d, link_value))
+
+	def commit(self):
+		frappe.db.commit()
+		self.uncommitted_link_values = []
+
+	def rollback(self):
+		frappe.db.rollback()
+		self.restore_missing_link_values()
+
+	def restore_missing_link_values(self, since=0):
+		"""Mark the link values created after `since` as missing again, once they are rolled back"""
+		for d, link_value in self.uncommitted_link_values[since:]:
+			d.missing_values.append(link_value)
+		del self.uncommitted_link_values[since:]
 
-	def update_record(self, doc):
+	def create_all_missing_linked_records(self, payloads):
+		for payload in payloads:
+			self.create_missing_linked_records(payload.doc)
+
+	def update_record(self, doc, link_values=None):
 		id_fieldname = self.get_id_fieldname(self.doctype)
 		id_value = doc[id_fieldname]
 		existing_doc = frappe.get_doc(self.doctype, id_value)
 		existing_doc.flags.via_data_import = self.data_import.name
+		existing_doc.flags.link_values = link_values
 		existing_doc.update(doc)
 		existing_doc.save()
 		return existing_doc
@@ -839,12 +1209,11 @@ class Importer:
 			row_indexes.extend(f.get("row_indexes", []))
 
 		# de duplicate
-		row_indexes = list(set(row_indexes))
-		row_indexes.sort()
+		row_indexes = set(row_indexes)
 
 		header_row = [col.header_title for col in self.columns[1:]]
 		rows = [header_row]
-		rows += [row[1:] for row in self.rows if row[0] in row_indexes]
+		rows += [row[1:] for row in self.iter_rows() if row[0] in row_indexes]
 
 		build_csv_response(rows, self.doctype)
 
@@ -853,19 +1222,35 @@ class Importer:
 
 	def prepare_missing_link_field_values(self):
 		columns = self.columns
-		rows = self.rows
 		link_column_indexes = [
 			col.index for col in columns if col.df and col.df.fieldtype == "Link"
 		]
 
+		# distinct values of each link column, read in one pass
+		values_by_column = {index: set() for index in link_column_indexes}
+		if link_column_indexes:
+			for row in self.iter_rows():
+				for index in link_column_indexes:
+					if row[index] not in INVALID_VALUES:
+						values_by_column[index].add(row[index])
+
 		self.missing_link_values = {}
 		for index in link_column_indexes:
 			col = columns[index]
-			column_values = [row[index] for row in rows]
-			values = set([v for v in column_values if v not in INVALID_VALUES])
+			values = values_by_column[index]
 			doctype = col.df.options
 
-			missing_values = [value for value in values if not frappe.db.exists(doctype, value)]
+			# MySQL is case insensitive
+			case_sensitive = frappe.db.db_type == "postgres"
+			existing_values = self.get_existing_names(doctype, values)
+			if not case_sensitive:
+				existing_values = set(v.lower() for v in existing_values)
+
+			missing_values = [
+				value
+				for value in values
+				if (cstr(value) if case_sensitive else cstr(value).lower()) not in existing_values
+			]
 			if self.missing_link_values.get(doctype):
 				self.missing_link_values[doctype].missing_values += missing_values
 			else:
@@ -875,6 +1260,22 @@ class Importer:
 					df=col.df,
 				)
 
+	def get_existing_names(self, doctype, values):
+		"""Returns the names of `values` that exist, with one query per 1000 values"""
+		if frappe.get_meta(doctype).issingle:
+			return set(cstr(v) for v in values if frappe.db.exists(doctype, v))
+
+		existing = set()
+		for names in frappe.utils.create_batch(list(values), 1000):
+			existing.update(
+				frappe.db.sql_list(
+					"select name from `tab{0}` where name in %(names)s".format(doctype),
+					{"names": tuple(cstr(n) for n in names)},
+				)
+			)
+
+		return existing
+
 	def get_eta(self, current, total, processing_time):
 		remaining = total - current
 		eta = processing_time * remaining
@@ -1020,6 +1421,17 @@ def guess_date_format(date_string):
 	return full_format
 
 
+def get_shard_key(data_import, key):
+	return "data_import_shard:{0}:{1}".format(data_import, key)
+
+
+def import_shard(data_import, shard, total_payload_count):
+	"""Import batches of a Data Import queued by `Importer.enqueue_shards`, runs in a background job"""
+	data_import = frappe.get_doc("Data Import Beta", data_import)
+	i = Importer(data_import.reference_doctype, data_import=data_import, parse_template=False)
+	i.import_shard(total_payload_count)
+
+
 def import_data(doctype, file_path):
 	i = Importer(doctype, file_path)
 	i.import_data()
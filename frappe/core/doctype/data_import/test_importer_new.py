@@ -71,6 +71,53 @@ class TestImporter(unittest.TestCase):
 		self.assertEqual(frappe.utils.get_datetime_str(doc.start_date),
 			frappe.utils.get_datetime_str('2019-05-20'))
 
+	def test_should_only_rollback_failed_rows(self):
+		role = '_Test Import Role {0}'.format(frappe.utils.random_string(8))
+		content = 'role_name\n{0}\n{0}\n'.format(role)
+		i = self.get_importer('Role', content=content)
+		import_log = i.import_data()
+		self.assertEqual([log.success for log in import_log], [True, False])
+		self.assertTrue(frappe.db.exists('Role', role))
+
+	def test_should_restore_missing_links_on_rollback(self):
+		i = self.get_importer('Web Page', content=content_empty_rows)
+		missing = frappe._dict(missing_values=['_Test Missing Link'], one_mandatory=True)
+		i.missing_link_values = {'Role': missing}
+		i.uncommitted_link_values = [(missing, '_Test Created Link')]
+
+		# created links are only created again if they were rolled back
+		i.rollback()
+		self.assertEqual(missing.missing_values, ['_Test Missing Link', '_Test Created Link'])
+		self.assertEqual(i.uncommitted_link_values, [])
+
+		missing.missing_values.remove('_Test Created Link')
+		i.uncommitted_link_values = [(missing, '_Test Created Link')]
+		i.commit()
+		self.assertEqual(missing.missing_values, ['_Test Missing Link'])
+
+	def test_should_stream_rows(self):
+		i = self.get_importer('Web Page', content=content_empty_rows)
+		self.assertEqual(i.row_count, 2)
+		# payloads are parsed as they are consumed
+		payloads = i.iter_payloads()
+		self.assertEqual(next(payloads).rows[0][0], 2)
+		self.assertEqual(next(payloads).rows[0][0], 3)
+		self.assertRaises(StopIteration, next, payloads)
+
+	def test_should_guess_encoding_of_whole_file(self):
+		import os, tempfile
+		from frappe.utils.csvutils import read_csv_rows
+
+		# not utf-8 after the first 64 KB
+		content = b'title,idx\n' + b'ascii,1\n' * 10000 + b'caf\xe9,2\n'
+		fd, path = tempfile.mkstemp(suffix='.csv')
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				f.write(content)
+			self.assertEqual(list(read_csv_rows(filepath=path))[-1], [u'caf\xe9', '2'])
+		finally:
+			os.remove(path)
+
 	def get_importer(self, doctype, content):
 		data_import = frappe.new_doc('Data Import Beta')
 		data_import.import_type = 'Insert New Records'
@@ -24,6 +24,30 @@ class TestDocShare(unittest.TestCase):
 		frappe.share.add("Event", self.event.name, self.user)
 		self.assertTrue(self.event.name in frappe.share.get_shared("Event", self.user))
 
+	def test_shared_cache(self):
+		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", "test1@example.com"))
+
+		share = frappe.share.add("Event", self.event.name, everyone=1)
+		self.assertTrue(self.event.name in frappe.share.get_shared("Event", "test1@example.com"))
+
+		share.delete()
+		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", "test1@example.com"))
+
+		frappe.share.add("Event", self.event.name, self.user)
+		self.assertTrue(self.event.name in frappe.share.get_shared("Event", self.user))
+		frappe.share.remove("Event", self.event.name, self.user)
+		self.assertTrue(self.event.name not in frappe.share.get_shared("Event", self.user))
+
+	def test_uncommitted_shares_not_cached(self):
+		frappe.share.add("Event", self.event.name, self.user)
+		self.assertTrue(self.event.name in frappe.share.get_shared("Event", self.user))
+		self.assertEqual(frappe.cache().hget("shared_docs", "{0}::Event".format(self.user)), None)
+
+		# cleared again on commit
+		frappe.db.commit()
+		frappe.share.get_shared("Event", self.user)
+		self.assertTrue(frappe.cache().hget("shared_docs", "{0}::Event".format(self.user)))
+
 	def test_doc_permission(self):
 		frappe.set_user(self.user)
 		self.assertFalse(self.event.has_permission())
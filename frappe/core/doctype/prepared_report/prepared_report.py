@@ -41,7 +41,8 @@ def run_background(prepared_report):
 			report = frappe.get_doc("Report", reference_report)
 			report.custom_columns = custom_report_doc.json
 
-		result = generate_report_result(
+		# reports are read only, run them on a replica if configured
+		result = frappe.read_only()(generate_report_result)(
 			report=report,
 			filters=instance.filters,
 			user=instance.owner
@@ -20,6 +20,17 @@ class TestUserPermission(unittest.TestCase):
 		param = get_params(user, 'User', perm_user.name, is_default=1)
 		self.assertRaises(frappe.ValidationError, add_user_permissions, param)
 
+	def test_cache_cleared_for_user_only(self):
+		from frappe.permissions import get_user_permissions
+
+		user = create_user('test_bulk_creation_update@example.com')
+		get_user_permissions('test@example.com')
+		get_user_permissions(user.email)
+
+		add_user_permissions(get_params(user, 'User', user.email))
+		self.assertTrue(frappe.cache().hget('user_permissions', 'test@example.com') is not None)
+		self.assertTrue(user.email in [p.doc for p in get_user_permissions(user.email).get('User', [])])
+
 	def test_apply_to_all(self):
 		''' Create User permission for User having access to all applicable Doctypes'''
 		user = create_user('test_bulk_creation_update@example.com')
@@ -17,12 +17,17 @@ class UserPermission(Document):
 		self.validate_default_permission()
 
 	def on_update(self):
-		frappe.cache().delete_value('user_permissions')
-		frappe.publish_realtime('update_user_permissions')
+		self.clear_cache_for_user()
 
-	def on_trash(self): # pylint: disable=no-self-use
-		frappe.cache().delete_value('user_permissions')
-		frappe.publish_realtime('update_user_permissions')
+		doc_before_save = self.get_doc_before_save()
+		if doc_before_save and doc_before_save.user != self.user:
+			clear_user_permissions_cache(doc_before_save.user)
+
+	def on_trash(self):
+		self.clear_cache_for_user()
+
+	def clear_cache_for_user(self):
+		clear_user_permissions_cache(self.user)
 
 	def validate_user_permission(self):
 		''' checks for duplicate user permission records'''
@@ -55,6 +60,16 @@ class UserPermission(Document):
 			ref_link = frappe.get_desk_link(self.doctype, overlap_exists[0].name)
 			frappe.throw(_("{0} has already assigned default value for {1}.".format(ref_link, self.allow)))
 
+def clear_user_permissions_cache(user):
+	"""Clear the cached user permissions of the user only, and notify their sessions. Cleared
+	again once the transaction is committed, as other requests may cache them before the commit."""
+	clear_cached_user_permissions(user)
+	frappe.db.after_commit(clear_cached_user_permissions, user)
+	frappe.publish_realtime('update_user_permissions', user=user, after_commit=True)
+
+def clear_cached_user_permissions(user):
+	frappe.cache().hdel('user_permissions', user)
+
 @frappe.whitelist()
 def get_user_permissions(user=None):
 	'''Get all users permissions for the user as a dict of doctype'''
@@ -103,7 +118,10 @@ def get_user_permissions(user=None):
 					add_doc_to_perm(perm, doc, False)
 
 		out = frappe._dict(out)
-		frappe.cache().hset("user_permissions", user, out)
+
+		# user permissions changed in this transaction are not visible to others yet
+		if not any(method is clear_cached_user_permissions for method, args in frappe.local.after_commit):
+			frappe.cache().hset("user_permissions", user, out)
 	except frappe.db.SQLError as e:
 		if frappe.db.is_table_missing(e):
 			# called from patch
@@ -181,7 +199,7 @@ def clear_user_permissions(user, for_doctype):
 	total = frappe.db.count('User Permission', filters = dict(user=user, allow=for_doctype))
 	if total:
 		frappe.db.sql('DELETE FROM `tabUser Permission` WHERE `user`=%s AND `allow`=%s', (user, for_doctype))
-		frappe.clear_cache()
+		clear_user_permissions_cache(user)
 	return total
 
 @frappe.whitelist()
@@ -235,6 +253,7 @@ def remove_applicable(d, user, doctype, docname):
 			AND `allow`=%s
 			AND `for_value`=%s
 		""", (user, applicable_for, doctype, docname))
+	clear_user_permissions_cache(user)
 
 def remove_apply_to_all(user, doctype, docname):
 	frappe.db.sql("""DELETE from `tabUser Permission`
@@ -243,6 +262,7 @@ def remove_apply_to_all(user, doctype, docname):
 		AND `allow`=%s
 		AND `for_value`=%s
 	""",(user, doctype, docname))
+	clear_user_permissions_cache(user)
 
 def update_applicable(already_applied, to_apply, user, doctype, docname):
 	for applied in already_applied:
@@ -253,3 +273,4 @@ def update_applicable(already_applied, to_apply, user, doctype, docname):
 				AND `allow`=%s
 				AND `for_value`=%s
 			""",(user, applied, doctype, docname))
+	clear_user_permissions_cache(user)
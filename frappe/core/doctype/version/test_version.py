@@ -5,7 +5,8 @@ from __future__ import unicode_literals
 import frappe
 import unittest, copy
 from frappe.test_runner import make_test_objects
-from frappe.core.doctype.version.version import get_diff
+from frappe.core.doctype.version.version import (get_diff, push_version_log,
+	flush_version_log, get_version_log_stats, confirm_commit)
 
 class TestVersion(unittest.TestCase):
 	def test_get_diff(self):
@@ -30,6 +31,52 @@ class TestVersion(unittest.TestCase):
 		self.assertEqual(get_old_values(diff)[1], '01-01-2014 00:00:00')
 		self.assertEqual(get_new_values(diff)[1], '07-20-2017 00:00:00')
 
+	def test_version_log(self):
+		todo = frappe.get_doc(dict(doctype="ToDo", description="version log")).insert()
+		versions = [make_version_log_entry(todo.name, todo.modified)]
+
+		# delivered twice, inserted once
+		push_version_log(versions, enqueue_flush=False)
+		push_version_log(versions, enqueue_flush=False)
+		frappe.db.commit()
+		self.assertEqual(get_version_log_stats().pending, 2)
+
+		flush_version_log()
+		self.assertEqual(get_version_log_stats().pending, 0)
+		self.assertEqual(frappe.db.count("Version", dict(ref_doctype="ToDo", docname=todo.name)), 1)
+
+	def test_version_log_of_rolled_back_save(self):
+		todo = frappe.get_doc(dict(doctype="ToDo", description="version log")).insert()
+		later = frappe.utils.add_to_date(todo.modified, minutes=1)
+		versions = [make_version_log_entry(todo.name, later),
+			make_version_log_entry(todo.name, later, creation=frappe.utils.add_to_date(None, hours=-1))]
+
+		# the first may be of a transaction that is still committing, the second was rolled back
+		push_version_log(versions, enqueue_flush=False)
+		frappe.db.rollback()
+		flush_version_log()
+		self.assertEqual(get_version_log_stats().pending, 1)
+		self.assertEqual(frappe.db.count("Version", dict(ref_doctype="ToDo", docname=todo.name)), 0)
+
+		# a later save is not taken for the commit of the first
+		frappe.db.set_value("ToDo", todo.name, "modified", frappe.utils.add_to_date(later, minutes=1),
+			update_modified=False)
+		flush_version_log()
+		self.assertEqual(get_version_log_stats().pending, 1)
+		self.assertEqual(frappe.db.count("Version", dict(ref_doctype="ToDo", docname=todo.name)), 0)
+
+		confirm_commit(versions[0]["commit_token"])
+		flush_version_log()
+		self.assertEqual(get_version_log_stats().pending, 0)
+		self.assertEqual(frappe.db.count("Version", dict(ref_doctype="ToDo", docname=todo.name)), 1)
+
+def make_version_log_entry(docname, ref_modified, creation=None):
+	creation = str(creation or frappe.utils.now())
+	return {"name": frappe.generate_hash("Version", 10), "owner": "Administrator",
+		"modified_by": "Administrator", "creation": creation, "modified": creation, "docstatus": 0,
+		"ref_doctype": "ToDo", "docname": docname, "data": "{}", "follow": False,
+		"ref_modified": str(ref_modified)}
+
 def get_fieldnames(change_array):
 	return [d[0] for d in change_array]
 
@@ -5,9 +5,11 @@
 
 from __future__ import unicode_literals
 import frappe, json
+import redis
 
 from frappe.model.document import Document
 from frappe.model import no_value_fields, table_fields
+from frappe.utils import cint, now, time_diff_in_seconds, get_datetime
 
 class Version(Document):
 	def set_diff(self, old, new):
@@ -92,5 +94,202 @@ def get_diff(old, new, for_child=False):
 	else:
 		return None
 
+# Versions are written by a background job, see `add_version`
+version_log_key = "version_log"
+version_log_stats_key = "version_log_stats"
+version_log_batch_size = 500
+
+# seconds after which Versions of transactions that were not confirmed as committed are checked
+# against the document, can be overridden by `version_log_commit_timeout` in site config
+default_commit_timeout = 600
+# transactions confirmed as committed are kept for a day
+commit_token_expiry = 86400
+version_log_fields = ("name", "owner", "modified_by", "creation", "modified", "docstatus",
+	"ref_doctype", "docname", "data")
+
+def add_version(old, new):
+	'''Queue a Version with the diff of the docs if present.
+
+	Versions are pushed to a Redis list with a token of the transaction just before it is committed
+	(and dropped if it is rolled back), the token is confirmed right after the commit.
+	`flush_version_log` inserts the Versions of confirmed transactions in batches and removes them
+	from the list only after they are committed, so a Version is written at least once. Versions
+	are named when they are queued, so the ones inserted twice are ignored. Versions of
+	transactions whose commit failed are dropped. Hooks of Version are not run.'''
+	diff = get_diff(old, new)
+	if not diff:
+		return False
+
+	timestamp = now()
+	version = {
+		"name": frappe.generate_hash("Version", 10),
+		"owner": frappe.session.user,
+		"modified_by": frappe.session.user,
+		"creation": timestamp,
+		"modified": timestamp,
+		"docstatus": 0,
+		"ref_doctype": new.doctype,
+		"docname": new.name,
+		"data": frappe.as_json(diff),
+		"follow": not frappe.flags.in_migrate,
+		"ref_modified": str(new.modified)
+	}
+
+	frappe.local.version_log.append(version)
+
+	return True
+
+def push_version_log(versions, enqueue_flush=True):
+	'''Push Versions of the transaction to the version log, called just before it is committed'''
+	cache = frappe.cache()
+	commit_token = frappe.generate_hash(length=16)
+	for v in versions:
+		v["commit_token"] = commit_token
+
+	try:
+		pipe = cache.pipeline()
+		pipe.rpush(cache.make_key(version_log_key), *[json.dumps(v) for v in versions])
+		pipe.hincrby(cache.make_key(version_log_stats_key), "queued", len(versions))
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		# committed with the transaction
+		insert_versions(versions)
+		return
+
+	frappe.db.after_commit(confirm_commit, commit_token)
+
+	# a job is queued only if there isn't one pending
+	if enqueue_flush and cache.set(cache.make_key("version_log_job"), 1, nx=True, ex=300):
+		frappe.enqueue("frappe.core.doctype.version.version.flush_version_log", queue="short",
+			enqueue_after_commit=True)
+
+def confirm_commit(commit_token):
+	cache = frappe.cache()
+	try:
+		cache.set(cache.make_key("version_log_commit:" + commit_token), 1, ex=commit_token_expiry)
+	except redis.exceptions.ConnectionError:
+		# checked against the document after `version_log_commit_timeout`
+		pass
+
+def flush_version_log():
+	'''Insert the queued Versions in batches, called by the job queued on commit and by the scheduler'''
+	cache = frappe.cache()
+	name = cache.make_key(version_log_key)
+	cache.delete_value("version_log_job")
+
+	lock = cache.lock(cache.make_key("version_log_lock"), timeout=600)
+	if not lock.acquire(blocking=False):
+		return
+
+	try:
+		while True:
+			versions = cache.lrange(version_log_key, 0, version_log_batch_size - 1)
+			if not versions:
+				break
+
+			saved, pending, dropped = split_saved_versions([json.loads(frappe.safe_decode(v))
+				for v in versions])
+			if saved:
+				insert_versions(saved)
+				frappe.db.commit()
+
+			# Versions of transactions that may still be running are checked again later
+			pipe = cache.pipeline()
+			pipe.ltrim(name, len(versions), -1)
+			if pending:
+				pipe.rpush(name, *[json.dumps(v) for v in pending])
+			pipe.hincrby(cache.make_key(version_log_stats_key), "inserted", len(saved))
+			pipe.hincrby(cache.make_key(version_log_stats_key), "dropped", dropped)
+			pipe.hincrby(cache.make_key(version_log_stats_key), "batches", 1)
+			pipe.execute()
+
+			if not saved and not dropped:
+				break
+	finally:
+		lock.release()
+
+def split_saved_versions(versions):
+	'''Returns the Versions of committed transactions, the Versions of transactions that may still
+	be committing and the number of Versions of transactions that were not committed'''
+	committed = get_committed_tokens(set(v.get("commit_token") for v in versions) - {None})
+	timeout = cint(frappe.conf.version_log_commit_timeout) or default_commit_timeout
+
+	saved, pending, unconfirmed = [], [], []
+	for v in versions:
+		if v.get("commit_token") in committed:
+			saved.append(v)
+		elif v.get("commit_token") and time_diff_in_seconds(now(), v["creation"]) < timeout:
+			pending.append(v)
+		else:
+			unconfirmed.append(v)
+
+	# the process may have died between the commit and its confirmation, the save was committed
+	# if the document still has the timestamp of the save
+	modified = get_modified(unconfirmed)
+	dropped = 0
+	for v in unconfirmed:
+		doc_modified = modified.get((v["ref_doctype"], v["docname"]))
+		# queued before `ref_modified` was logged
+		if not v.get("ref_modified") or (doc_modified
+			and get_datetime(doc_modified) == get_datetime(v["ref_modified"])):
+			saved.append(v)
+		else:
+			dropped += 1
+
+	return saved, pending, dropped
+
+def get_committed_tokens(commit_tokens):
+	commit_tokens = list(commit_tokens)
+	if not commit_tokens:
+		return set()
+
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	for commit_token in commit_tokens:
+		pipe.exists(cache.make_key("version_log_commit:" + commit_token))
+
+	return set(t for t, committed in zip(commit_tokens, pipe.execute()) if committed)
+
+def get_modified(versions):
+	modified = {}
+	for doctype in set(v["ref_doctype"] for v in versions):
+		if frappe.get_meta(doctype).issingle:
+			modified[(doctype, doctype)] = frappe.db.get_single_value(doctype, "modified")
+			continue
+
+		names = list(set(v["docname"] for v in versions if v["ref_doctype"] == doctype))
+		for d in frappe.get_all(doctype, filters={"name": ("in", names)}, fields=["name", "modified"]):
+			modified[(doctype, d.name)] = d.modified
+
+	return modified
+
+def insert_versions(versions):
+	from frappe.desk.form.document_follow import follow_document
+
+	frappe.db.bulk_insert("Version", version_log_fields,
+		[[v[f] for f in version_log_fields] for v in versions],
+		on_duplicate="ignore", conflict_fields=["name"])
+
+	for doctype, docname, user in sorted(set((v["ref_doctype"], v["docname"], v["owner"])
+		for v in versions if v["follow"])):
+		follow_document(doctype, docname, user)
+
+def get_version_log_stats():
+	'''Returns the backlog of the version log: pending Versions, age of the oldest one in
+	seconds and the Versions queued and inserted so far'''
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	pipe.llen(cache.make_key(version_log_key))
+	pipe.lindex(cache.make_key(version_log_key), 0)
+	pipe.hgetall(cache.make_key(version_log_stats_key))
+	pending, oldest, counters = pipe.execute()
+
+	stats = frappe._dict({frappe.safe_decode(k): cint(v) for k, v in (counters or {}).items()})
+	stats.pending = pending
+	stats.oldest = (time_diff_in_seconds(now(), json.loads(frappe.safe_decode(oldest))["creation"])
+		if oldest else 0)
+
+	return stats
+
 def on_doctype_update():
 	frappe.db.add_index("Version", ["ref_doctype", "docname"])
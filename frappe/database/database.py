@@ -18,7 +18,8 @@ from time import time
 from frappe.utils import now, getdate, cast_fieldtype
 from frappe.utils.background_jobs import execute_job, get_queue
 from frappe.model.utils.link_count import flush_local_link_count
-from frappe.utils import cint
+from frappe.database import pool
+from frappe.utils import cint, cstr, flt
 
 # imports - compatibility imports
 from six import (
@@ -43,6 +44,9 @@ class Database(object):
 	DEFAULT_COLUMNS = ['name', 'creation', 'modified', 'modified_by', 'owner', 'docstatus', 'parent',
 		'parentfield', 'parenttype', 'idx']
 
+	# rows fetched per round trip by `iter_sql`
+	ITER_FETCH_SIZE = 1000
+
 	class InvalidColumnName(frappe.ValidationError): pass
 
 
@@ -66,14 +70,28 @@ class Database(object):
 		self.password = password or frappe.conf.db_password
 		self.value_cache = {}
 
+		# tables written in the current transaction, see `log_touched_tables`
+		self.touched_tables = set()
+		# query cache table versions at the start of the current transaction
+		self.table_versions = None
+		# document cache keys of documents written in the current transaction
+		self.invalidated_documents = set()
+		# savepoints of the current transaction, see `savepoint`
+		self.savepoints = []
+
 	def setup_type_map(self):
 		pass
 
 	def connect(self):
 		"""Connects to a database as set in `site_config.json`."""
 		self.cur_db_name = self.user
-		self._conn = self.get_connection()
+		if pool.is_enabled():
+			self._conn = pool.get_connection(self)
+		else:
+			self._conn = self.get_connection()
 		self._cursor = self._conn.cursor()
+		self.table_versions = None
+		self.savepoints = []
 		frappe.local.rollback_observers = []
 
 	def use(self, db_name):
@@ -83,11 +101,19 @@ class Database(object):
 	def get_connection(self):
 		pass
 
+	def is_connection_alive(self, conn):
+		"""Returns True if a pooled connection can still be used"""
+		return True
+
+	def reset_connection(self, conn):
+		"""Reset the session state of a connection before it is returned to the pool"""
+		conn.rollback()
+
 	def get_database_size(self):
 		pass
 
 	def sql(self, query, values=(), as_dict = 0, as_list = 0, formatted = 0,
-		debug=0, ignore_ddl=0, as_utf8=0, auto_commit=0, update=None, explain=False):
+		debug=0, ignore_ddl=0, as_utf8=0, auto_commit=0, update=None, explain=False, as_iterator=False):
 		"""Execute a SQL query and fetch all rows.
 
 		:param query: SQL query.
@@ -100,6 +126,7 @@ class Database(object):
 		:param as_utf8: Encode values as UTF 8.
 		:param auto_commit: Commit after executing the query.
 		:param update: Update this dict to all rows (if returned `as_dict`).
+		:param as_iterator: Stream rows with a server-side cursor, see `iter_sql`.
 
 		Examples:
 
@@ -118,12 +145,22 @@ class Database(object):
 			# replaces ifnull in query with coalesce
 			query = re.sub(r'ifnull\(', 'coalesce(', query, flags=re.IGNORECASE)
 
+		if query.lstrip()[:6].lower() in ('update', 'insert', 'delete'):
+			# keep reads of this request on the primary, see `frappe.database.replica`
+			frappe.flags.has_db_writes = True
+
+		if as_iterator:
+			return self.iter_sql(query, values, as_dict=as_dict, debug=debug)
+
 		if not self._conn:
 			self.connect()
 
 		# in transaction validations
 		self.check_transaction_status(query)
 
+		if self.table_versions is None and frappe.conf.query_cache:
+			self.read_table_versions()
+
 		# autocommit
 		if auto_commit: self.commit()
 
@@ -155,7 +192,7 @@ class Database(object):
 					frappe.log(">>>>")
 				self._cursor.execute(query, values)
 
-				if frappe.flags.in_migrate:
+				if frappe.flags.in_migrate or frappe.conf.query_cache:
 					self.log_touched_tables(query, values)
 
 			else:
@@ -170,7 +207,7 @@ class Database(object):
 
 				self._cursor.execute(query)
 
-				if frappe.flags.in_migrate:
+				if frappe.flags.in_migrate or frappe.conf.query_cache:
 					self.log_touched_tables(query)
 
 			if debug:
@@ -211,6 +248,73 @@ class Database(object):
 		else:
 			return self._cursor.fetchall()
 
+	def iter_sql(self, query, values=(), as_dict=False, chunk_size=None, debug=False):
+		"""Execute a SQL query with an unbuffered server-side cursor and yield the rows as they
+		are read, so that the result never has to fit in memory.
+
+		:param query: SQL query.
+		:param values: List / dict of values to be escaped and substituted in the query.
+		:param as_dict: Yield rows as dictionaries.
+		:param chunk_size: Yield lists of up to `chunk_size` rows instead of single rows.
+		:param debug: Print query in debug log.
+
+		On MariaDB the rows are read over a separate connection (an unbuffered result blocks
+		its connection until it is consumed), so uncommitted writes of the current
+		transaction are not visible to it.
+
+		Example:
+
+			for row in frappe.db.iter_sql("select name, debit from `tabGL Entry`", as_dict=True):
+				total += row.debit
+		"""
+		if re.search(r'ifnull\(', query, flags=re.IGNORECASE):
+			query = re.sub(r'ifnull\(', 'coalesce(', query, flags=re.IGNORECASE)
+
+		if not self._conn:
+			self.connect()
+
+		if debug:
+			frappe.errprint(query)
+
+		cursor = self.get_server_side_cursor()
+		try:
+			if values!=():
+				if not isinstance(values, (dict, tuple, list)):
+					values = (values,)
+				cursor.execute(query, values)
+			else:
+				cursor.execute(query)
+
+			keys = None
+			while True:
+				rows = cursor.fetchmany(chunk_size or self.ITER_FETCH_SIZE)
+				if not rows:
+					break
+
+				if as_dict:
+					if keys is None:
+						keys = [column[0] for column in cursor.description]
+					rows = [frappe._dict(zip(keys, row)) for row in rows]
+
+				if chunk_size:
+					yield list(rows)
+				else:
+					for row in rows:
+						yield row
+		finally:
+			self.close_server_side_cursor(cursor)
+
+	def get_replication_lag(self):
+		"""Returns the seconds this replica is behind its primary, None if it is not a replica"""
+		return None
+
+	def get_server_side_cursor(self):
+		"""Returns an unbuffered cursor, implemented in specific class"""
+		pass
+
+	def close_server_side_cursor(self, cursor):
+		cursor.close()
+
 	def explain_query(self, query, values=None):
 		"""Print `EXPLAIN` in error log."""
 		try:
@@ -251,6 +355,11 @@ class Database(object):
 
 		if query and query.strip().lower() in ('commit', 'rollback'):
 			self.transaction_writes = 0
+			self.savepoints = []
+
+		if query and query.strip().split()[0].lower() in ['start', 'alter', 'drop', 'create', "begin", "truncate"]:
+			# implicit commit, the savepoints are gone
+			self.savepoints = []
 
 		if query[:6].lower() in ('update', 'insert', 'delete'):
 			self.transaction_writes += 1
@@ -531,6 +640,10 @@ class Database(object):
 	def get_list(*args, **kwargs):
 		return frappe.get_list(*args, **kwargs)
 
+	@staticmethod
+	def iter_all(*args, **kwargs):
+		return frappe.iter_all(*args, **kwargs)
+
 	def get_single_value(self, doctype, fieldname, cache=False):
 		"""Get property of Single DocType. Cache locally by default
 
@@ -667,7 +780,7 @@ class Database(object):
 		if dt in self.value_cache:
 			del self.value_cache[dt]
 
-		frappe.clear_document_cache(dt, dn)
+		frappe.clear_document_cache(dt, dn or dt)
 
 	@staticmethod
 	def set(doc, field, val):
@@ -734,13 +847,31 @@ class Database(object):
 
 	def commit(self):
 		"""Commit current transaction. Calls SQL `COMMIT`."""
+		# pushed before the commit so that they are not lost if the process dies after it
+		self.flush_version_log()
 		self.sql("commit")
+		self.table_versions = None
+		self.savepoints = []
 
 		frappe.local.rollback_observers = []
+		self.flush_touched_tables()
+		self.flush_invalidated_documents()
 		self.flush_realtime_log()
+		self.run_after_commit()
 		enqueue_jobs_after_commit()
 		flush_local_link_count()
 
+	def after_commit(self, method, *args):
+		"""Call `method` with `args` once the current transaction is committed, not if it is
+		rolled back. Used to update indexes kept outside the database."""
+		frappe.local.after_commit.append((method, args))
+
+	@staticmethod
+	def run_after_commit():
+		calls, frappe.local.after_commit = frappe.local.after_commit, []
+		for method, args in calls:
+			method(*args)
+
 	@staticmethod
 	def flush_realtime_log():
 		for args in frappe.local.realtime_log:
@@ -748,15 +879,76 @@ class Database(object):
 
 		frappe.local.realtime_log = []
 
-	def rollback(self):
-		"""`ROLLBACK` current transaction."""
+	@staticmethod
+	def flush_version_log():
+		if frappe.local.version_log:
+			from frappe.core.doctype.version.version import push_version_log
+			versions, frappe.local.version_log = frappe.local.version_log, []
+			push_version_log(versions)
+
+	def savepoint(self, save_point):
+		"""Create a savepoint in the current transaction, see `rollback`"""
+		self.sql("savepoint {0}".format(save_point))
+		self.savepoints = [s for s in self.savepoints if s[0] != save_point]
+		self.savepoints.append((save_point, [len(q) for q in self.get_transaction_queues()]))
+
+	def release_savepoint(self, save_point):
+		self.sql("release savepoint {0}".format(save_point))
+		if self.has_savepoint(save_point):
+			del self.savepoints[self.get_savepoint_index(save_point):]
+
+	def has_savepoint(self, save_point):
+		"""Savepoints are lost when the transaction is committed or rolled back, also implicitly
+		by DDL statements on MariaDB"""
+		return any(s[0] == save_point for s in self.savepoints)
+
+	def get_savepoint_index(self, save_point):
+		return [s[0] for s in self.savepoints].index(save_point)
+
+	@staticmethod
+	def get_transaction_queues():
+		"""Versions, calls, messages, observers and jobs queued for the end of the transaction"""
+		if frappe.flags.enqueue_after_commit is None:
+			frappe.flags.enqueue_after_commit = []
+
+		return (frappe.local.version_log, frappe.local.after_commit, frappe.local.realtime_log,
+			frappe.local.rollback_observers, frappe.flags.enqueue_after_commit)
+
+	def rollback(self, save_point=None):
+		"""`ROLLBACK` current transaction. Only rolls back to the savepoint if given, dropping
+		what was queued for the end of the transaction after it."""
+		if save_point:
+			self.sql("rollback to savepoint {0}".format(save_point))
+			if self.has_savepoint(save_point):
+				self.rollback_transaction_queues(save_point)
+			return
+
 		self.sql("rollback")
+		self.table_versions = None
+		self.savepoints = []
 		self.begin()
+		self.flush_touched_tables()
+		self.flush_invalidated_documents(rollback=True)
+		frappe.local.version_log = []
+		frappe.local.after_commit = []
 		for obj in frappe.local.rollback_observers:
 			if hasattr(obj, "on_rollback"):
 				obj.on_rollback()
 		frappe.local.rollback_observers = []
 
+	def rollback_transaction_queues(self, save_point):
+		index = self.get_savepoint_index(save_point)
+		lengths = self.savepoints[index][1]
+		del self.savepoints[index + 1:]
+
+		queues = self.get_transaction_queues()
+		for obj in queues[3][lengths[3]:]:
+			if hasattr(obj, "on_rollback"):
+				obj.on_rollback()
+
+		for queue, length in zip(queues, lengths):
+			del queue[length:]
+
 	def field_exists(self, dt, fn):
 		"""Return true of field exists."""
 		return self.exists('DocField', {
@@ -898,7 +1090,10 @@ class Database(object):
 		"""Close database connection."""
 		if self._conn:
 			# self._cursor.close()
-			self._conn.close()
+			if pool.is_enabled():
+				pool.release_connection(self, self._conn)
+			else:
+				self._conn.close()
 			self._cursor = None
 			self._conn = None
 
@@ -942,9 +1137,10 @@ class Database(object):
 			frappe.throw(_('No conditions provided'))
 
 	def log_touched_tables(self, query, values=None):
-		if values:
-			query = frappe.safe_decode(self._cursor.mogrify(query, values))
 		if query.strip().lower().split()[0] in ('insert', 'delete', 'update', 'alter'):
+			if values:
+				query = frappe.safe_decode(self._cursor.mogrify(query, values))
+
 			# single_word_regex is designed to match following patterns
 			# `tabXxx`, tabXxx and "tabXxx"
 
@@ -965,31 +1161,110 @@ class Database(object):
 			for regex in (single_word_regex, multi_word_regex):
 				tables += [groups[1] for groups in re.findall(regex, query)]
 
-			if frappe.flags.touched_tables is None:
-				frappe.flags.touched_tables = set()
-			frappe.flags.touched_tables.update(tables)
+			if frappe.flags.in_migrate:
+				if frappe.flags.touched_tables is None:
+					frappe.flags.touched_tables = set()
+				frappe.flags.touched_tables.update(tables)
+
+			self.touched_tables.update(tables)
+
+	def read_table_versions(self):
+		"""Read the query cache table versions before the first query of the transaction.
+		Under repeatable read, results are only cached if the versions have not changed since."""
+		from frappe.model.utils.query_cache import get_table_versions
+		self.table_versions = get_table_versions()
 
-	def bulk_insert(self, doctype, fields, values, ignore_duplicates=False):
+	def flush_touched_tables(self):
+		"""Invalidate query cache results of the tables written in the transaction.
+
+		Also called on rollback as writes may already be visible (Postgres runs in autocommit)."""
+		if self.touched_tables and frappe.conf.query_cache:
+			from frappe.model.utils.query_cache import bump_table_versions
+			bump_table_versions(self.touched_tables)
+		self.touched_tables = set()
+
+	def flush_invalidated_documents(self, rollback=False):
+		"""Remove the documents written in the transaction from the document cache again, in
+		case another request cached them before the transaction ended"""
+		if not self.invalidated_documents:
+			return
+
+		from frappe.model.utils.document_cache import delete
+		delete(list(self.invalidated_documents))
+		if rollback:
+			for key in self.invalidated_documents:
+				frappe.local.document_cache.pop(key, None)
+
+		self.invalidated_documents = set()
+
+	def bulk_insert(self, doctype, fields, values, ignore_duplicates=False, chunk_size=10000,
+		on_duplicate=None, update_fields=None, conflict_fields=None, coerce=False):
 		"""
-			Insert multiple records at a time
+			Insert multiple records at a time, returns the number of affected rows
 
-			:param doctype: Doctype name
+			:param doctype: Doctype name, or a table name starting with `__` (e.g. `__global_search`)
 			:param fields: list of fields
 			:params values: list of list of values
+			:param ignore_duplicates: skip rows that violate a unique key, same as `on_duplicate="ignore"`
+			:param chunk_size: max number of rows per `INSERT` statement
+			:param on_duplicate: "ignore", "update" (upsert) or "replace" rows that violate a unique key
+			:param update_fields: fields to update on "update", defaults to all fields not in `conflict_fields`
+			:param conflict_fields: unique key checked for conflicts (Postgres), defaults to `["name"]`
+			:param coerce: cast values according to the field types in the DocType's meta
+
+			Statements are also split so that each stays under `max_allowed_packet`.
+			Affected rows are counted as reported by the database, MariaDB counts an updated row twice.
 		"""
-		insert_list = []
-		fields = ", ".join(["`"+field+"`" for field in fields])
-
-		for idx, value in enumerate(values):
-			insert_list.append(tuple(value))
-			if idx and (idx%10000 == 0 or idx < len(values)-1):
-				self.sql("""INSERT {ignore_duplicates} INTO `tab{doctype}` ({fields}) VALUES {values}""".format(
-						ignore_duplicates="IGNORE" if ignore_duplicates else "",
-						doctype=doctype,
-						fields=fields,
-						values=", ".join(['%s'] * len(insert_list))
-					), tuple(insert_list))
-				insert_list = []
+		if ignore_duplicates and not on_duplicate:
+			on_duplicate = "ignore"
+
+		if on_duplicate not in (None, "ignore", "update", "replace"):
+			frappe.throw(_("Invalid value for on_duplicate: {0}").format(on_duplicate))
+
+		table = doctype if doctype.startswith("__") else "tab" + doctype
+		conflict_fields = conflict_fields or ["name"]
+		if on_duplicate == "update" and not update_fields:
+			update_fields = [field for field in fields if field not in conflict_fields]
+			if not update_fields:
+				on_duplicate = "ignore"
+
+		values = [tuple(value) for value in values]
+		if coerce:
+			values = self.coerce_bulk_values(doctype, fields, values)
+
+		max_size = self.get_max_packet_size()
+		affected_rows = 0
+		for insert_list in get_bulk_chunks(values, chunk_size, max_size):
+			self.sql(self.get_bulk_insert_query(table, fields, len(insert_list), on_duplicate,
+				update_fields, conflict_fields), tuple(insert_list))
+			affected_rows += max(self._cursor.rowcount, 0)
+
+		return affected_rows
+
+	def get_bulk_insert_query(self, table, fields, row_count, on_duplicate=None,
+		update_fields=None, conflict_fields=None):
+		"""Returns a multi row `INSERT` statement with a `%s` placeholder per row"""
+		query = "{verb} INTO `{table}` ({fields}) VALUES {values}".format(
+			verb={"ignore": "INSERT IGNORE", "replace": "REPLACE"}.get(on_duplicate, "INSERT"),
+			table=table,
+			fields=", ".join("`{0}`".format(field) for field in fields),
+			values=", ".join(["%s"] * row_count))
+
+		if on_duplicate == "update":
+			query += " ON DUPLICATE KEY UPDATE " + ", ".join("`{0}`=VALUES(`{0}`)".format(field)
+				for field in update_fields)
+
+		return query
+
+	def get_max_packet_size(self):
+		"""Returns the max size of a statement in bytes (`max_allowed_packet` in site config overrides)"""
+		return cint(frappe.conf.max_allowed_packet) or 16 * 1024 * 1024
+
+	@staticmethod
+	def coerce_bulk_values(doctype, fields, values):
+		meta = frappe.get_meta(doctype)
+		docfields = [meta.get_field(field) for field in fields]
+		return [tuple(cast_for_db(df, value) for df, value in zip(docfields, row)) for row in values]
 
 def enqueue_jobs_after_commit():
 	if frappe.flags.enqueue_after_commit and len(frappe.flags.enqueue_after_commit) > 0:
@@ -1000,6 +1275,43 @@ def enqueue_jobs_after_commit():
 		frappe.flags.enqueue_after_commit = []
 
 # Helpers
+def get_bulk_chunks(values, chunk_size, max_size):
+	"""Yield lists of rows with at most `chunk_size` rows and an estimated size under `max_size`"""
+	# leave room for the statement and the escaping of values
+	max_size = max_size * 0.8
+	chunk, chunk_bytes = [], 0
+	for row in values:
+		row_bytes = sum(len(frappe.safe_encode(value)) if isinstance(value, string_types) else 20
+			for value in row) + 4 * len(row)
+
+		if chunk and (len(chunk) >= chunk_size or chunk_bytes + row_bytes > max_size):
+			yield chunk
+			chunk, chunk_bytes = [], 0
+
+		chunk.append(row)
+		chunk_bytes += row_bytes
+
+	if chunk:
+		yield chunk
+
+def cast_for_db(df, value):
+	"""Coerce a value according to its DocField, like `BaseDocument.get_valid_dict`"""
+	if not df:
+		return value
+
+	if df.fieldtype == 'Check':
+		return 1 if cint(value) else 0
+	elif df.fieldtype == 'Int' and not isinstance(value, integer_types):
+		return cint(value)
+	elif df.fieldtype in ('Currency', 'Float', 'Percent') and not isinstance(value, float):
+		return flt(value)
+	elif df.fieldtype in ('Datetime', 'Date', 'Time') and value == '':
+		return None
+	elif df.get('unique') and cstr(value).strip() == '':
+		return None
+
+	return value
+
 def _cast_result(doctype, result):
 	batch = [ ]
 
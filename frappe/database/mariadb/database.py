@@ -8,7 +8,7 @@ from pymysql.times import TimeDelta
 from pymysql.constants 	import ER, FIELD_TYPE
 from pymysql.converters import conversions
 
-from frappe.utils import get_datetime, cstr
+from frappe.utils import get_datetime, cstr, cint
 from markdown2 import UnicodeWithAttrs
 from frappe.database.database import Database
 from six import PY2, binary_type, text_type, string_types
@@ -97,6 +97,37 @@ class MariaDBDatabase(Database):
 
 		return conn
 
+	def is_connection_alive(self, conn):
+		try:
+			conn.ping(reconnect=False)
+			return True
+		except Exception:
+			return False
+
+	def reset_connection(self, conn):
+		conn.rollback()
+		conn.autocommit(False)
+		with conn.cursor() as cursor:
+			cursor.execute('set time_zone = default')
+		if self.user != 'root':
+			conn.select_db(self.user)
+
+	def get_replication_lag(self):
+		status = self.sql('show slave status', as_dict=True)
+		if not status:
+			return None
+
+		lag = status[0].get('Seconds_Behind_Master')
+		# NULL if replication is stopped
+		return float('inf') if lag is None else cint(lag)
+
+	def get_server_side_cursor(self):
+		return self.get_connection().cursor(pymysql.cursors.SSCursor)
+
+	def close_server_side_cursor(self, cursor):
+		# closing the connection discards the unread rows, closing the cursor would read them all
+		cursor.connection.close()
+
 	def get_database_size(self):
 		''''Returns database size in MB'''
 		db_size = self.sql('''
@@ -231,6 +262,12 @@ class MariaDBDatabase(Database):
 	def get_on_duplicate_update(key=None):
 		return 'ON DUPLICATE key UPDATE '
 
+	def get_max_packet_size(self):
+		if not getattr(self, '_max_packet_size', None):
+			self._max_packet_size = cint(frappe.conf.max_allowed_packet) \
+				or cint(self.sql('select @@max_allowed_packet')[0][0])
+		return self._max_packet_size
+
 	def get_table_columns_description(self, table_name):
 		"""Returns list of column and its description"""
 		return self.sql('''select
@@ -0,0 +1,120 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Per process pool of database connections, keyed by site.
+
+`frappe.connect` / `frappe.destroy` open and close a connection on every request. With
+`db_connection_pool` set in site config, closed connections are reset and kept for the
+next request of the same site instead. Other settings:
+
+- `db_pool_size`: idle connections kept per site (default 8)
+- `db_pool_max_idle`: seconds after which an idle connection is closed (default 300)
+- `db_pool_max_lifetime`: seconds after which a connection is not reused (default 3600)"""
+
+from __future__ import unicode_literals
+
+import threading
+import frappe
+from time import time
+from frappe.utils import cint
+
+default_pool_size = 8
+default_max_idle = 300
+default_max_lifetime = 3600
+
+class ConnectionPool(object):
+	def __init__(self):
+		self.lock = threading.Lock()
+		# [(connection, created_at, released_at)], the most recently used at the end
+		self.idle = []
+		# creation time of connections handed out
+		self.created_at = {}
+		self.stats = frappe._dict(created=0, reused=0, discarded=0)
+
+	def acquire(self, db):
+		"""Returns an idle connection that is still alive, or a new one from `db`"""
+		now = time()
+		while True:
+			with self.lock:
+				if not self.idle:
+					break
+				conn, created_at, released_at = self.idle.pop()
+
+			if (released_at + get_max_idle() < now or created_at + get_max_lifetime() < now
+				or not db.is_connection_alive(conn)):
+				self.discard(conn)
+				continue
+
+			with self.lock:
+				self.stats.reused += 1
+				self.created_at[id(conn)] = created_at
+			return conn
+
+		conn = db.get_connection()
+		with self.lock:
+			self.stats.created += 1
+			self.created_at[id(conn)] = now
+		return conn
+
+	def release(self, db, conn):
+		"""Reset the session of the connection and keep it for reuse"""
+		with self.lock:
+			created_at = self.created_at.pop(id(conn), None)
+
+		if created_at is None or created_at + get_max_lifetime() < time():
+			return self.discard(conn)
+
+		try:
+			db.reset_connection(conn)
+		except Exception:
+			return self.discard(conn)
+
+		with self.lock:
+			if len(self.idle) < (cint(frappe.conf.db_pool_size) or default_pool_size):
+				self.idle.append((conn, created_at, time()))
+				return
+
+		self.discard(conn)
+
+	def discard(self, conn):
+		with self.lock:
+			self.stats.discarded += 1
+
+		try:
+			conn.close()
+		except Exception:
+			pass
+
+	def get_stats(self):
+		with self.lock:
+			return dict(self.stats, idle=len(self.idle), in_use=len(self.created_at))
+
+pools = {}
+_lock = threading.Lock()
+
+def is_enabled():
+	return bool(frappe.conf.db_connection_pool)
+
+def get_max_idle():
+	return cint(frappe.conf.db_pool_max_idle) or default_max_idle
+
+def get_max_lifetime():
+	return cint(frappe.conf.db_pool_max_lifetime) or default_max_lifetime
+
+def get_pool(db):
+	key = (frappe.local.site, db.host, db.port, db.user)
+	with _lock:
+		if key not in pools:
+			pools[key] = ConnectionPool()
+		return pools[key]
+
+def get_connection(db):
+	return get_pool(db).acquire(db)
+
+def release_connection(db, conn):
+	get_pool(db).release(db, conn)
+
+def get_stats():
+	"""Returns the stats of the pools of the current site in this process"""
+	return {"{0}@{1}".format(key[3], key[1]): pool.get_stats()
+		for key, pool in pools.items() if key[0] == frappe.local.site}
@@ -72,6 +72,22 @@ class PostgresDatabase(Database):
 
 		return conn
 
+	def is_connection_alive(self, conn):
+		if conn.closed:
+			return False
+		try:
+			with conn.cursor() as cursor:
+				cursor.execute('select 1')
+			return True
+		except Exception:
+			return False
+
+	def reset_connection(self, conn):
+		conn.rollback()
+		conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+		with conn.cursor() as cursor:
+			cursor.execute('reset all')
+
 	def escape(self, s, percent=True):
 		"""Excape quotes and percent in given string."""
 		if isinstance(s, bytes):
@@ -102,6 +118,23 @@ class PostgresDatabase(Database):
 
 		return super(PostgresDatabase, self).sql(*args, **kwargs)
 
+	def iter_sql(self, query, *args, **kwargs):
+		return super(PostgresDatabase, self).iter_sql(modify_query(query), *args, **kwargs)
+
+	def get_replication_lag(self):
+		if not self.sql('select pg_is_in_recovery()')[0][0]:
+			return None
+
+		# zero if all received changes are replayed, an idle primary is not lag
+		lag = self.sql('''select case when pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() then 0
+			else extract(epoch from now() - pg_last_xact_replay_timestamp()) end''')[0][0]
+		return float('inf') if lag is None else float(lag)
+
+	def get_server_side_cursor(self):
+		# named cursors are evaluated on the server and fetched in batches
+		return self._conn.cursor(name="frappe_iter_{0}".format(frappe.generate_hash(length=10)),
+			withhold=True)
+
 	def get_tables(self):
 		return [d[0] for d in self.sql("""select table_name
 			from information_schema.tables
@@ -238,6 +271,27 @@ class PostgresDatabase(Database):
 			key=key
 		)
 
+	def get_bulk_insert_query(self, table, fields, row_count, on_duplicate=None,
+		update_fields=None, conflict_fields=None):
+		query = 'INSERT INTO "{table}" ({fields}) VALUES {values}'.format(
+			table=table,
+			fields=', '.join('"{0}"'.format(field) for field in fields),
+			values=', '.join(['%s'] * row_count))
+
+		# there is no REPLACE in postgres, overwrite all the columns of the conflicting row
+		if on_duplicate == 'replace':
+			update_fields = [field for field in fields if field not in conflict_fields]
+
+		if on_duplicate == 'ignore' or (on_duplicate and not update_fields):
+			query += ' ON CONFLICT DO NOTHING'
+
+		elif on_duplicate in ('update', 'replace'):
+			query += ' ON CONFLICT ({keys}) DO UPDATE SET {values}'.format(
+				keys=', '.join('"{0}"'.format(field) for field in conflict_fields),
+				values=', '.join('"{0}"=EXCLUDED."{0}"'.format(field) for field in update_fields))
+
+		return query
+
 	def check_transaction_status(self, query):
 		pass
 
@@ -0,0 +1,210 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Read routing to database replicas (`frappe.read_only`).
+
+Replicas are configured in site config:
+
+	"read_from_replica": 1,
+	"read_replicas": [
+		{"host": "10.0.0.2", "weight": 2},
+		{"host": "10.0.0.3", "port": 3307, "db_name": "...", "db_password": "..."}
+	]
+
+`replica_host` is used as a single replica if `read_replicas` is not set. Other settings:
+
+- `replica_balancing`: "weighted" (default) or "least_connections"
+- `replica_max_lag`: replicas lagging behind by more seconds are skipped (default 10)
+- `replica_lag_check_interval`: seconds between lag probes of a replica (default 5)
+- `replica_pool_size`: idle connections kept per replica in a process (default 4)
+
+Reads stay on the primary if the request has already written to the database."""
+
+from __future__ import unicode_literals
+
+import random
+import threading
+import frappe
+from time import time
+from frappe.utils import cint, flt
+
+default_max_lag = 10
+default_lag_check_interval = 5
+default_pool_size = 4
+
+_lock = threading.RLock()
+
+# process wide state, keyed by (site, host, port)
+_idle_connections = {}
+_active_connections = {}
+_replica_status = {}
+
+def get_replicas():
+	replicas = frappe.conf.read_replicas
+	if not replicas and frappe.conf.replica_host:
+		replicas = [{
+			"host": frappe.conf.replica_host,
+			"port": frappe.conf.replica_port,
+			"db_name": frappe.conf.replica_db_name if frappe.conf.different_credentials_for_replica else None,
+			"db_password": frappe.conf.replica_db_password if frappe.conf.different_credentials_for_replica else None
+		}]
+
+	return [frappe._dict(replica) for replica in replicas or []]
+
+def get_replica_key(replica):
+	return (frappe.local.site, replica.host, cint(replica.port))
+
+def use_replica():
+	"""Switch `frappe.db` to a replica connection, returns True if switched"""
+	if (not frappe.conf.read_from_replica or frappe.flags.has_db_writes
+		or getattr(frappe.local, "primary_db", None)):
+		return False
+
+	replica_db = acquire()
+	if not replica_db:
+		return False
+
+	frappe.local.primary_db = frappe.local.db
+	frappe.local.replica_db = frappe.local.db = replica_db
+	return True
+
+def release_replica():
+	"""Switch `frappe.db` back to the primary and return the replica connection to the pool"""
+	replica_db = frappe.local.replica_db
+	frappe.local.db = frappe.local.primary_db
+	del frappe.local.primary_db
+	frappe.local.replica_db = None
+
+	release(replica_db)
+
+def acquire():
+	"""Returns a connection to a healthy replica picked by `replica_balancing`, None if
+	there isn't any"""
+	replicas = [r for r in get_replicas() if is_healthy(r)]
+	while replicas:
+		replica = pick(replicas)
+		key = get_replica_key(replica)
+
+		with _lock:
+			idle = _idle_connections.get(key) or []
+			db = idle.pop() if idle else None
+			_active_connections[key] = _active_connections.get(key, 0) + 1
+
+		if db and not db.is_connection_alive(db._conn):
+			# closed by the replica while idle (`wait_timeout`), connect again
+			close(db)
+			db = None
+
+		try:
+			if not db:
+				db = connect(replica)
+			db.replica_key = key
+			if check_lag(replica, db):
+				return db
+		except Exception:
+			mark_down(key)
+
+		discard(db, key)
+		replicas.remove(replica)
+
+def pick(replicas):
+	if frappe.conf.replica_balancing == "least_connections":
+		return min(replicas, key=lambda r: _active_connections.get(get_replica_key(r), 0)
+			/ (flt(r.weight) or 1.0))
+
+	total = sum(flt(r.weight) or 1.0 for r in replicas)
+	point = random.uniform(0, total)
+	for replica in replicas:
+		point -= flt(replica.weight) or 1.0
+		if point <= 0:
+			return replica
+
+	return replicas[-1]
+
+def connect(replica):
+	from frappe.database import get_db
+	db = get_db(host=replica.host, port=replica.port,
+		user=replica.db_name or frappe.conf.db_name,
+		password=replica.db_password or frappe.conf.db_password)
+
+	# connect resets the rollback observers of the request
+	rollback_observers = getattr(frappe.local, "rollback_observers", [])
+	db.connect()
+	frappe.local.rollback_observers = rollback_observers
+
+	return db
+
+def release(db):
+	key = db.replica_key
+	try:
+		# end the transaction, so that the next reader does not see an old snapshot
+		db.sql("rollback")
+	except Exception:
+		return discard(db, key)
+
+	with _lock:
+		_active_connections[key] = max(_active_connections.get(key, 1) - 1, 0)
+		idle = _idle_connections.setdefault(key, [])
+		if len(idle) < (cint(frappe.conf.replica_pool_size) or default_pool_size):
+			idle.append(db)
+			return
+
+	db.close()
+
+def discard(db, key):
+	with _lock:
+		_active_connections[key] = max(_active_connections.get(key, 1) - 1, 0)
+
+	if db:
+		close(db)
+
+def close(db):
+	try:
+		db.close()
+	except Exception:
+		pass
+
+def is_healthy(replica):
+	status = _replica_status.get(get_replica_key(replica))
+	if not status or status.checked_at + get_lag_check_interval() < time():
+		# unknown or stale, probed when a connection is acquired
+		return True
+
+	return status.healthy
+
+def check_lag(replica, db):
+	"""Probe the replication lag of the replica if it wasn't checked recently"""
+	key = get_replica_key(replica)
+	status = _replica_status.get(key)
+	if status and status.checked_at + get_lag_check_interval() >= time():
+		return status.healthy
+
+	lag = db.get_replication_lag()
+	max_lag = flt(frappe.conf.replica_max_lag) or default_max_lag
+	_replica_status[key] = frappe._dict(lag=lag, healthy=lag is None or lag <= max_lag,
+		checked_at=time())
+
+	return _replica_status[key].healthy
+
+def mark_down(key):
+	_replica_status[key] = frappe._dict(lag=None, healthy=False, checked_at=time())
+
+def get_lag_check_interval():
+	return flt(frappe.conf.replica_lag_check_interval) or default_lag_check_interval
+
+def get_stats():
+	"""Returns the status of the replicas of the current site in this process"""
+	stats = []
+	for replica in get_replicas():
+		key = get_replica_key(replica)
+		status = _replica_status.get(key) or {}
+		stats.append({
+			"host": replica.host,
+			"port": replica.port,
+			"healthy": status.get("healthy", True),
+			"lag": status.get("lag"),
+			"active": _active_connections.get(key, 0),
+			"idle": len(_idle_connections.get(key) or [])
+		})
+
+	return stats
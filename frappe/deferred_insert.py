@@ -1,41 +1,167 @@
 import json
 import frappe
 
-from frappe.utils import cstr
+from time import time
+from frappe.utils import cstr, cint, flt, now
+from frappe.model.naming import set_new_name
 
 queue_prefix = 'insert_queue_for_'
+stats_key = 'deferred_insert_stats'
+
+# queue entries popped per round trip, can be overridden by `deferred_insert_batch_size` in site config
+default_batch_size = 500
+
+# upper bound of records flushed per queue in one scheduler run (`deferred_insert_max_records`)
+default_max_records = 100000
 
 @frappe.whitelist()
 def deferred_insert(doctype, records):
 	frappe.cache().rpush(queue_prefix + doctype, records)
+	frappe.cache().add_to_key_index(queue_prefix, queue_prefix + doctype)
 
 def save_to_db():
-	queue_keys = frappe.cache().get_keys(queue_prefix)
+	"""Drain all deferred insert queues.
+
+	Queue entries are popped in chunks and written with one multi-row `INSERT` per batch.
+	DocTypes listed in the `deferred_insert_with_hooks` hook are inserted one document
+	at a time so that their controller methods still run."""
+	batch_size = cint(frappe.conf.deferred_insert_batch_size) or default_batch_size
+	max_records = cint(frappe.conf.deferred_insert_max_records) or default_max_records
+	doctypes_with_hooks = frappe.get_hooks('deferred_insert_with_hooks') or []
+
+	queue_keys = frappe.cache().get_keys(queue_prefix, indexed=True)
 	for key in queue_keys:
-		record_count = 0
 		queue_key = get_key_name(key)
 		doctype = get_doctype_name(key)
-		while frappe.cache().llen(queue_key) > 0 and record_count <= 500:
-			records = frappe.cache().lpop(queue_key)
-			records = json.loads(records.decode('utf-8'))
-			if isinstance(records, dict):
-				record_count += 1
-				insert_record(records, doctype)
-				continue
-			for record in records:
-				record_count += 1
-				insert_record(record, doctype)
-
-	frappe.db.commit()
+		run_hooks = doctype in doctypes_with_hooks
+
+		start_time = time()
+		record_count = failed_count = batch_count = 0
+		while record_count < max_records:
+			records = pop_records(queue_key, batch_size)
+			if not records:
+				break
+
+			batch_count += 1
+			record_count += len(records)
+			if run_hooks:
+				failed_count += insert_records(records, doctype)
+			else:
+				failed_count += bulk_insert_records(records, doctype)
+
+			frappe.db.commit()
+
+		if record_count:
+			update_stats(doctype, record_count, failed_count, batch_count, time() - start_time)
+
+def pop_records(queue_key, batch_size):
+	"""Atomically pop up to `batch_size` entries from the queue and return the records in them"""
+	cache = frappe.cache()
+	name = cache.make_key(queue_key)
+
+	pipe = cache.pipeline()
+	pipe.lrange(name, 0, batch_size - 1)
+	pipe.ltrim(name, batch_size, -1)
+	entries = pipe.execute()[0]
+
+	records = []
+	for entry in entries:
+		entry = json.loads(frappe.safe_decode(entry))
+		if isinstance(entry, dict):
+			records.append(entry)
+		else:
+			records.extend(entry)
+
+	return records
+
+def bulk_insert_records(records, doctype):
+	"""Insert records through `frappe.db.bulk_insert`, returns the number of failed records"""
+	# a failed statement aborts the whole transaction on Postgres
+	frappe.db.savepoint("deferred_insert")
+	try:
+		columns, rows = get_rows_for_bulk_insert(records, doctype)
+		frappe.db.bulk_insert(doctype, columns, rows, chunk_size=len(rows), coerce=True)
+	except Exception:
+		# a multi row insert is all or nothing, retry record by record to save the valid ones
+		frappe.db.rollback(save_point="deferred_insert")
+		frappe.log_error(title='Deferred bulk insert failed for {0}'.format(doctype))
+		return insert_records(records, doctype)
+
+	return 0
+
+def get_rows_for_bulk_insert(records, doctype):
+	"""Returns the column list and a list of rows (tuples) with defaults and standard fields set"""
+	meta = frappe.get_meta(doctype)
+	columns = meta.get_valid_columns()
+	defaults = frappe.new_doc(doctype, as_dict=True)
+	hash_named = (meta.autoname or 'hash').lower() == 'hash'
+
+	timestamp = now()
+	user = frappe.session.user
+	rows = []
+	for record in records:
+		values = frappe._dict(defaults)
+		values.update(record)
+		values.update({
+			'doctype': doctype,
+			'docstatus': 0,
+			'idx': cint(values.idx),
+			'creation': values.creation or timestamp,
+			'modified': timestamp,
+			'modified_by': user,
+			'owner': values.owner or user
+		})
+
+		if hash_named:
+			values.name = frappe.generate_hash(doctype, 10)
+		else:
+			doc = frappe.get_doc(values)
+			set_new_name(doc)
+			values.name = doc.name
+
+		rows.append(tuple(values.get(column) for column in columns))
+
+	return columns, rows
+
+def insert_records(records, doctype):
+	"""Insert records one document at a time, returns the number of failed records"""
+	failed = 0
+	for record in records:
+		if not insert_record(record, doctype):
+			failed += 1
+	return failed
 
 def insert_record(record, doctype):
 	if not record.get('doctype'):
 		record['doctype'] = doctype
+	frappe.db.savepoint("deferred_insert")
 	try:
 		doc = frappe.get_doc(record)
 		doc.insert()
+		return True
 	except Exception as e:
+		frappe.db.rollback(save_point="deferred_insert")
 		print(e, doctype)
+		return False
+
+def update_stats(doctype, record_count, failed_count, batch_count, duration):
+	stats = frappe.cache().hget(stats_key, doctype) or {}
+	stats.update({
+		'records': cint(stats.get('records')) + record_count,
+		'failed': cint(stats.get('failed')) + failed_count,
+		'last_run': now(),
+		'last_run_records': record_count,
+		'last_run_batches': batch_count,
+		'last_run_duration': flt(duration, 3),
+		'records_per_second': flt(record_count / duration, 2) if duration else record_count
+	})
+	frappe.cache().hset(stats_key, doctype, stats)
+
+def get_stats(doctype=None):
+	"""Returns throughput stats of the deferred insert queues (all DocTypes if none given)"""
+	if doctype:
+		return frappe.cache().hget(stats_key, doctype)
+	return frappe.cache().hgetall(stats_key)
 
 def get_key_name(key):
 	return cstr(key).split('|')[1]
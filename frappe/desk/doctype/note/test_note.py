@@ -4,6 +4,7 @@
 from __future__ import unicode_literals
 import frappe
 import unittest
+from frappe.core.doctype.version.version import flush_version_log
 
 test_records = frappe.get_test_records('Note')
 
@@ -16,13 +17,19 @@ class TestNote(unittest.TestCase):
 		return frappe.get_doc(dict(doctype='Note', title='test note',
 			content='test note content')).insert()
 
+	def get_version(self, note):
+		# Versions are inserted from the version log once committed
+		frappe.db.commit()
+		flush_version_log()
+		return frappe.get_doc('Version', dict(docname=note.name))
+
 	def test_version(self):
 		note = self.insert_note()
 		note.title = 'test note 1'
 		note.content = '1'
 		note.save()
 
-		version = frappe.get_doc('Version', dict(docname=note.name))
+		version = self.get_version(note)
 		data = version.get_data()
 
 		self.assertTrue(('title', 'test note', 'test note 1'), data['changed'])
@@ -35,7 +42,7 @@ class TestNote(unittest.TestCase):
 		note.append('seen_by', {'user': 'Administrator'})
 		note.save()
 
-		version = frappe.get_doc('Version', dict(docname=note.name))
+		version = self.get_version(note)
 		data = version.get_data()
 
 		self.assertEqual(len(data.get('added')), 1)
@@ -50,7 +57,7 @@ class TestNote(unittest.TestCase):
 		note.seen_by[0].user = 'Guest'
 		note.save()
 
-		version = frappe.get_doc('Version', dict(docname=note.name))
+		version = self.get_version(note)
 		data = version.get_data()
 
 		self.assertEqual(len(data.get('row_changed')), 1)
@@ -64,7 +71,7 @@ class TestNote(unittest.TestCase):
 		note.seen_by = []
 		note.save()
 
-		version = frappe.get_doc('Version', dict(docname=note.name))
+		version = self.get_version(note)
 		data = version.get_data()
 
 		self.assertEqual(len(data.get('removed')), 1)
@@ -0,0 +1,305 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Prefix index for Link field search of large masters, enabled per DocType in site config:
+
+	"link_search_index": ["Item", "Customer"]
+
+Every word (and the whole value) of the name, title field and search fields of a document is
+kept lowercased in a Redis sorted set as `term\\0name`, so candidates for a search text are a
+single `ZRANGEBYLEX` instead of `LIKE '%txt%'` over the table. Candidates are filtered with the
+filters and permissions of `frappe.get_list` and ranked by prefix match on the name, then by
+link count (`idx`).
+
+The index is built by a background job queued on the first search, searches use `LIKE` until
+it is built. It is updated when documents are saved, renamed or deleted, updates made while it
+is built are queued and applied once the build is done. Results are cached per user for
+`link_search_cache_ttl` seconds (default 10)."""
+
+from __future__ import unicode_literals
+
+import re
+import json
+import hashlib
+import redis
+import frappe
+from frappe.utils import cint, cstr
+
+index_key = "link_search::{0}"
+terms_key = "link_search_terms::{0}"
+built_key = "link_search_built::{0}"
+pending_key = "link_search_pending::{0}"
+
+# max names matched by a search text, the search falls back to a table scan if the page
+# can not be filled from these
+max_candidates = 500
+build_batch_size = 10000
+default_cache_ttl = 10
+searchable_fieldtypes = ("Data", "Text", "Small Text", "Long Text", "Link", "Select",
+	"Read Only", "Text Editor")
+
+def is_indexed(doctype):
+	return doctype in (frappe.conf.link_search_index or ())
+
+def get_indexed_fields(doctype):
+	meta = frappe.get_meta(doctype)
+	fields = ["name"]
+	if meta.title_field:
+		fields.append(meta.title_field)
+
+	if meta.search_fields:
+		fields.extend(meta.get_search_fields())
+
+	return [f for f in unique_fields(fields)
+		if f == "name" or (meta.get_field(f) and meta.get_field(f).fieldtype in searchable_fieldtypes)]
+
+def unique_fields(fields):
+	out = []
+	for f in fields:
+		f = f.strip()
+		if f and f not in out:
+			out.append(f)
+	return out
+
+def get_terms(values):
+	"""Returns the words and whole values, lowercased"""
+	terms = set()
+	for value in values:
+		value = cstr(value).strip().lower()
+		if not value:
+			continue
+
+		terms.add(value[:140])
+		terms.update(word for word in re.findall(r"\w+", value, re.UNICODE))
+
+	return terms
+
+def get_members(name, values):
+	return [frappe.safe_encode(term + "\0" + cstr(name)) for term in get_terms(values)]
+
+def search(doctype, txt, fields, filters=None, start=0, page_length=20, as_dict=False,
+	ignore_permissions=False, reference_doctype=None):
+	"""Returns the values of `fields` for the documents matching `txt`, as `search_widget`.
+	Returns None if the index can't be used to fill the page."""
+	if not txt.strip():
+		return None
+
+	cache = frappe.cache()
+	cache_key = "link_search_results::" + hashlib.md5(frappe.safe_encode(json.dumps(
+		[doctype, txt, fields, filters, start, page_length, as_dict, cint(ignore_permissions),
+			reference_doctype], default=str))).hexdigest()
+
+	values = cache.get_value(cache_key, user=frappe.session.user, expires=True)
+	if values is not None:
+		return values
+
+	values = get_matching_values(doctype, txt, fields, filters, start, page_length, as_dict,
+		ignore_permissions, reference_doctype)
+
+	if values is not None:
+		ttl = cint(frappe.conf.get("link_search_cache_ttl", default_cache_ttl))
+		if ttl:
+			cache.set_value(cache_key, values, user=frappe.session.user, expires_in_sec=ttl)
+
+	return values
+
+def get_matching_values(doctype, txt, fields, filters, start, page_length, as_dict,
+	ignore_permissions, reference_doctype):
+	candidates, truncated = get_candidates(doctype, txt)
+	if candidates is None:
+		return None
+	if not candidates:
+		return []
+
+	values = frappe.get_list(doctype,
+		filters=(filters or []) + [[doctype, "name", "in", candidates]],
+		fields=fields + ["`tab{0}`.`idx` as `_link_count`".format(doctype)],
+		order_by="`tab{0}`.`idx` desc, `tab{0}`.`name` asc".format(doctype),
+		limit_page_length=None,
+		ignore_permissions=ignore_permissions,
+		reference_doctype=reference_doctype,
+		as_list=not as_dict,
+		strict=False)
+
+	if truncated and (not page_length or len(values) < start + cint(page_length)):
+		# matches beyond the candidates may be missing
+		return None
+
+	# names starting with the text first, then by link count
+	txt = txt.strip().lower()
+	values = sorted(values, key=lambda v: not cstr(v.name if as_dict else v[0]).lower().startswith(txt))
+	values = values[start:start + cint(page_length)] if page_length else values[start:]
+
+	if as_dict:
+		for v in values:
+			v.pop("_link_count")
+		return values
+
+	return [v[:-1] for v in values]
+
+def get_candidates(doctype, txt):
+	"""Returns `(names, truncated)`, names of documents with a word (or value) starting with
+	`txt` and if there could be more. Names are None if the index is not available."""
+	if not is_index_built(doctype):
+		enqueue_build_index(doctype)
+		return None, False
+
+	cache = frappe.cache()
+	prefix = frappe.safe_encode(txt.strip().lower())
+	try:
+		members = cache.zrangebylex(cache.make_key(index_key.format(doctype)),
+			b"[" + prefix, b"[" + prefix + b"\xff", start=0, num=max_candidates * 4)
+	except redis.exceptions.ConnectionError:
+		return None, False
+
+	names = []
+	for member in members:
+		name = frappe.safe_decode(member).split("\0", 1)[-1]
+		if name not in names:
+			names.append(name)
+			if len(names) == max_candidates:
+				break
+
+	return names, len(names) == max_candidates or len(members) == max_candidates * 4
+
+def is_index_built(doctype):
+	built = frappe.cache().get_value(built_key.format(doctype), expires=True)
+	return built == get_indexed_fields(doctype)
+
+def enqueue_build_index(doctype):
+	"""Queue a job to build the index, if there isn't one pending"""
+	cache = frappe.cache()
+	try:
+		if not cache.set(cache.make_key("link_search_build_queued::" + doctype), 1, nx=True, ex=3600):
+			return
+	except redis.exceptions.ConnectionError:
+		return
+
+	frappe.enqueue("frappe.desk.link_search.build_index", queue="long", doctype=doctype)
+
+def build_index(doctype):
+	"""Index the search fields of all documents of the DocType, returns False if Redis is down
+	or the index is being built by another job"""
+	cache = frappe.cache()
+	fields = get_indexed_fields(doctype)
+	lock = cache.lock(cache.make_key("link_search_build_lock::" + doctype), timeout=3600)
+
+	try:
+		if not lock.acquire(blocking=False):
+			return False
+	except redis.exceptions.ConnectionError:
+		return False
+
+	try:
+		# updates committed so far are read from the table
+		cache.delete_value(built_key.format(doctype))
+		cache.delete(cache.make_key(index_key.format(doctype)), cache.make_key(terms_key.format(doctype)),
+			cache.make_key(pending_key.format(doctype)))
+
+		last_name = None
+		while True:
+			rows = frappe.get_all(doctype, fields=fields,
+				filters={"name": [">", last_name]} if last_name else None,
+				order_by="name asc", limit_page_length=build_batch_size, as_list=True)
+			if not rows:
+				break
+
+			pipe = cache.pipeline()
+			for row in rows:
+				set_members(pipe, doctype, row[0], get_members(row[0], row), [])
+			pipe.execute()
+			last_name = rows[-1][0]
+
+		cache.set_value(built_key.format(doctype), fields, expires_in_sec=86400 * 30)
+		apply_pending_updates(doctype)
+
+	except redis.exceptions.ConnectionError:
+		return False
+
+	finally:
+		cache.delete(cache.make_key("link_search_build_queued::" + doctype))
+		lock.release()
+
+	return True
+
+def set_members(pipe, doctype, name, members, old_members):
+	old_members = set(old_members)
+	to_remove = [m for m in old_members if m not in members]
+	to_add = [m for m in members if m not in old_members]
+
+	if to_remove:
+		pipe.zrem(frappe.cache().make_key(index_key.format(doctype)), *to_remove)
+	if to_add:
+		args = []
+		for m in to_add:
+			args.extend((0, m))
+		pipe.execute_command("ZADD", frappe.cache().make_key(index_key.format(doctype)), *args)
+
+	terms_name = frappe.cache().make_key(terms_key.format(doctype))
+	if members:
+		pipe.hset(terms_name, name, json.dumps([frappe.safe_decode(m) for m in members]))
+	else:
+		pipe.hdel(terms_name, name)
+
+def get_old_members(doctype, name):
+	cache = frappe.cache()
+	old = redis.Redis.hget(cache, cache.make_key(terms_key.format(doctype)), name)
+	return [frappe.safe_encode(m) for m in json.loads(frappe.safe_decode(old))] if old else []
+
+def update_link_search_index(doc):
+	"""Update the index for the document once the transaction is committed, called after it
+	is saved"""
+	if not is_indexed(doc.doctype):
+		return
+
+	values = [doc.get(f) if f != "name" else doc.name for f in get_indexed_fields(doc.doctype)]
+	frappe.db.after_commit(set_document_terms, doc.doctype, doc.name, values)
+
+def delete_from_link_search_index(doctype, name):
+	"""Remove the document from the index once the transaction is committed, called after it
+	is deleted (or renamed)"""
+	if not is_indexed(doctype):
+		return
+
+	frappe.db.after_commit(set_document_terms, doctype, name, None)
+
+def set_document_terms(doctype, name, values):
+	"""Replace the terms of the document with the terms of `values`, remove them if None.
+	Queued if the index is not built, for the build that may be running."""
+	cache = frappe.cache()
+	try:
+		if not is_index_built(doctype):
+			name_key = cache.make_key(pending_key.format(doctype))
+			pipe = cache.pipeline()
+			pipe.rpush(name_key, json.dumps([name, values], default=cstr))
+			# dropped by the next build if no build is running
+			pipe.expire(name_key, 86400)
+			pipe.execute()
+
+			# the build finished in the meanwhile
+			if is_index_built(doctype):
+				apply_pending_updates(doctype)
+			return
+
+		apply_document_terms(doctype, name, values)
+	except redis.exceptions.ConnectionError:
+		pass
+
+def apply_pending_updates(doctype):
+	cache = frappe.cache()
+	while True:
+		update = redis.Redis.lpop(cache, cache.make_key(pending_key.format(doctype)))
+		if not update:
+			break
+
+		name, values = json.loads(frappe.safe_decode(update))
+		apply_document_terms(doctype, name, values)
+
+def apply_document_terms(doctype, name, values):
+	try:
+		pipe = frappe.cache().pipeline()
+		set_members(pipe, doctype, name, get_members(name, values) if values is not None else [],
+			get_old_members(doctype, name))
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		pass
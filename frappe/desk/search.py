@@ -6,6 +6,7 @@ from __future__ import unicode_literals
 import frappe, json
 from frappe.utils import cstr, unique, cint
 from frappe.permissions import has_permission
+from frappe.desk import link_search
 from frappe import _
 from six import string_types
 import re
@@ -128,6 +129,16 @@ def search_widget(doctype, txt, query=None, searchfield=None, start=0,
 				fields = list(set(fields + json.loads(filter_fields)))
 			formatted_fields = ['`tab%s`.`%s`' % (meta.name, f.strip()) for f in fields]
 
+			ignore_permissions = True if doctype == "DocType" else (cint(ignore_user_permissions) and has_permission(doctype))
+
+			if txt and doctype not in UNTRANSLATED_DOCTYPES and link_search.is_indexed(doctype):
+				values = link_search.search(doctype, txt, formatted_fields, filters=filters,
+					start=start, page_length=page_length, as_dict=as_dict,
+					ignore_permissions=ignore_permissions, reference_doctype=reference_doctype)
+				if values is not None:
+					frappe.response["values"] = values
+					return
+
 			# find relevance as location of search term from the beginning of string `name`. used for sorting results.
 			formatted_fields.append("""locate({_txt}, `tab{doctype}`.`name`) as `_relevance`""".format(
 				_txt=frappe.db.escape((txt or "").replace("%", "")), doctype=doctype))
@@ -139,8 +150,6 @@ def search_widget(doctype, txt, query=None, searchfield=None, start=0,
 			# 2 is the index of _relevance column
 			order_by = "_relevance, {0}, `tab{1}`.idx desc".format(order_by_based_on_meta, doctype)
 
-			ignore_permissions = True if doctype == "DocType" else (cint(ignore_user_permissions) and has_permission(doctype))
-
 			if doctype in UNTRANSLATED_DOCTYPES:
 				page_length = None
 
@@ -11,15 +11,27 @@ from frappe.email.smtp import SMTPServer, get_outgoing_email_account
 from frappe.email.email_body import get_email, get_formatted_html, add_attachment
 from frappe.utils.verified_command import get_signed_params, verify_request
 from html2text import html2text
-from frappe.utils import get_url, nowdate, now_datetime, add_days, split_emails, cstr, cint
+from frappe.utils import (get_url, nowdate, now, now_datetime, add_days, add_to_date, split_emails,
+	cstr, cint, flt)
 from rq.timeouts import JobTimeoutException
 from frappe.utils.scheduler import log
-from six import text_type, string_types, PY3
+from six import text_type, string_types, iteritems, PY3
+from six.moves.queue import Queue
 from email.parser import Parser
+from concurrent.futures import ThreadPoolExecutor
+from time import time
 
 
 class EmailLimitCrossedError(frappe.ValidationError): pass
 
+# bad connection/timeout, the email is sent again in the next flush
+SMTP_RETRY_ERRORS = (smtplib.SMTPServerDisconnected,
+	smtplib.SMTPConnectError,
+	smtplib.SMTPHeloError,
+	smtplib.SMTPAuthenticationError,
+	smtplib.SMTPRecipientsRefused,
+	JobTimeoutException)
+
 def send(recipients=None, sender=None, subject=None, message=None, text_content=None, reference_doctype=None,
 		reference_name=None, unsubscribe_method=None, unsubscribe_params=None, unsubscribe_message=None,
 		attachments=None, reply_to=None, cc=None, bcc=None, message_id=None, in_reply_to=None, send_after=None,
@@ -328,32 +340,301 @@ def return_unsubscribed_page(email, doctype, name):
 		indicator_color='green')
 
 def flush(from_test=False):
-	"""flush email queue, every time: called from scheduler"""
+	"""flush email queue, every time: called from scheduler
+
+	Emails are claimed in chunks of `email_claim_batch_size` (default 50), the message of an
+	email is prepared once and sent to its recipients over a pool of `email_smtp_sessions`
+	(default 4) SMTP sessions per account, `email_send_batch_size` (default 50) messages at a
+	time. Recipient statuses are committed after each batch of messages, email statuses after
+	each chunk."""
 	# additional check
 
 	auto_commit = not from_test
 	if frappe.are_emails_muted():
 		msgprint(_("Emails are muted"))
-		from_test = True
+		return
+
+	if cint(frappe.defaults.get_defaults().get("hold_queue"))==1:
+		return
+
+	reset_stale_emails(auto_commit=auto_commit)
+
+	queue = [email.name for email in get_queue()]
+	claim_batch_size = cint(frappe.conf.email_claim_batch_size) or 50
+	for i in range(0, len(queue), claim_batch_size):
+		emails = claim_emails(queue[i:i + claim_batch_size], auto_commit=auto_commit)
+		if not emails:
+			continue
+
+		# group by outgoing email account, each account gets its own pool of SMTP sessions
+		emails_by_account = frappe._dict()
+		for email in emails:
+			email_account = get_outgoing_email_account(raise_exception_not_set=False,
+				append_to=email.reference_doctype, sender=email.sender)
+			emails_by_account.setdefault(email_account.name if email_account else None, []).append(email)
+
+		for account, account_emails in iteritems(emails_by_account):
+			send_emails(account, account_emails, auto_commit=auto_commit)
+
+def reset_stale_emails(auto_commit=True):
+	"""Put emails left in Sending for longer than `email_sending_timeout` seconds (default
+	1800) back in the queue, when the job that claimed them was killed"""
+	timeout = cint(frappe.conf.email_sending_timeout) or 1800
+	frappe.db.sql("""update `tabEmail Queue` set
+			status=(case when exists(select `name` from `tabEmail Queue Recipient`
+				where `tabEmail Queue Recipient`.parent=`tabEmail Queue`.name
+				and `tabEmail Queue Recipient`.status='Sent') then 'Partially Sent' else 'Not Sent' end),
+			modified=%(now)s
+		where status='Sending' and modified < %(stale_before)s""",
+		{'now': now_datetime(), 'stale_before': add_to_date(now_datetime(), seconds=-timeout)})
+
+	if auto_commit:
+		frappe.db.commit()
+
+def claim_emails(names, auto_commit=True):
+	"""Set the status of queued emails to Sending in one transaction and return the ones
+	claimed with their recipients. Rows taken by another worker in the meanwhile are skipped."""
+	if not names:
+		return []
+
+	emails = frappe.db.sql('''select
+			name, status, communication, message, sender, reference_doctype,
+			reference_name, unsubscribe_param, unsubscribe_method, expose_recipients,
+			show_as_cc, add_unsubscribe_link, attachments, retry
+		from
+			`tabEmail Queue`
+		where
+			name in %(names)s and status in ('Not Sent', 'Partially Sent')
+		for update''', {'names': tuple(names)}, as_dict=True)
+
+	if not emails:
+		return []
+
+	# keep the order of the queue
+	order = {name: i for i, name in enumerate(names)}
+	emails.sort(key=lambda email: order[email.name])
+
+	names = tuple(email.name for email in emails)
+	frappe.db.sql("""update `tabEmail Queue` set status='Sending', modified=%(now)s
+		where name in %(names)s""", {'names': names, 'now': now_datetime()})
+
+	if auto_commit:
+		frappe.db.commit()
+
+	recipients = frappe._dict()
+	for recipient in frappe.db.sql("""select name, parent, recipient, status
+		from `tabEmail Queue Recipient` where parent in %(names)s order by idx""", {'names': names}, as_dict=1):
+		recipients.setdefault(recipient.parent, []).append(recipient)
+
+	for email in emails:
+		email.recipients = recipients.get(email.name) or []
 
-	smtpserver_dict = frappe._dict()
+	set_communication_delivery_status(emails, auto_commit)
+	return emails
 
-	for email in get_queue():
+def send_emails(account, emails, auto_commit=True):
+	"""Send claimed emails of an email account and write the statuses back in bulk. Messages
+	are sent as they are prepared, `email_send_batch_size` at a time."""
+	start_time = time()
+	send_batch_size = cint(frappe.conf.email_send_batch_size) or 50
+	sender = frappe._dict(pool=None, sent=0, failed=0, auto_commit=auto_commit)
+	tasks, failed = [], {}
 
-		if cint(frappe.defaults.get_defaults().get("hold_queue"))==1:
-			break
+	try:
+		for email in emails:
+			try:
+				# attachments are loaded once per email, not per recipient
+				attachments = get_attachments(email)
+				for recipient in email.recipients:
+					if recipient.status == "Not Sent":
+						tasks.append((email, recipient, prepare_message(email, recipient.recipient,
+							email.recipients, attachments=attachments)))
+			except Exception as e:
+				failed[email.name] = e
+
+			if len(tasks) >= send_batch_size:
+				send_tasks(sender, tasks, failed)
+				tasks = []
+
+		if tasks:
+			send_tasks(sender, tasks, failed)
+	finally:
+		if sender.pool:
+			sender.pool.close()
+
+	update_statuses(emails, failed, auto_commit)
+	update_stats(account, sender.sent, sender.failed, time() - start_time)
+
+def send_tasks(sender, tasks, failed):
+	"""Send prepared (email, recipient, message) tasks and record the result of each one.
+	Sent recipients are committed before the next batch is sent, so that they are not sent
+	again if the job is killed (see `reset_stale_emails`)."""
+	results = [None] * len(tasks)
+	if frappe.flags.in_test:
+		frappe.flags.sent_mail = tasks[-1][2]
+
+	else:
+		if not sender.pool:
+			try:
+				sender.pool = SMTPSessionPool(tasks[0][0],
+					size=min(cint(frappe.conf.email_smtp_sessions) or 4, len(tasks)))
+			except Exception as e:
+				# could not connect or login, retry these later
+				results = [smtplib.SMTPConnectError(0, cstr(e))] * len(tasks)
+
+		if sender.pool:
+			results = sender.pool.send([(email.sender, recipient.recipient, message)
+				for email, recipient, message in tasks])
+
+	for (email, recipient, message), error in zip(tasks, results):
+		if error:
+			failed.setdefault(email.name, error)
+			sender.failed += 1
+		else:
+			recipient.status = "Sent"
+			sender.sent += 1
+
+	update_recipient_statuses(tasks, sender.auto_commit)
+
+def update_recipient_statuses(tasks, auto_commit=True):
+	"""Write the Sent recipients of a batch, and keep its emails from being reset as stale"""
+	now = now_datetime()
+	sent_recipients = [recipient.name for email, recipient, message in tasks if recipient.status == "Sent"]
+	if sent_recipients:
+		frappe.db.sql("""update `tabEmail Queue Recipient` set status='Sent', modified=%(now)s
+			where name in %(names)s""", {'names': tuple(sent_recipients), 'now': now})
+
+	frappe.db.sql("""update `tabEmail Queue` set modified=%(now)s where name in %(names)s""",
+		{'names': tuple(set(email.name for email, recipient, message in tasks)), 'now': now})
+
+	if auto_commit:
+		frappe.db.commit()
+
+def get_attachments(email):
+	"""Returns the on-demand attachments of an email with their content loaded"""
+	if not email.attachments:
+		return []
+
+	attachments = []
+	for attachment in json.loads(email.attachments):
+		if attachment.get('fcontent'):
+			continue
+
+		fid = attachment.get("fid")
+		if fid:
+			_file = frappe.get_doc("File", fid)
+			attachment.update({
+				'fname': _file.file_name,
+				'fcontent': _file.get_content()
+			})
+			attachment.pop("fid", None)
+			attachments.append(attachment)
+
+		elif attachment.get("print_format_attachment") == 1:
+			attachment.pop("print_format_attachment", None)
+			attachments.append(frappe.attach_print(**attachment))
+
+	return attachments
+
+def update_statuses(emails, failed, auto_commit=True):
+	"""Write queue statuses after a chunk was sent, one query per status. Recipient statuses
+	are written by `update_recipient_statuses` as each batch is sent."""
+	now = now_datetime()
+	statuses = frappe._dict()
+	errors = []
+	for email in emails:
+		any_sent = any(r.status == "Sent" for r in email.recipients)
+		error = failed.get(email.name)
+
+		if not error:
+			status = "Sent" if any_sent else "Error"
+			if not any_sent:
+				errors.append((email.name, "No recipients to send to"))
+		elif isinstance(error, SMTP_RETRY_ERRORS):
+			# bad connection/timeout, retry later
+			status = "Partially Sent" if any_sent else "Not Sent"
+		elif email.retry < 3:
+			status = "Retry"
+		else:
+			status = "Partially Errored" if any_sent else "Error"
+			errors.append((email.name, text_type(error)))
+			log('frappe.email.queue.flush', text_type(error))
+
+		statuses.setdefault(status, []).append(email.name)
+
+	for status, names in iteritems(statuses):
+		if status == "Retry":
+			frappe.db.sql("""update `tabEmail Queue` set status='Not Sent', modified=%(now)s,
+				retry=retry+1 where name in %(names)s""", {'names': tuple(names), 'now': now})
+		else:
+			frappe.db.sql("""update `tabEmail Queue` set status=%(status)s, modified=%(now)s
+				where name in %(names)s""", {'names': tuple(names), 'status': status, 'now': now})
 
-		if email.name:
-			smtpserver = smtpserver_dict.get(email.sender)
-			if not smtpserver:
-				smtpserver = SMTPServer()
-				smtpserver_dict[email.sender] = smtpserver
+	for name, error in errors:
+		frappe.db.sql("""update `tabEmail Queue` set error=%s where name=%s""", (error, name))
 
-			send_one(email.name, smtpserver, auto_commit, from_test=from_test)
+	if auto_commit:
+		frappe.db.commit()
+
+	set_communication_delivery_status(emails, auto_commit)
+
+def set_communication_delivery_status(emails, auto_commit=True):
+	for communication in set(email.communication for email in emails if email.communication):
+		frappe.get_doc('Communication', communication).set_delivery_status(commit=auto_commit)
+
+def update_stats(account, sent, failed, duration):
+	"""Keep the throughput of the email queue per outgoing email account"""
+	stats = frappe.cache().hget("email_queue_stats", account or "default") or {}
+	stats.update({
+		'sent': cint(stats.get('sent')) + sent,
+		'failed': cint(stats.get('failed')) + failed,
+		'last_run': now(),
+		'last_run_sent': sent,
+		'last_run_duration': flt(duration, 3),
+		'emails_per_second': flt(sent / duration, 2) if duration else sent
+	})
+	frappe.cache().hset("email_queue_stats", account or "default", stats)
+
+def get_stats(account=None):
+	"""Returns throughput stats of the email queue (all accounts if none given)"""
+	if account:
+		return frappe.cache().hget("email_queue_stats", account)
+	return frappe.cache().hgetall("email_queue_stats")
+
+class SMTPSessionPool(object):
+	"""A bounded set of logged in SMTP sessions of an email account, used from threads"""
+	def __init__(self, email, size=4):
+		# sessions are set up here as logging in needs the site context
+		self.sessions = Queue()
+		self.servers = []
+		for i in range(size):
+			server = SMTPServer()
+			server.setup_email_account(email.reference_doctype, sender=email.sender)
+			self.servers.append(server)
+			self.sessions.put(server.sess)
+
+	def send(self, messages):
+		"""Send (sender, recipient, message) tuples concurrently, returns the exception
+		raised for each message or None if it was sent"""
+		with ThreadPoolExecutor(max_workers=len(self.servers)) as executor:
+			return list(executor.map(self.sendmail, messages))
+
+	def sendmail(self, args):
+		sess = self.sessions.get()
+		try:
+			sess.sendmail(*args)
+		except Exception as e:
+			return e
+		finally:
+			self.sessions.put(sess)
+
+	def close(self):
+		for server in self.servers:
+			try:
+				server.sess.quit()
+			except Exception:
+				pass
 
-		# NOTE: removing commit here because we pass auto_commit
-		# finally:
-		# 	frappe.db.commit()
 def get_queue():
 	return frappe.db.sql('''select
 			name, sender
@@ -406,11 +687,12 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 			if not smtpserver: smtpserver = SMTPServer()
 			smtpserver.setup_email_account(email.reference_doctype, sender=email.sender)
 
+		attachments = get_attachments(email)
 		for recipient in recipients_list:
 			if recipient.status != "Not Sent":
 				continue
 
-			message = prepare_message(email, recipient.recipient, recipients_list)
+			message = prepare_message(email, recipient.recipient, recipients_list, attachments=attachments)
 			if not frappe.flags.in_test:
 				smtpserver.sess.sendmail(email.sender, recipient.recipient, message)
 
@@ -431,12 +713,7 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 		if email.communication:
 			frappe.get_doc('Communication', email.communication).set_delivery_status(commit=auto_commit)
 
-	except (smtplib.SMTPServerDisconnected,
-			smtplib.SMTPConnectError,
-			smtplib.SMTPHeloError,
-			smtplib.SMTPAuthenticationError,
-			smtplib.SMTPRecipientsRefused,
-			JobTimeoutException):
+	except SMTP_RETRY_ERRORS:
 
 		# bad connection/timeout, retry later
 
@@ -478,7 +755,9 @@ def send_one(email, smtpserver=None, auto_commit=True, now=False, from_test=Fals
 			# log to Error Log
 			log('frappe.email.queue.flush', text_type(e))
 
-def prepare_message(email, recipient, recipients_list):
+def prepare_message(email, recipient, recipients_list, attachments=None):
+	"""Returns the message for a recipient. `attachments` can be loaded once per email
+	with `get_attachments`, and are loaded here if not given."""
 	message = email.message
 	if not message:
 		return ""
@@ -524,32 +803,11 @@ def prepare_message(email, recipient, recipients_list):
 	else:
 		message = Parser().parsestr(message)
 
-	if email.attachments:
-		# On-demand attachments
-
-		attachments = json.loads(email.attachments)
-
-		for attachment in attachments:
-			if attachment.get('fcontent'):
-				continue
+	if attachments is None:
+		attachments = get_attachments(email)
 
-			fid = attachment.get("fid")
-			if fid:
-				_file = frappe.get_doc("File", fid)
-				fcontent = _file.get_content()
-				attachment.update({
-					'fname': _file.file_name,
-					'fcontent': fcontent,
-					'parent': message
-				})
-				attachment.pop("fid", None)
-				add_attachment(**attachment)
-
-			elif attachment.get("print_format_attachment") == 1:
-				attachment.pop("print_format_attachment", None)
-				print_format_file = frappe.attach_print(**attachment)
-				print_format_file.update({"parent": message})
-				add_attachment(**print_format_file)
+	for attachment in attachments:
+		add_attachment(parent=message, **attachment)
 
 	return safe_encode(message.as_string())
 
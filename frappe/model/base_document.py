@@ -342,12 +342,16 @@ class BaseDocument(object):
 
 		self.set("__islocal", False)
 
-	def db_update(self):
+	def db_update(self, columns=None):
+		"""UPDATE the document in the database, only the given `columns` ({column: value}) if set"""
 		if self.get("__islocal") or not self.name:
 			self.db_insert()
 			return
 
-		d = self.get_valid_dict(convert_dates_to_str=True, ignore_nulls = self.doctype in ('DocType', 'DocField', 'DocPerm'))
+		if columns:
+			d = frappe._dict(columns, name=self.name)
+		else:
+			d = self.get_valid_dict(convert_dates_to_str=True, ignore_nulls = self.doctype in ('DocType', 'DocField', 'DocPerm'))
 
 		# don't update name, as case might've been changed
 		name = d['name']
@@ -367,6 +371,20 @@ class BaseDocument(object):
 			else:
 				raise
 
+	def get_changed_values(self, doc_before_save):
+		"""Returns {column: value} of the columns that differ from `doc_before_save`,
+		ignoring `modified` and `modified_by` which are set on every save"""
+		before = doc_before_save.get_valid_dict(convert_dates_to_str=True)
+		changed = frappe._dict()
+		for column, value in iteritems(self.get_valid_dict(convert_dates_to_str=True)):
+			if column not in ("name", "modified", "modified_by") and value != before.get(column):
+				changed[column] = value
+
+		if changed:
+			changed.update(modified=self.modified, modified_by=self.modified_by)
+
+		return changed
+
 	def show_unique_validation_message(self, e):
 		# TODO: Find a better way to extract fieldname
 		if frappe.db.db_type != 'postgres':
@@ -434,17 +452,9 @@ class BaseDocument(object):
 
 		return missing
 
-	def get_invalid_links(self, is_submittable=False):
-		'''Returns list of invalid links and also updates fetch values if not set'''
-		def get_msg(df, docname):
-			if self.parentfield:
-				return "{} #{}: {}: {}".format(_("Row"), self.idx, _(df.label), docname)
-			else:
-				return "{}: {}".format(_(df.label), docname)
-
-		invalid_links = []
-		cancelled_links = []
-
+	def get_link_fields_to_validate(self):
+		"""Returns (docfield, target doctype, value) of the Link and Dynamic Link fields that are set"""
+		out = []
 		for df in (self.meta.get_link_fields()
 				+ self.meta.get("fields", {"fieldtype": ('=', "Dynamic Link")})):
 			docname = self.get(df.fieldname)
@@ -459,19 +469,41 @@ class BaseDocument(object):
 					if not doctype:
 						frappe.throw(_("{0} must be set first").format(self.meta.get_label(df.options)))
 
-				# MySQL is case insensitive. Preserve case of the original docname in the Link Field.
+				out.append((df, doctype, docname))
 
-				# get a map of values ot fetch along with this link query
-				# that are mapped as link_fieldname.source_fieldname in Options of
-				# Readonly or Data or Text type fields
+		return out
 
-				fields_to_fetch = [
-					_df for _df in self.meta.get_fields_to_fetch(df.fieldname)
-					if
-						not _df.get('fetch_if_empty')
-						or (_df.get('fetch_if_empty') and not self.get(_df.fieldname))
-				]
+	def get_invalid_links(self, is_submittable=False, link_values=None):
+		'''Returns list of invalid links and also updates fetch values if not set
 
+		:param link_values: values of linked documents resolved with `get_link_values`'''
+		def get_msg(df, docname):
+			if self.parentfield:
+				return "{} #{}: {}: {}".format(_("Row"), self.idx, _(df.label), docname)
+			else:
+				return "{}: {}".format(_(df.label), docname)
+
+		invalid_links = []
+		cancelled_links = []
+
+		for df, doctype, docname in self.get_link_fields_to_validate():
+			# MySQL is case insensitive. Preserve case of the original docname in the Link Field.
+
+			# get a map of values ot fetch along with this link query
+			# that are mapped as link_fieldname.source_fieldname in Options of
+			# Readonly or Data or Text type fields
+
+			fields_to_fetch = [
+				_df for _df in self.meta.get_fields_to_fetch(df.fieldname)
+				if
+					not _df.get('fetch_if_empty')
+					or (_df.get('fetch_if_empty') and not self.get(_df.fieldname))
+			]
+
+			values = get_resolved_link(link_values, doctype, docname,
+				[_df.fetch_from.split('.')[-1] for _df in fields_to_fetch])
+
+			if values is None:
 				if not fields_to_fetch:
 					# cache a single value type
 					values = frappe._dict(name=frappe.db.get_value(doctype, docname,
@@ -484,26 +516,27 @@ class BaseDocument(object):
 					values = frappe.db.get_value(doctype, docname,
 						values_to_fetch, as_dict=True)
 
-				if frappe.get_meta(doctype).issingle:
-					values.name = doctype
+			if frappe.get_meta(doctype).issingle:
+				values.name = doctype
 
-				if values:
-					setattr(self, df.fieldname, values.name)
+			if values:
+				setattr(self, df.fieldname, values.name)
 
-					for _df in fields_to_fetch:
-						if self.is_new() or self.docstatus != 1 or _df.allow_on_submit:
-							setattr(self, _df.fieldname, values[_df.fetch_from.split('.')[-1]])
+				for _df in fields_to_fetch:
+					if self.is_new() or self.docstatus != 1 or _df.allow_on_submit:
+						setattr(self, _df.fieldname, values[_df.fetch_from.split('.')[-1]])
 
-					notify_link_count(doctype, docname)
+				notify_link_count(doctype, docname)
 
-					if not values.name:
-						invalid_links.append((df.fieldname, docname, get_msg(df, docname)))
+				if not values.name:
+					invalid_links.append((df.fieldname, docname, get_msg(df, docname)))
 
-					elif (df.fieldname != "amended_from"
-						and (is_submittable or self.meta.is_submittable) and frappe.get_meta(doctype).is_submittable
-						and cint(frappe.db.get_value(doctype, docname, "docstatus"))==2):
+				elif (df.fieldname != "amended_from"
+					and (is_submittable or self.meta.is_submittable) and frappe.get_meta(doctype).is_submittable
+					and cint(values.docstatus if "docstatus" in values
+						else frappe.db.get_value(doctype, docname, "docstatus"))==2):
 
-						cancelled_links.append((df.fieldname, docname, get_msg(df, docname)))
+					cancelled_links.append((df.fieldname, docname, get_msg(df, docname)))
 
 		return invalid_links, cancelled_links
 
@@ -814,6 +847,60 @@ class BaseDocument(object):
 			for df in self.meta.get("fields", {"fieldtype": ('=', "Text Editor")}):
 				extract_images_from_doc(self, df.fieldname)
 
+def get_link_values(docs):
+	"""Resolve the links of all the given documents with one query per linked DocType.
+
+	Returns a dict of {doctype: {name: row}}, rows have the name, docstatus (of submittable
+	DocTypes) and the fields fetched into the documents. Singles are not resolved here."""
+	to_resolve = {}
+	point_queries = 0
+	for doc in docs:
+		for df, doctype, docname in doc.get_link_fields_to_validate():
+			meta = frappe.get_meta(doctype)
+			if meta.issingle or not isinstance(docname, string_types):
+				continue
+
+			names, fields = to_resolve.setdefault(doctype, (set(), set(["name"])))
+			names.add(docname)
+			fields.update(_df.fetch_from.split('.')[-1] for _df in doc.meta.get_fields_to_fetch(df.fieldname))
+			if meta.is_submittable:
+				fields.add("docstatus")
+				point_queries += 1
+			point_queries += 1
+
+	link_values = {}
+	for doctype, (names, fields) in iteritems(to_resolve):
+		columns = frappe.db.get_table_columns(doctype)
+		fields = [f for f in fields if f in columns]
+
+		rows = link_values[doctype] = {}
+		for row in frappe.db.sql("""select {fields} from `tab{doctype}` where name in %(names)s""".format(
+				fields=", ".join("`{0}`".format(f) for f in fields), doctype=doctype),
+				{"names": tuple(names)}, as_dict=True):
+			rows[row.name] = row
+			if frappe.db.db_type != "postgres":
+				# MySQL is case insensitive, the link value may differ in case
+				rows.setdefault(row.name.lower(), row)
+
+	if to_resolve:
+		from frappe.recorder import register_saved_queries
+		register_saved_queries("link validation", point_queries - len(to_resolve))
+
+	return link_values
+
+def get_resolved_link(link_values, doctype, docname, fields):
+	"""Returns the row of a link resolved by `get_link_values`, None if it has to be queried"""
+	if link_values is None or doctype not in link_values or not isinstance(docname, string_types):
+		return None
+
+	rows = link_values[doctype]
+	row = rows.get(docname) or rows.get(docname.lower())
+	if row is None or not all(f in row for f in fields):
+		# not found in the batch (e.g. trailing spaces) or an unknown column, check it directly
+		return None
+
+	return frappe._dict(row)
+
 def _filter(data, filters, limit=None):
 	"""pass filters as:
 		{"key": "val", "key": ["!=", "val"],
@@ -126,9 +126,20 @@ class DatabaseQuery(object):
 
 		if self.return_query:
 			return query
+		elif self.use_query_cache():
+			from frappe.model.utils.query_cache import run_query
+			return run_query(self.doctype, query, as_dict=not self.as_list, update=self.update,
+				user=self.user, ignore_permissions=self.flags.ignore_permissions)
 		else:
 			return frappe.db.sql(query, as_dict=not self.as_list, debug=self.debug, update=self.update)
 
+	def use_query_cache(self):
+		if self.debug or not frappe.conf.query_cache:
+			return False
+
+		from frappe.model.utils.query_cache import get_ttl
+		return get_ttl(self.doctype) > 0
+
 	def prepare_args(self):
 		self.parse_args()
 		self.sanitize_fields()
@@ -585,6 +596,15 @@ class DatabaseQuery(object):
 			return self.match_filters
 
 	def get_share_condition(self):
+		if len(self.shared) > get_subquery_threshold():
+			# semi-join, so that the query does not grow with the number of shared documents
+			everyone = " or `tabDocShare`.`everyone`=1" if self.user != "Guest" else ""
+			return """`tab{0}`.name in (select `tabDocShare`.`share_name` from `tabDocShare`
+				where `tabDocShare`.`share_doctype`={1} and `tabDocShare`.`read`=1
+				and (`tabDocShare`.`user`={2}{3}))""".format(self.doctype,
+					frappe.db.escape(self.doctype, percent=False),
+					frappe.db.escape(self.user, percent=False), everyone)
+
 		return """`tab{0}`.name in ({1})""".format(self.doctype, ", ".join(["%s"] * len(self.shared))) % \
 			tuple([frappe.db.escape(s, percent=False) for s in self.shared])
 
@@ -634,7 +654,12 @@ class DatabaseQuery(object):
 					elif permission.get('applicable_for') == self.doctype:
 						docs.append(permission.get('doc'))
 
-				if docs:
+				if docs and len(docs) > get_subquery_threshold():
+					applicable_for = (self.reference_doctype
+						if df.get('fieldname') == 'name' and self.reference_doctype else self.doctype)
+					condition += self.get_user_permission_subquery(df, applicable_for)
+
+				elif docs:
 					condition += "`tab{doctype}`.`{fieldname}` in ({values})".format(
 						doctype=self.doctype,
 						fieldname=df.get('fieldname'),
@@ -642,6 +667,7 @@ class DatabaseQuery(object):
 							[(frappe.db.escape(doc, percent=False)) for doc in docs])
 						)
 
+				if docs:
 					match_conditions.append("({condition})".format(condition=condition))
 					match_filters[df.get('options')] = docs
 
@@ -651,6 +677,29 @@ class DatabaseQuery(object):
 		if match_filters:
 			self.match_filters.append(match_filters)
 
+	def get_user_permission_subquery(self, df, applicable_for):
+		"""Returns an `exists` condition on the User Permissions of the user for the link field,
+		equivalent to the `in` list of the permitted values (including descendants of nested sets)"""
+		allow = df.get('options')
+		field = "`tab{0}`.`{1}`".format(self.doctype, df.get('fieldname'))
+
+		if frappe.get_meta(allow).is_nested_set():
+			join = """inner join `tab{allow}` `__up_parent` on `__up_parent`.`name`=`__up`.`for_value`
+				inner join `tab{allow}` `__up_node` on `__up_node`.`lft`>=`__up_parent`.`lft`
+					and `__up_node`.`rgt`<=`__up_parent`.`rgt`""".format(allow=allow)
+			match = "`__up_node`.`name`={0}".format(field)
+		else:
+			join = ""
+			match = "`__up`.`for_value`={0}".format(field)
+
+		return """exists (select 1 from `tabUser Permission` `__up` {join}
+			where `__up`.`user`={user} and `__up`.`allow`={allow}
+			and (ifnull(`__up`.`applicable_for`, '')='' or `__up`.`applicable_for`={applicable_for})
+			and {match})""".format(join=join, match=match,
+				user=frappe.db.escape(self.user, percent=False),
+				allow=frappe.db.escape(allow, percent=False),
+				applicable_for=frappe.db.escape(applicable_for, percent=False))
+
 	def get_permission_query_conditions(self):
 		condition_methods = frappe.get_hooks("permission_query_conditions", {}).get(self.doctype, [])
 		if condition_methods:
@@ -809,6 +858,11 @@ def is_parent_only_filter(doctype, filters):
 
 	return only_parent_doctype
 
+def get_subquery_threshold():
+	"""Permitted (or shared) names are matched with a subquery instead of an `in` list above
+	`permission_subquery_threshold` names (site config)"""
+	return cint(frappe.conf.get("permission_subquery_threshold")) or 100
+
 def has_any_user_permission_for_doctype(doctype, user, applicable_for):
 	user_permissions = frappe.permissions.get_user_permissions(user=user)
 	doctype_user_permissions = user_permissions.get(doctype, [])
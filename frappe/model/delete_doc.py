@@ -16,6 +16,8 @@ from frappe.core.doctype.file.file import remove_all
 from frappe.utils.password import delete_all_passwords_for
 from frappe.model.naming import revert_series_if_last
 from frappe.utils.global_search import delete_for_document
+from frappe.desk.link_search import delete_from_link_search_index
+from frappe.share import clear_shared_cache
 from frappe.desk.doctype.tag.tag import delete_tags_for_document
 from frappe.exceptions import FileNotFoundError
 
@@ -116,8 +118,11 @@ def delete_doc(doctype=None, name=None, force=0, ignore_doctypes=None, for_reloa
 					is_async=False if frappe.flags.in_test else True)
 
 
+		frappe.clear_document_cache(doctype, name)
+
 		# delete global search entry
 		delete_for_document(doc)
+		delete_from_link_search_index(doctype, name)
 		# delete tag link entry
 		delete_tags_for_document(doc)
 
@@ -302,6 +307,7 @@ def delete_dynamic_links(doctype, name):
 	delete_references('ToDo', doctype, name, 'reference_type')
 	delete_references('Email Unsubscribe', doctype, name)
 	delete_references('DocShare', doctype, name, 'share_doctype', 'share_name')
+	clear_shared_cache(doctype)
 	delete_references('Version', doctype, name, 'ref_doctype', 'docname')
 	delete_references('Comment', doctype, name)
 	delete_references('View Log', doctype, name)
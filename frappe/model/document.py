@@ -7,7 +7,7 @@ import time
 from frappe import _, msgprint
 from frappe.utils import flt, cstr, now, get_datetime_str, file_lock, date_diff
 from frappe.utils.background_jobs import enqueue
-from frappe.model.base_document import BaseDocument, get_controller
+from frappe.model.base_document import BaseDocument, get_controller, get_link_values
 from frappe.model.naming import set_new_name
 from six import iteritems, string_types
 from werkzeug.exceptions import NotFound, Forbidden
@@ -16,6 +16,7 @@ from frappe.model import optional_fields, table_fields
 from frappe.model.workflow import validate_workflow
 from frappe.model.workflow import set_workflow_state_on_action
 from frappe.utils.global_search import update_global_search
+from frappe.desk.link_search import update_link_search_index
 from frappe.integrations.doctype.webhook import run_webhooks
 from frappe.desk.form.document_follow import follow_document
 from frappe.core.doctype.server_script.server_script_utils import run_server_script_for_doc_event
@@ -72,6 +73,109 @@ def get_doc(*args, **kwargs):
 
 	raise ImportError(doctype)
 
+def get_docs(doctype, names):
+	"""Returns a list of documents (with child tables) of the given names, in the same order.
+
+	Loads all the parents with one query and the rows of each child DocType with one query,
+	instead of 1 + number of table fields queries per document.
+
+		invoices = get_docs("Sales Invoice", ["SINV-0001", "SINV-0002"])
+	"""
+	names = list(dict.fromkeys(names))
+	meta = frappe.get_meta(doctype)
+	if meta.issingle or doctype == "DocType":
+		return [get_doc(doctype, name) for name in names]
+
+	if not names:
+		return []
+
+	rows = {}
+	for row in frappe.db.sql("""select * from `tab{0}` where name in %(names)s""".format(doctype),
+		{"names": tuple(names)}, as_dict=True):
+		rows[row.name] = row
+		if frappe.db.db_type != "postgres":
+			# MySQL is case insensitive
+			rows.setdefault(row.name.lower(), row)
+
+	missing = [name for name in names if name not in rows and cstr(name).lower() not in rows]
+	if missing:
+		frappe.throw(_("{0} {1} not found").format(_(doctype), ", ".join(missing)), frappe.DoesNotExistError)
+
+	from frappe.model.meta import prefetch_meta
+	table_fields = meta.get_table_fields()
+	prefetch_meta([df.options for df in table_fields])
+
+	parent_rows = [rows.get(name) or rows.get(cstr(name).lower()) for name in names]
+	child_rows = get_child_rows(doctype, [row.name for row in parent_rows], table_fields)
+
+	controller = get_controller(doctype)
+	docs = []
+	for row in parent_rows:
+		doc = controller.__new__(controller)
+		doc.doctype, doc.name = doctype, row.name
+		doc._default_new_docs = {}
+		doc.flags = frappe._dict()
+		BaseDocument.__init__(doc, row)
+		doc.load_children(child_rows, table_fields)
+		docs.append(doc)
+
+	return docs
+
+def get_child_rows(parenttype, parents, table_fields):
+	"""Returns child rows of the given parents as {(parent, parentfield): [rows]},
+	with one query per child DocType"""
+	fields_by_doctype = {}
+	for df in table_fields:
+		fields_by_doctype.setdefault(df.options, []).append(df.fieldname)
+
+	child_rows = {}
+	for child_doctype, fieldnames in iteritems(fields_by_doctype):
+		for row in frappe.db.sql("""select * from `tab{0}`
+			where parenttype=%(parenttype)s and parent in %(parents)s and parentfield in %(fieldnames)s
+			order by idx asc""".format(child_doctype),
+			{"parenttype": parenttype, "parents": tuple(parents), "fieldnames": tuple(fieldnames)}, as_dict=True):
+			child_rows.setdefault((row.parent, row.parentfield), []).append(row)
+
+	return child_rows
+
+def db_insert_rows(rows):
+	"""INSERT new child rows with one multi-row `INSERT` per child DocType. Falls back to
+	`db_insert` per row for the rows of DocTypes that skip null values and on errors
+	(duplicate names, unique constraints) to handle them like a single insert."""
+	rows_by_doctype = {}
+	for d in rows:
+		if not d.name:
+			set_new_name(d)
+		rows_by_doctype.setdefault(d.doctype, []).append(d)
+
+	for doctype, doctype_rows in iteritems(rows_by_doctype):
+		if doctype in ('DocType', 'DocField', 'DocPerm') or len(doctype_rows) == 1:
+			for d in doctype_rows:
+				d.db_insert()
+			continue
+
+		for d in doctype_rows:
+			if not d.creation:
+				d.creation = d.modified = now()
+				d.created_by = d.modified_by = frappe.session.user
+
+		values = [d.get_valid_dict(convert_dates_to_str=True) for d in doctype_rows]
+		columns = list(values[0])
+
+		# a failed statement aborts the whole transaction on Postgres, and the chunks
+		# inserted before it must not be inserted again
+		frappe.db.savepoint("db_insert_rows")
+		try:
+			frappe.db.bulk_insert(doctype, columns, [list(v.values()) for v in values])
+		except Exception:
+			frappe.db.rollback(save_point="db_insert_rows")
+			for d in doctype_rows:
+				d.db_insert()
+			continue
+
+		for d in doctype_rows:
+			d.set("__islocal", False)
+
 class Document(BaseDocument):
 	"""All controllers inherit from `Document`."""
 	def __init__(self, *args, **kwargs):
@@ -154,16 +258,25 @@ class Document(BaseDocument):
 			from frappe.model.meta import doctype_table_fields
 			table_fields = doctype_table_fields
 		else:
+			from frappe.model.meta import prefetch_meta
 			table_fields = self.meta.get_table_fields()
+			prefetch_meta([df.options for df in table_fields])
 
+		self.load_children(get_child_rows(self.doctype, [self.name], table_fields), table_fields)
+
+	def load_children(self, child_rows, table_fields):
+		"""Set child tables from rows returned by `get_child_rows`"""
 		for df in table_fields:
-			children = frappe.db.get_values(df.options,
-				{"parent": self.name, "parenttype": self.doctype, "parentfield": df.fieldname},
-				"*", as_dict=True, order_by="idx asc")
-			if children:
-				self.set(df.fieldname, children)
-			else:
-				self.set(df.fieldname, [])
+			child_class = get_controller(df.options)
+			children = []
+			for row in child_rows.get((self.name, df.fieldname), ()):
+				# rows come with parent, parenttype, parentfield and idx, skip `_init_child`
+				row.doctype = df.options
+				child = child_class(row)
+				child.parent_doc = self
+				children.append(child)
+
+			self.__dict__[df.fieldname] = children
 
 		# sometimes __setup__ can depend on child values, hence calling again at the end
 		if hasattr(self, "__setup__"):
@@ -248,8 +361,7 @@ class Document(BaseDocument):
 					raise e
 
 		# children
-		for d in self.get_all_children():
-			d.db_insert()
+		db_insert_rows(self.get_all_children())
 
 		self.run_method("after_insert")
 		self.flags.in_insert = True
@@ -322,7 +434,7 @@ class Document(BaseDocument):
 		else:
 			self.db_update()
 
-		self.update_children()
+		self.update_children(self.get_doc_before_save())
 		self.run_post_save_methods()
 
 		return self
@@ -345,43 +457,88 @@ class Document(BaseDocument):
 			_file.save()
 
 
-	def update_children(self):
-		'''update child tables'''
+	def update_children(self, doc_before_save=None):
+		'''update child tables
+
+		:param doc_before_save: if given, only rows changed since are written'''
+		self.flags.child_rows_written = frappe._dict(inserted=0, updated=0, deleted=0, unchanged=0)
 		for df in self.meta.get_table_fields():
-			self.update_child_table(df.fieldname, df)
+			self.update_child_table(df.fieldname, df, doc_before_save=doc_before_save)
 
-	def update_child_table(self, fieldname, df=None):
+		if doc_before_save:
+			from frappe.recorder import register_saved_queries
+			register_saved_queries("unchanged child rows", self.flags.child_rows_written.unchanged)
+
+	def update_child_table(self, fieldname, df=None, doc_before_save=None):
 		'''sync child table for given fieldname'''
-		rows = []
+		new_rows = []
 		if not df:
 			df = self.meta.get_field(fieldname)
 
+		counts = self.flags.child_rows_written
+		if counts is None:
+			counts = self.flags.child_rows_written = frappe._dict(inserted=0, updated=0, deleted=0, unchanged=0)
+
+		rows_before_save = None
+		if doc_before_save:
+			rows_before_save = {d.name: d for d in doc_before_save.get(df.fieldname)}
+
 		for d in self.get(df.fieldname):
-			d.db_update()
-			rows.append(d.name)
+			if d.get("__islocal") or not d.name:
+				new_rows.append(d)
+			elif rows_before_save is not None and d.name in rows_before_save:
+				changed = d.get_changed_values(rows_before_save[d.name])
+				if changed:
+					d.db_update(columns=changed)
+					counts.updated += 1
+				else:
+					counts.unchanged += 1
+			else:
+				d.db_update()
+				counts.updated += 1
+
+		if new_rows:
+			db_insert_rows(new_rows)
+			counts.inserted += len(new_rows)
+
+		rows = [d.name for d in self.get(df.fieldname)]
 
 		if df.options in (self.flags.ignore_children_type or []):
 			# do not delete rows for this because of flags
 			# hack for docperm :(
 			return
 
-		if rows:
+		if rows_before_save is not None:
+			# rows that were loaded before save but are not in the document anymore
+			# (rows moved to another table field of the same child doctype are kept)
+			all_rows = set(d.name for d in self.get_all_children() if d.doctype == df.options)
+			deleted_rows = [name for name in rows_before_save if name not in rows and name not in all_rows]
+			if deleted_rows:
+				frappe.db.sql("""delete from `tab{0}` where name in ({1})""".format(df.options,
+					','.join(['%s'] * len(deleted_rows))), tuple(deleted_rows))
+
+		elif rows:
 			# select rows that do not match the ones in the document
-			deleted_rows = frappe.db.sql("""select name from `tab{0}` where parent=%s
+			deleted_rows = [row[0] for row in frappe.db.sql("""select name from `tab{0}` where parent=%s
 				and parenttype=%s and parentfield=%s
 				and name not in ({1})""".format(df.options, ','.join(['%s'] * len(rows))),
-					[self.name, self.doctype, fieldname] + rows)
+					[self.name, self.doctype, fieldname] + rows)]
 			if len(deleted_rows) > 0:
 				# delete rows that do not match the ones in the document
 				frappe.db.sql("""delete from `tab{0}` where name in ({1})""".format(df.options,
-					','.join(['%s'] * len(deleted_rows))), tuple(row[0] for row in deleted_rows))
+					','.join(['%s'] * len(deleted_rows))), tuple(deleted_rows))
 
 		else:
 			# no rows found, delete all rows
+			deleted_rows = frappe.db.sql("""select name from `tab{0}` where parent=%s
+				and parenttype=%s and parentfield=%s""".format(df.options),
+				(self.name, self.doctype, fieldname))
 			frappe.db.sql("""delete from `tab{0}` where parent=%s
 				and parenttype=%s and parentfield=%s""".format(df.options),
 				(self.name, self.doctype, fieldname))
 
+		counts.deleted += len(deleted_rows)
+
 	def get_doc_before_save(self):
 		return getattr(self, '_doc_before_save', None)
 
@@ -584,12 +741,12 @@ class Document(BaseDocument):
 			self._has_access_to = {}
 
 		if not self._has_access_to.get(permission_type):
-			self._has_access_to[permission_type] = []
-			roles = frappe.get_roles()
-			for perm in self.get_permissions():
-				if perm.role in roles and perm.permlevel > 0 and perm.get(permission_type):
-					if perm.permlevel not in self._has_access_to[permission_type]:
-						self._has_access_to[permission_type].append(perm.permlevel)
+			from frappe.permissions import get_permission_table
+
+			# child tables use parent permissions
+			meta = frappe.get_meta(self.parenttype) if self.meta.istable else self.meta
+			permlevel_access = get_permission_table(meta).permlevel_access
+			self._has_access_to[permission_type] = list(permlevel_access.get(permission_type, []))
 
 		return self._has_access_to[permission_type]
 
@@ -750,10 +907,16 @@ class Document(BaseDocument):
 		if self.flags.ignore_links or self._action == "cancel":
 			return
 
-		invalid_links, cancelled_links = self.get_invalid_links()
+		children = self.get_all_children()
 
-		for d in self.get_all_children():
-			result = d.get_invalid_links(is_submittable=self.meta.is_submittable)
+		# resolve the links of the parent and all rows with one query per linked doctype,
+		# unless they were resolved for a batch of documents (data import)
+		link_values = self.flags.link_values or get_link_values([self] + children)
+
+		invalid_links, cancelled_links = self.get_invalid_links(link_values=link_values)
+
+		for d in children:
+			result = d.get_invalid_links(is_submittable=self.meta.is_submittable, link_values=link_values)
 			invalid_links.extend(result[0])
 			cancelled_links.extend(result[1])
 
@@ -939,6 +1102,7 @@ class Document(BaseDocument):
 		self.notify_update()
 
 		update_global_search(self)
+		update_link_search_index(self)
 
 		if getattr(self.meta, 'track_changes', False) and self._doc_before_save and not self.flags.ignore_version:
 			self.save_version()
@@ -1022,11 +1186,8 @@ class Document(BaseDocument):
 
 	def save_version(self):
 		'''Save version info'''
-		version = frappe.new_doc('Version')
-		if version.set_diff(self._doc_before_save, self):
-			version.insert(ignore_permissions=True)
-			if not frappe.flags.in_migrate:
-				follow_document(self.doctype, self.name, frappe.session.user)
+		from frappe.core.doctype.version.version import add_version
+		add_version(self._doc_before_save, self)
 
 	@staticmethod
 	def hook(f):
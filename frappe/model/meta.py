@@ -18,6 +18,7 @@ Example:
 from __future__ import unicode_literals, print_function
 from datetime import datetime
 from six.moves import range
+from six import iteritems
 import frappe, json, os
 from frappe.utils import cstr, cint
 from frappe.model import default_fields, no_value_fields, optional_fields, data_fieldtypes, table_fields
@@ -42,6 +43,17 @@ def get_meta(doctype, cached=True):
 	else:
 		return load_meta(doctype)
 
+def prefetch_meta(doctypes):
+	"""Load cached metas of the given doctypes with a single round trip to redis,
+	so that subsequent `get_meta` calls are served from `frappe.local.meta_cache`"""
+	doctypes = [d for d in set(doctypes) if d and not frappe.local.meta_cache.get(d)]
+	if not doctypes:
+		return
+
+	for doctype, meta in iteritems(frappe.cache().hget_many("meta", doctypes)):
+		if meta:
+			frappe.local.meta_cache[doctype] = Meta(meta)
+
 def load_meta(doctype):
 	return Meta(doctype)
 
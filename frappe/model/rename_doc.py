@@ -9,6 +9,8 @@ from frappe.model.naming import validate_name
 from frappe.model.dynamic_links import get_dynamic_link_map
 from frappe.utils.password import rename_password
 from frappe.model.utils.user_settings import sync_user_settings, update_user_settings_data
+from frappe.desk.link_search import delete_from_link_search_index, update_link_search_index
+from frappe.share import clear_shared_cache
 
 
 @frappe.whitelist()
@@ -57,11 +59,14 @@ def rename_doc(doctype, old, new, force=False, merge=False, ignore_permissions=F
 	if not merge:
 		rename_parent_and_child(doctype, old, new, meta)
 
+	frappe.clear_document_cache(doctype, old)
+
 	# update link fields' values
 	link_fields = get_link_fields(doctype)
 	update_link_field_values(link_fields, old, new, doctype)
 
 	rename_dynamic_links(doctype, old, new)
+	clear_shared_cache(doctype)
 
 	# save the user settings in the db
 	update_user_settings(old, new, link_fields)
@@ -81,6 +86,9 @@ def rename_doc(doctype, old, new, force=False, merge=False, ignore_permissions=F
 
 	new_doc.run_method("after_rename", old, new, merge)
 
+	delete_from_link_search_index(doctype, old)
+	update_link_search_index(new_doc)
+
 	if not merge:
 		rename_password(doctype, old, new)
 
@@ -0,0 +1,251 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Cache of documents for `frappe.get_cached_doc` / `frappe.get_cached_value`, keyed by
+(doctype, name) and versioned by the writers of the document.
+
+Documents are cached for the current request and in Redis. DocTypes can be opted in to an
+LRU cache local to the worker process with the time to live of their documents in seconds:
+
+	"document_cache": {"Item": 300, "*": 60, "Communication": 0}
+
+`0` disables caching for a DocType (except for the current request). Other DocTypes are only
+cached in Redis, for `document_cache_ttl` seconds (default 3600). `document_cache_size` is the
+max number of documents kept in the process cache (default 1000).
+
+Redis keeps a version of every written document in a hash. Saving, deleting or renaming a
+document bumps its version, and again once the transaction is committed. Readers read the
+version before loading the document from the database and only cache it if the version is still
+the same (check-and-set), so a document loaded before the writer's commit is never cached as
+current. Cached documents (in Redis and in processes) are only used while their version matches.
+
+`get_doc` builds a new Document from the cached values on every call, so changes made by the
+caller never end up in the cache."""
+
+from __future__ import unicode_literals
+
+import copy
+import threading
+import redis
+import frappe
+from collections import OrderedDict
+from time import time
+from six.moves import cPickle as pickle
+from frappe.utils import cint, cstr
+
+versions_key = "document_cache_version"
+# field of the versions hash changed when all documents are invalidated
+generation_field = "__generation"
+default_ttl = 3600
+default_size = 1000
+
+# caches the document only if its version (and the generation) is still the one seen before it
+# was loaded from the database
+set_if_unchanged_script = """
+local version = redis.call('hget', KEYS[1], ARGV[1]) or ''
+local generation = redis.call('hget', KEYS[1], ARGV[2]) or ''
+if generation .. ':' .. version ~= ARGV[3] then
+	return 0
+end
+redis.call('set', KEYS[2], ARGV[4], 'EX', ARGV[5])
+return 1
+"""
+
+
+class ProcessDocumentCache(object):
+	"""Bounded LRU of documents as (version, pickled values, expires at)"""
+	def __init__(self):
+		self.data = OrderedDict()
+		self.lock = threading.Lock()
+
+	def get(self, key):
+		with self.lock:
+			entry = self.data.get(key)
+			if entry and entry[2] < time():
+				del self.data[key]
+				entry = None
+
+			if entry:
+				self.data.move_to_end(key)
+			return entry
+
+	def set(self, key, version, payload, ttl):
+		size = cint(frappe.conf.get("document_cache_size")) or default_size
+		with self.lock:
+			self.data[key] = (version, payload, time() + ttl)
+			self.data.move_to_end(key)
+			while len(self.data) > size:
+				self.data.popitem(last=False)
+
+	def delete(self, key):
+		with self.lock:
+			self.data.pop(key, None)
+
+	def clear(self, site):
+		with self.lock:
+			for key in list(self.data):
+				if key[0] == site:
+					del self.data[key]
+
+process_documents = ProcessDocumentCache()
+
+# lookups of this process, by the tier that served them
+stats = frappe._dict(request=0, process=0, redis=0, database=0)
+
+def get_policy(doctype):
+	"""Returns the TTL set for the DocType in `document_cache`, None if not set"""
+	settings = frappe.conf.get("document_cache") or {}
+	ttl = settings.get(doctype, settings.get("*"))
+	return None if ttl is None else cint(ttl)
+
+def get_ttl(doctype):
+	"""Returns the time to live of the DocType's documents in Redis, 0 if they are not cached"""
+	ttl = get_policy(doctype)
+	if ttl is None:
+		return cint(frappe.conf.get("document_cache_ttl")) or default_ttl
+	return ttl
+
+def use_process_cache(doctype):
+	return (get_policy(doctype) or 0) > 0
+
+def get_doc(doctype, name):
+	"""Returns a new Document of the cached values, loading them on a miss"""
+	values, doc = get_cached_values(doctype, name)
+	return doc or frappe.get_doc(values)
+
+def get_values(doctype, name, fieldnames):
+	"""Returns the values of the given fields of the cached document"""
+	values = get_cached_values(doctype, name)[0]
+
+	# child tables are lists shared with the cache
+	return [copy.deepcopy(v) if isinstance(v, list) else v
+		for v in (values.get(f) for f in fieldnames)]
+
+def get_cached_values(doctype, name):
+	"""Returns `(values, doc)`, `doc` is the Document if it was loaded from the database.
+	`values` are shared with the cache and must not be modified."""
+	key = frappe.get_document_cache_key(doctype, name)
+	values = frappe.local.document_cache.get(key)
+	if values is not None:
+		stats.request += 1
+		return values, None
+
+	# singles are written to `tabSingles` without the modified timestamp of the document
+	ttl = 0 if frappe.get_meta(doctype).issingle else get_ttl(doctype)
+
+	doc = None
+	values, version = get_shared(doctype, key) if ttl else (None, None)
+	if values is None:
+		from frappe.model import document
+		doc = document.get_doc(doctype, name)
+		values = doc.as_dict()
+		stats.database += 1
+		if version is not None:
+			set_shared(doctype, key, values, ttl, version)
+
+	frappe.local.document_cache[key] = values
+	return values, doc
+
+def get_shared(doctype, key):
+	"""Returns `(values, version)`, the current version of the document is returned if it is
+	not cached (None if Redis is not available)"""
+	cache = frappe.cache()
+	process_key = (frappe.conf.db_name, key)
+	entry = process_documents.get(process_key) if use_process_cache(doctype) else None
+
+	try:
+		if entry:
+			version = get_version(cache, key)
+			if entry[0] == version:
+				stats.process += 1
+				return pickle.loads(entry[1]), version
+
+		pipe = cache.pipeline()
+		pipe.hmget(cache.make_key(versions_key), [key, generation_field])
+		pipe.get(cache.make_key("document_cache::" + key))
+		(version, generation), payload = pipe.execute()
+	except redis.exceptions.ConnectionError:
+		return None, None
+
+	version = "{0}:{1}".format(cstr(generation), cstr(version))
+	if payload is None:
+		return None, version
+
+	cached_version, values = pickle.loads(payload)
+	if cached_version != version:
+		return None, version
+
+	if use_process_cache(doctype):
+		process_documents.set(process_key, version, pickle.dumps(values), get_ttl(doctype))
+
+	stats.redis += 1
+	return values, version
+
+def get_version(cache, key):
+	version, generation = redis.Redis.hmget(cache, cache.make_key(versions_key), [key, generation_field])
+	return "{0}:{1}".format(cstr(generation), cstr(version))
+
+def set_shared(doctype, key, values, ttl, version):
+	"""Cache the values if the document's version is still `version`"""
+	# uncommitted changes must not be visible to other requests
+	db = getattr(frappe.local, "db", None)
+	if db and key in db.invalidated_documents:
+		return
+
+	cache = frappe.cache()
+	try:
+		stored = cache.register_script(set_if_unchanged_script)(
+			keys=[cache.make_key(versions_key), cache.make_key("document_cache::" + key)],
+			args=[key, generation_field, version, pickle.dumps((version, values)), ttl])
+	except redis.exceptions.ConnectionError:
+		return
+
+	if stored and use_process_cache(doctype):
+		process_documents.set((frappe.conf.db_name, key), version, pickle.dumps(values), ttl)
+
+def invalidate(doctype, name):
+	"""Remove the document from all tiers, called when the document is written"""
+	key = frappe.get_document_cache_key(doctype, name)
+	frappe.local.document_cache.pop(key, None)
+
+	db = getattr(frappe.local, "db", None)
+	if db:
+		db.invalidated_documents.add(key)
+
+	delete([key])
+
+def delete(keys):
+	"""Bump the versions of the documents of the given cache keys and remove them from Redis and
+	the process cache"""
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	for key in keys:
+		pipe.hincrby(cache.make_key(versions_key), key, 1)
+	pipe.delete(*[cache.make_key("document_cache::" + key) for key in keys])
+	try:
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		pass
+
+	for key in keys:
+		process_documents.delete((frappe.conf.db_name, key))
+
+def clear():
+	"""Invalidate all cached documents of the site. Documents left in Redis can't be used
+	with the new generation and expire with their TTL."""
+	frappe.local.document_cache = {}
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	pipe.delete(cache.make_key(versions_key))
+	pipe.hset(cache.make_key(versions_key), generation_field, frappe.generate_hash(length=10))
+	try:
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		pass
+	process_documents.clear(frappe.conf.db_name)
+
+def get_stats():
+	"""Returns the lookups of this process served by each tier"""
+	lookups = sum(stats.values())
+	return dict(stats, size=len(process_documents.data),
+		hit_rate=round((lookups - stats.database) * 100.0 / lookups, 2) if lookups else 0)
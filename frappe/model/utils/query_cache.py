@@ -0,0 +1,114 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+
+"""Result cache for `DatabaseQuery` (`frappe.get_list` / `frappe.get_all`).
+
+Enabled per DocType in site config, with the time to live of results in seconds:
+
+	"query_cache": {"Item": 300, "Customer": 60}
+
+The key `"*"` sets a TTL for all DocTypes. Results are keyed on the query, the roles of the
+user and the version of every table in the query. Table versions are bumped on commit for
+each table written in the transaction, so any write makes the cached results stale.
+
+A transaction reads from the snapshot it started with, so the cache is not used once a table
+of the query is bumped after the transaction started."""
+
+from __future__ import unicode_literals
+
+import re
+import hashlib
+import redis
+import frappe
+from six.moves import cPickle as pickle
+from frappe.utils import cint, cstr
+
+versions_key = "table_versions"
+stats_key = "query_cache_stats"
+
+def is_enabled():
+	return bool(frappe.conf.get("query_cache"))
+
+def get_ttl(doctype):
+	settings = frappe.conf.get("query_cache") or {}
+	return cint(settings.get(doctype) or settings.get("*"))
+
+def run_query(doctype, query, as_dict=True, update=None, user=None, ignore_permissions=False):
+	"""Returns the result of `query`, from the cache if it was already run with the same
+	table versions"""
+	cache = frappe.cache()
+
+	# all tables of the query, including the ones in sub queries
+	tables = sorted(set(re.findall(r'`(tab[^`]+)`', query)))
+
+	# uncommitted writes of this transaction are not reflected in the table versions yet
+	if frappe.db.touched_tables.intersection(tables):
+		return frappe.db.sql(query, as_dict=as_dict, update=update)
+
+	# versions are bumped by other processes, always read them from redis
+	versions = [cstr(v) for v in cache.hmget(cache.make_key(versions_key), tables)] if tables else []
+
+	# committed after this transaction started, the result would be stale under the new versions
+	start_versions = frappe.db.table_versions or {}
+	if versions != [start_versions.get(table, "") for table in tables]:
+		return frappe.db.sql(query, as_dict=as_dict, update=update)
+
+	fingerprint = "" if ignore_permissions else ",".join(sorted(frappe.get_roles(user)))
+	key = cache.make_key("query_cache:" + hashlib.sha1(frappe.safe_encode(cstr([query, as_dict,
+		update, fingerprint, versions]))).hexdigest())
+
+	stats_name = cache.make_key(stats_key)
+	pipe = cache.pipeline()
+	pipe.get(key)
+	pipe.hincrby(stats_name, doctype + ":lookups", 1)
+	result = pipe.execute()[0]
+
+	if result is not None:
+		return pickle.loads(result)
+
+	result = frappe.db.sql(query, as_dict=as_dict, update=update)
+
+	pipe = cache.pipeline()
+	pipe.set(key, pickle.dumps(result), ex=get_ttl(doctype))
+	pipe.hincrby(stats_name, doctype + ":misses", 1)
+	pipe.execute()
+
+	return result
+
+def get_table_versions():
+	"""Returns the current version of all tables"""
+	cache = frappe.cache()
+	try:
+		versions = redis.Redis.hgetall(cache, cache.make_key(versions_key)) or {}
+	except redis.exceptions.ConnectionError:
+		return {}
+
+	return {cstr(table): cstr(version) for table, version in versions.items()}
+
+def bump_table_versions(tables):
+	"""Invalidate cached results of queries on the given tables (called on commit)"""
+	cache = frappe.cache()
+	name = cache.make_key(versions_key)
+
+	pipe = cache.pipeline()
+	for table in tables:
+		pipe.hincrby(name, table, 1)
+	try:
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		pass
+
+def get_stats():
+	"""Returns lookups, misses and hit rate of the query cache per DocType"""
+	stats = {}
+	cache = frappe.cache()
+	for key, value in (redis.Redis.hgetall(cache, cache.make_key(stats_key)) or {}).items():
+		doctype, counter = cstr(key).rsplit(":", 1)
+		stats.setdefault(doctype, {"lookups": 0, "misses": 0})[counter] = cint(value)
+
+	for doctype_stats in stats.values():
+		lookups = doctype_stats["lookups"]
+		doctype_stats["hits"] = lookups - doctype_stats["misses"]
+		doctype_stats["hit_rate"] = round(doctype_stats["hits"] * 100.0 / lookups, 2) if lookups else 0
+
+	return stats
@@ -81,6 +81,17 @@ class Monitor:
 				self.data.request.status_code = response.status_code
 				self.data.request.response_length = int(response.headers["Content-Length"])
 
+			if frappe.cache().use_process_cache("meta"):
+				self.data.process_cache = frappe.cache().get_process_cache_stats()
+
+			if frappe.conf.document_cache:
+				from frappe.model.utils.document_cache import get_stats
+				self.data.document_cache = get_stats()
+
+			if frappe.conf.db_connection_pool:
+				from frappe.database.pool import get_stats
+				self.data.db_connection_pool = get_stats()
+
 			self.store()
 		except Exception:
 			traceback.print_exc()
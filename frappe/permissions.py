@@ -3,13 +3,16 @@
 
 from __future__ import unicode_literals, print_function
 from six import string_types
-import frappe, copy, json
+import frappe, copy, json, hashlib
 from frappe import _, msgprint
 from frappe.utils import cint
 import frappe.share
 rights = ("read", "write", "create", "delete", "submit", "cancel", "amend",
 	"print", "email", "report", "import", "export", "set_user_permissions", "share")
 
+# compiled permission tables kept per DocType
+max_role_sets = 100
+
 # TODO:
 
 # optimize: meta.get_link_map (check if the doctype link exists for the given permission type)
@@ -167,38 +170,71 @@ def get_role_permissions(doctype_meta, user=None):
 		return allow_everything()
 
 	if not frappe.local.role_permissions.get(cache_key):
-		perms = frappe._dict(
-			if_owner={}
-		)
-
-		roles = frappe.get_roles(user)
-
-		def is_perm_applicable(perm):
-			return perm.role in roles and cint(perm.permlevel)==0
+		frappe.local.role_permissions[cache_key] = get_permission_table(doctype_meta, user).rights
 
-		def has_permission_without_if_owner_enabled(ptype):
-			return any(p.get(ptype, 0) and not p.get('if_owner', 0) for p in applicable_permissions)
-
-		applicable_permissions = list(filter(is_perm_applicable, getattr(doctype_meta, 'permissions', [])))
-		has_if_owner_enabled = any(p.get('if_owner', 0) for p in applicable_permissions)
-
-		for ptype in rights:
-			pvalue = any(p.get(ptype, 0) for p in applicable_permissions)
-			# check if any perm object allows perm type
-			perms[ptype] = cint(pvalue)
-			if (pvalue
-				and has_if_owner_enabled
-				and not has_permission_without_if_owner_enabled(ptype)
-				and ptype != 'create'):
-				perms['if_owner'][ptype] = 1
-				# has no access if not owner
-				# only provide read access so that user is able to at-least access list
-				# (and the documents will be filtered based on owner sin further checks)
-				perms[ptype] = 1 if ptype == 'read' else 0
+	return frappe.local.role_permissions[cache_key]
 
-		frappe.local.role_permissions[cache_key] = perms
+def get_permission_table(doctype_meta, user=None):
+	"""Returns the permissions of the user's set of roles for the DocType, compiled once per
+	role set and cached in the `role_permissions` hash (cleared with the DocType's cache):
 
-	return frappe.local.role_permissions[cache_key]
+		{
+			"rights": {...}, // as returned by `get_role_permissions`
+			"permlevel_access": {"read": [1, 2], "write": [1]} // permlevels above 0
+		}
+	"""
+	if isinstance(doctype_meta, string_types):
+		doctype_meta = frappe.get_meta(doctype_meta)
+
+	roles = sorted(set(frappe.get_roles(user)))
+	roles_key = hashlib.md5(frappe.safe_encode(",".join(roles))).hexdigest()
+
+	tables = frappe.cache().hget("role_permissions", doctype_meta.name) or {}
+	table = tables.get(roles_key)
+	if table is None:
+		table = compile_permission_table(doctype_meta, roles)
+		if len(tables) >= max_role_sets:
+			tables = {}
+		tables[roles_key] = table
+		frappe.cache().hset("role_permissions", doctype_meta.name, tables)
+
+	return table
+
+def compile_permission_table(doctype_meta, roles):
+	perms = frappe._dict(
+		if_owner={}
+	)
+
+	def has_permission_without_if_owner_enabled(ptype):
+		return any(p.get(ptype, 0) and not p.get('if_owner', 0) for p in applicable_permissions)
+
+	all_permissions = [p for p in getattr(doctype_meta, 'permissions', []) if p.role in roles]
+	applicable_permissions = [p for p in all_permissions if cint(p.permlevel)==0]
+	has_if_owner_enabled = any(p.get('if_owner', 0) for p in applicable_permissions)
+
+	for ptype in rights:
+		pvalue = any(p.get(ptype, 0) for p in applicable_permissions)
+		# check if any perm object allows perm type
+		perms[ptype] = cint(pvalue)
+		if (pvalue
+			and has_if_owner_enabled
+			and not has_permission_without_if_owner_enabled(ptype)
+			and ptype != 'create'):
+			perms['if_owner'][ptype] = 1
+			# has no access if not owner
+			# only provide read access so that user is able to at-least access list
+			# (and the documents will be filtered based on owner sin further checks)
+			perms[ptype] = 1 if ptype == 'read' else 0
+
+	permlevel_access = {}
+	for p in all_permissions:
+		if cint(p.permlevel) > 0:
+			for ptype in rights:
+				levels = permlevel_access.setdefault(ptype, [])
+				if p.get(ptype) and p.permlevel not in levels:
+					levels.append(p.permlevel)
+
+	return frappe._dict(rights=perms, permlevel_access=permlevel_access)
 
 def get_user_permissions(user):
 	from frappe.core.doctype.user_permission.user_permission import get_user_permissions
@@ -56,6 +56,12 @@ def sql(*args, **kwargs):
 	return result
 
 
+def register_saved_queries(label, count):
+	"""Count queries avoided by batching (e.g. link validation) in the current recording"""
+	if hasattr(frappe.local, "_recorder") and count > 0:
+		frappe.local._recorder.saved_queries[label] += count
+
+
 def get_current_stack_frames():
 	current = inspect.currentframe()
 	frames = inspect.getouterframes(current, context=10)
@@ -88,6 +94,7 @@ class Recorder():
 		self.uuid = frappe.generate_hash(length=10)
 		self.time = datetime.datetime.now()
 		self.calls = []
+		self.saved_queries = Counter()
 		self.path = frappe.request.path
 		self.cmd = frappe.local.form_dict.cmd or ""
 		self.method = frappe.request.method
@@ -105,6 +112,7 @@ class Recorder():
 			"cmd": self.cmd,
 			"time": self.time,
 			"queries": len(self.calls),
+			"saved_queries": dict(self.saved_queries),
 			"time_queries": float("{:0.3f}".format(sum(call["duration"] for call in self.calls))),
 			"duration": float("{:0.3f}".format((datetime.datetime.now() - self.time).total_seconds() * 1000)),
 			"method": self.method,
@@ -8,7 +8,7 @@ Boot session from cache or build
 Session bootstraps info needed by common client side activities including
 permission, homepage, default variables, system defaults etc
 """
-import frappe, json
+import frappe, json, ast
 from frappe import _
 import frappe.utils
 from frappe.utils import cint, cstr
@@ -18,9 +18,13 @@ import frappe.translate
 from frappe.utils.change_log import get_change_log
 import redis
 from six.moves.urllib.parse import unquote
-from six import text_type
+from six import text_type, string_types
 from frappe.cache_manager import clear_user_cache
 
+# sids used since the last `flush_sessions`, with the time they were last used
+session_updates_key = "session_updates"
+session_flush_batch_size = 500
+
 @frappe.whitelist()
 def clear(user=None):
 	frappe.local.session_obj.update(force=True)
@@ -78,7 +82,7 @@ def get_sessions_to_clear(user=None, keep_current=False, device=None):
 def delete_session(sid=None, user=None, reason="Session Expired"):
 	from frappe.core.doctype.activity_log.feed import logout_feed
 
-	frappe.cache().hdel("session", sid)
+	delete_cached_session(sid)
 	frappe.cache().hdel("last_db_session_update", sid)
 	if sid and not user:
 		user_details = frappe.db.sql("""select user from tabSessions where sid=%s""", sid, as_dict=True)
@@ -97,6 +101,9 @@ def clear_all_sessions(reason=None):
 
 def get_expired_sessions():
 	'''Returns list of expired sessions'''
+	# sessions kept in Redis are written to the database in batches
+	flush_sessions()
+
 	expired = []
 	for device in ("desktop", "mobile"):
 		expired += frappe.db.sql_list("""SELECT `sid`
@@ -111,24 +118,21 @@ def clear_expired_sessions():
 	for sid in get_expired_sessions():
 		delete_session(sid, reason="Session Expired")
 
-def get():
+def get(known_versions=None):
+
+	"""get session boot info
 
-	"""get session boot info"""
+	:param known_versions: `boot_fragments` of the bootinfo held by the client, only
+		the fragments changed since are returned"""
 	from frappe.boot import get_bootinfo, get_unseen_notes
 
-	bootinfo = None
-	if not getattr(frappe.conf,'disable_session_cache', None):
-		# check if cache exists
-		bootinfo = frappe.cache().hget("bootinfo", frappe.session.user)
-		if bootinfo:
-			bootinfo['from_cache'] = 1
+	bootinfo = get_bootinfo(known_versions)
+	if bootinfo.from_cache:
+		if "user" in bootinfo:
 			bootinfo["user"]["recent"] = json.dumps(\
 				frappe.cache().hget("user_recent", frappe.session.user))
 
-	if not bootinfo:
-		# if not create it
-		bootinfo = get_bootinfo()
-		frappe.cache().hset("bootinfo", frappe.session.user, bootinfo)
+	else:
 		try:
 			frappe.cache().ping()
 		except redis.exceptions.ConnectionError:
@@ -159,6 +163,16 @@ def get():
 
 	return bootinfo
 
+@frappe.whitelist()
+def get_boot_fragments(versions=None):
+	"""Returns the bootinfo without the fragments the client already has
+
+	:param versions: JSON of `boot_fragments` of the bootinfo held by the client"""
+	if isinstance(versions, string_types):
+		versions = json.loads(versions)
+
+	return get(known_versions=versions or {})
+
 def get_csrf_token():
 	if not frappe.local.session.data.csrf_token:
 		generate_csrf_token()
@@ -243,10 +257,10 @@ class Session:
 		frappe.db.sql("""insert into `tabSessions`
 			(`sessiondata`, `user`, `lastupdate`, `sid`, `status`, `device`)
 			values (%s , %s, NOW(), %s, 'Active', %s)""",
-				(str(self.data['data']), self.data['user'], self.data['sid'], self.device))
+				(encode_session_data(self.data['data']), self.data['user'], self.data['sid'], self.device))
 
 		# also add to memcache
-		frappe.cache().hset("session", self.data.sid, self.data)
+		set_cached_session(self.data.sid, self.data)
 
 	def resume(self):
 		"""non-login request: load a session"""
@@ -287,10 +301,13 @@ class Session:
 		data = self.get_session_data_from_cache()
 		if not data:
 			data = self.get_session_data_from_db()
+			if data and use_redis_session_store():
+				# evicted from Redis, e.g. on restart
+				set_cached_session(self.sid, frappe._dict(user=data.user, sid=self.sid, data=data))
 		return data
 
 	def get_session_data_from_cache(self):
-		data = frappe.cache().hget("session", self.sid)
+		data = get_cached_session(self.sid)
 		if data:
 			data = frappe._dict(data)
 			session_data = data.get("data", {})
@@ -318,7 +335,7 @@ class Session:
 			""", (self.sid, get_expiry_period_for_query(self.device)))
 
 		if rec:
-			data = frappe._dict(eval(rec and rec[0][1] or '{}'))
+			data = decode_session_data(rec[0][1])
 			data.user = rec[0][0]
 		else:
 			self.delete_session()
@@ -344,6 +361,11 @@ class Session:
 		self.data['data']['last_updated'] = now
 		self.data['data']['lang'] = text_type(frappe.lang)
 
+		if use_redis_session_store():
+			# written to the database by `flush_sessions`
+			set_cached_session(self.sid, self.data, updated=now)
+			return False
+
 		# update session in db
 		last_updated = frappe.cache().hget("last_db_session_update", self.sid)
 		time_diff = frappe.utils.time_diff_in_seconds(now, last_updated) if last_updated else None
@@ -353,7 +375,7 @@ class Session:
 		if force or (time_diff==None) or (time_diff > 600):
 			# update sessions table
 			frappe.db.sql("""update `tabSessions` set sessiondata=%s,
-				lastupdate=NOW() where sid=%s""" , (str(self.data['data']),
+				lastupdate=NOW() where sid=%s""" , (encode_session_data(self.data['data']),
 				self.data['sid']))
 
 			# update last active in user table
@@ -368,10 +390,127 @@ class Session:
 			updated_in_db = True
 
 		# set in memcache
-		frappe.cache().hset("session", self.sid, self.data)
+		set_cached_session(self.sid, self.data)
 
 		return updated_in_db
 
+def use_redis_session_store():
+	"""Sessions are kept in Redis, expiring with their TTL, if `session_store` is set to
+	"redis" in site config. `tabSessions` and the users' `last_active` are updated in batches
+	by `flush_sessions`, sessions missing from Redis are loaded from `tabSessions` again."""
+	return frappe.conf.session_store == "redis"
+
+def get_session_key(sid):
+	return frappe.cache().make_key("session::" + cstr(sid))
+
+def encode_session_data(data):
+	return json.dumps(data, separators=(",", ":"), default=text_type)
+
+def decode_session_data(value):
+	"""Returns session data stored as JSON, or as the Python repr used before"""
+	value = frappe.safe_decode(value or "{}")
+	try:
+		data = json.loads(value)
+	except ValueError:
+		data = ast.literal_eval(value)
+
+	return frappe._dict(data)
+
+def get_cached_session(sid):
+	"""Returns the session `{user, sid, data}` from the cache"""
+	if not use_redis_session_store():
+		return frappe.cache().hget("session", sid)
+
+	try:
+		value = frappe.cache().get(get_session_key(sid))
+	except redis.exceptions.ConnectionError:
+		return None
+
+	if value:
+		session = decode_session_data(value)
+		session.data = frappe._dict(session.data)
+		return session
+
+def set_cached_session(sid, session, updated=None):
+	"""Cache the session, with the time of the request that used it to be written to the
+	database if sessions are kept in Redis"""
+	if not use_redis_session_store():
+		frappe.cache().hset("session", sid, session)
+		return
+
+	cache = frappe.cache()
+	pipe = cache.pipeline()
+	pipe.set(get_session_key(sid), encode_session_data(session),
+		ex=get_expiry_in_seconds(session["data"].get("session_expiry")))
+	if updated:
+		pipe.hset(cache.make_key(session_updates_key), sid, updated)
+
+	try:
+		pipe.execute()
+	except redis.exceptions.ConnectionError:
+		pass
+
+def delete_cached_session(sid):
+	cache = frappe.cache()
+	cache.hdel("session", sid)
+	if use_redis_session_store() and sid:
+		try:
+			cache.delete(get_session_key(sid))
+			redis.Redis.hdel(cache, cache.make_key(session_updates_key), sid)
+		except redis.exceptions.ConnectionError:
+			pass
+
+def flush_sessions():
+	"""Write the sessions used since the last run to `tabSessions` and the users' `last_active`,
+	if sessions are kept in Redis. Called by the scheduler."""
+	if not use_redis_session_store():
+		return
+
+	cache = frappe.cache()
+	lock = cache.lock(cache.make_key("session_flush_lock"), timeout=600)
+	if not lock.acquire(blocking=False):
+		return
+
+	try:
+		# updates left by a failed run are written first
+		pending = cache.make_key(session_updates_key + "_flushing")
+		if not cache.exists(pending):
+			try:
+				cache.rename(cache.make_key(session_updates_key), pending)
+			except redis.exceptions.ResponseError:
+				# no updates
+				return
+
+		updates = [(frappe.safe_decode(sid), frappe.safe_decode(updated))
+			for sid, updated in redis.Redis.hgetall(cache, pending).items()]
+
+		for i in range(0, len(updates), session_flush_batch_size):
+			write_session_updates(updates[i:i + session_flush_batch_size])
+			frappe.db.commit()
+
+		cache.delete(pending)
+	finally:
+		lock.release()
+
+def write_session_updates(updates):
+	sessions = frappe.cache().mget([get_session_key(sid) for sid, updated in updates])
+
+	last_active = {}
+	for (sid, updated), session in zip(updates, sessions):
+		if not session:
+			# expired or logged out since
+			continue
+
+		session = decode_session_data(session)
+		frappe.db.sql("""update `tabSessions` set sessiondata=%s, lastupdate=%s where sid=%s""",
+			(encode_session_data(session.data), updated, sid))
+
+		if updated > last_active.get(session.user, ""):
+			last_active[session.user] = updated
+
+	for user, updated in last_active.items():
+		frappe.db.sql("""update `tabUser` set last_active=%s where name=%s""", (updated, user))
+
 def get_expiry_period_for_query(device=None):
 	if frappe.db.db_type == 'postgres':
 		return get_expiry_period(device)
@@ -8,6 +8,7 @@ from frappe.desk.form.document_follow import follow_document
 from frappe.desk.doctype.notification_log.notification_log import enqueue_create_notification,\
 	get_title, get_title_html
 from frappe.utils import cint
+from time import time
 
 @frappe.whitelist()
 def add(doctype, name, user=None, read=1, write=0, share=0, everyone=0, flags=None, notify=0):
@@ -112,6 +113,20 @@ def get_shared(doctype, user=None, rights=None):
 	if not rights:
 		rights = ["read"]
 
+	# cached per user and doctype for `shared_docs_cache_ttl` seconds (default 600), valid while
+	# the version of shares with everyone is unchanged
+	cache = frappe.cache()
+	key = "{0}::{1}".format(user, doctype)
+	version = cache.hget("shared_docs_version", doctype)
+	rights_key = ",".join(sorted(rights))
+
+	cached = cache.hget("shared_docs", key)
+	if not cached or cached.get("version") != version or cached.get("expires", 0) < time():
+		cached = {"version": version, "docs": {},
+			"expires": time() + (cint(frappe.conf.shared_docs_cache_ttl) or 600)}
+	elif rights_key in cached["docs"]:
+		return list(cached["docs"][rights_key])
+
 	filters = [[right, '=', 1] for right in rights]
 	filters += [['share_doctype', '=', doctype]]
 	or_filters = [['user', '=', user]]
@@ -123,7 +138,29 @@ def get_shared(doctype, user=None, rights=None):
 		filters=filters,
 		or_filters=or_filters)
 
-	return [doc.share_name for doc in shared_docs]
+	cached["docs"][rights_key] = [doc.share_name for doc in shared_docs]
+
+	# shares changed in this transaction are not visible to others yet
+	if not has_uncommitted_shares():
+		cache.hset("shared_docs", key, cached)
+
+	return list(cached["docs"][rights_key])
+
+def clear_shared_cache(doctype, user=None):
+	"""Clear the cached shared documents of the DocType for the user, or of all users if
+	documents are shared with everyone (or unshared in bulk). Cleared again once the
+	transaction is committed, as other requests may cache the shares before the commit."""
+	clear_shared_docs(doctype, user)
+	frappe.db.after_commit(clear_shared_docs, doctype, user)
+
+def has_uncommitted_shares():
+	return any(method is clear_shared_docs for method, args in frappe.local.after_commit)
+
+def clear_shared_docs(doctype, user=None):
+	if user:
+		frappe.cache().hdel("shared_docs", "{0}::{1}".format(user, doctype))
+	else:
+		frappe.cache().hset("shared_docs_version", doctype, frappe.generate_hash(length=10))
 
 def get_shared_doctypes(user=None):
 	"""Return list of doctypes in which documents are shared for the given user."""
@@ -0,0 +1,48 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+from frappe.boot import get_bootinfo, boot_fragments_key
+
+class TestBoot(unittest.TestCase):
+	def setUp(self):
+		frappe.set_user("Administrator")
+		frappe.clear_cache()
+
+	def test_shared_fragments(self):
+		bootinfo = get_bootinfo()
+		self.assertFalse(bootinfo.from_cache)
+		self.assertEqual(sorted(bootinfo.boot_fragments),
+			["roles", "site", "translations", "user", "user_info"])
+		self.assertTrue(bootinfo.single_types)
+		self.assertTrue(bootinfo.user)
+
+		# shared fragments are kept when a user's cache is cleared
+		frappe.clear_cache(user="Administrator")
+		bootinfo2 = get_bootinfo()
+		self.assertFalse(bootinfo2.from_cache)
+		self.assertEqual(bootinfo2.boot_fragments["site"], bootinfo.boot_fragments["site"])
+		self.assertNotEqual(bootinfo2.boot_fragments["user"], bootinfo.boot_fragments["user"])
+
+		# cleared when the documents they are built from change
+		frappe.get_doc("User", "Administrator").save()
+		self.assertEqual(frappe.cache().hget(boot_fragments_key, "user_info"), None)
+		self.assertTrue(frappe.cache().hget(boot_fragments_key, "site"))
+
+		frappe.clear_cache(doctype="ToDo")
+		self.assertEqual(frappe.cache().hget(boot_fragments_key, "site"), None)
+
+	def test_delta(self):
+		bootinfo = get_bootinfo()
+
+		delta = get_bootinfo(known_versions=bootinfo.boot_fragments)
+		self.assertTrue(delta.from_cache)
+		self.assertEqual(delta.boot_fragments, bootinfo.boot_fragments)
+		self.assertFalse("single_types" in delta)
+		self.assertFalse("user" in delta)
+
+		frappe.clear_cache(user="Administrator")
+		delta = get_bootinfo(known_versions=bootinfo.boot_fragments)
+		self.assertTrue("user" in delta)
+		self.assertFalse("single_types" in delta)
@@ -65,3 +65,86 @@ class TestDB(unittest.TestCase):
 		self.assertIn('tabCustom Field', frappe.flags.touched_tables)
 		frappe.flags.in_migrate = False
 		frappe.flags.touched_tables.clear()
+
+	def test_iter_sql(self):
+		query = "select name, user_type from `tabUser` order by name"
+		expected = frappe.db.sql(query, as_dict=True)
+
+		self.assertEqual(list(frappe.db.iter_sql(query, as_dict=True)), expected)
+		self.assertEqual(list(frappe.db.sql(query, as_dict=True, as_iterator=True)), expected)
+
+		chunks = list(frappe.db.iter_sql(query, chunk_size=2))
+		self.assertTrue(all(len(chunk) <= 2 for chunk in chunks))
+		self.assertEqual([row[0] for chunk in chunks for row in chunk], [d.name for d in expected])
+
+		# other queries can run while a result is being streamed
+		for row in frappe.db.iter_sql(query):
+			self.assertEqual(frappe.db.get_value("User", row[0]), row[0])
+
+	def test_iter_all(self):
+		self.assertEqual(list(frappe.iter_all("User", fields=["name"], order_by="name")),
+			frappe.get_all("User", fields=["name"], order_by="name"))
+
+	def test_bulk_insert_on_duplicate(self):
+		prefix = frappe.generate_hash(length=8)
+		fields = ['name', 'user', 'route']
+		values = [(prefix + str(i), 'Administrator', 'List/' + prefix) for i in range(3)]
+
+		self.assertEqual(frappe.db.bulk_insert('Route History', fields, values), 3)
+		self.assertEqual(frappe.db.bulk_insert('Route History', fields,
+			values + [(prefix + '3', 'Administrator', 'List/' + prefix)], on_duplicate='ignore'), 1)
+
+		frappe.db.bulk_insert('Route History', fields, [(prefix + '0', 'Guest', 'Form/' + prefix)],
+			on_duplicate='update', update_fields=['route'])
+		self.assertEqual(frappe.db.get_value('Route History', prefix + '0', ['user', 'route']),
+			('Administrator', 'Form/' + prefix))
+
+	def test_bulk_insert_chunks_by_size(self):
+		from frappe.database.database import get_bulk_chunks
+		values = [('a' * 100,)] * 10
+
+		self.assertEqual([len(chunk) for chunk in get_bulk_chunks(values, 4, 10 ** 6)], [4, 4, 2])
+		self.assertEqual([len(chunk) for chunk in get_bulk_chunks(values, 10, 400)], [3, 3, 3, 1])
+
+	def test_connection_pool(self):
+		from frappe.database import get_db
+		frappe.local.conf.db_connection_pool = 1
+		try:
+			db = get_db(user=frappe.conf.db_name)
+			db.connect()
+			conn = db._conn
+			db.close()
+
+			# the connection is reset and reused by the next connect
+			other_db = get_db(user=frappe.conf.db_name)
+			other_db.connect()
+			self.assertIs(other_db._conn, conn)
+			self.assertTrue(other_db.sql("select 1"))
+			other_db.close()
+		finally:
+			frappe.local.conf.db_connection_pool = None
+
+	def test_reads_stay_on_primary_after_write(self):
+		from frappe.database.replica import use_replica
+		frappe.local.conf.read_from_replica = 1
+		frappe.flags.has_db_writes = False
+		try:
+			frappe.db.sql("""
+				update `tabUser` set `modified`=`modified` where name='Administrator'""")
+			self.assertTrue(frappe.flags.has_db_writes)
+			self.assertFalse(use_replica())
+		finally:
+			frappe.local.conf.read_from_replica = None
+			frappe.flags.has_db_writes = False
+
+	def test_rollback_to_savepoint_drops_queued_calls(self):
+		calls = []
+		frappe.db.savepoint("test_savepoint")
+		frappe.db.after_commit(calls.append, "after rollback")
+		frappe.db.rollback(save_point="test_savepoint")
+		self.assertTrue(frappe.db.has_savepoint("test_savepoint"))
+
+		frappe.db.after_commit(calls.append, "committed")
+		frappe.db.commit()
+		self.assertEqual(calls, ["committed"])
+		self.assertFalse(frappe.db.has_savepoint("test_savepoint"))
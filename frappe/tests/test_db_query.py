@@ -211,6 +211,37 @@ class TestReportview(unittest.TestCase):
 		update('Nested DocType', 'All', 0, 'if_owner', 1)
 		frappe.set_user('Administrator')
 
+	def test_nested_permission_subquery(self):
+		frappe.set_user('Administrator')
+		create_nested_doctype()
+		create_nested_doctype_records()
+		clear_user_permissions_for_doctype('Nested DocType')
+		add_user_permission('Nested DocType', 'Level 1 A', 'test2@example.com')
+
+		from frappe.core.page.permission_manager.permission_manager import update
+		update('Nested DocType', 'All', 0, 'if_owner', 0)
+
+		frappe.set_user('test2@example.com')
+		data_without_subquery = DatabaseQuery('Nested DocType').execute(order_by='name asc')
+
+		# permitted names are matched with a subquery above the threshold
+		frappe.local.conf.permission_subquery_threshold = 1
+		try:
+			query = DatabaseQuery('Nested DocType').execute(return_query=True)
+			data = DatabaseQuery('Nested DocType').execute(order_by='name asc')
+		finally:
+			frappe.local.conf.permission_subquery_threshold = None
+
+		self.assertTrue('tabUser Permission' in query)
+		self.assertEqual(len(data), len(data_without_subquery))
+		self.assertEqual(data, data_without_subquery)
+		self.assertTrue(len(data) < frappe.db.count('Nested DocType'))
+		self.assertTrue({'name': 'Level 2 A'} in data)
+		self.assertFalse({'name': 'Level 1 B'} in data)
+		self.assertFalse({'name': 'Level 2 B'} in data)
+		update('Nested DocType', 'All', 0, 'if_owner', 1)
+		frappe.set_user('Administrator')
+
 	def test_filter_sanitizer(self):
 		self.assertRaises(frappe.DataError, DatabaseQuery("DocType").execute,
 				fields=["name"], filters={'istable,': 1}, limit_start=0, limit_page_length=1)
@@ -344,6 +375,49 @@ class TestReportview(unittest.TestCase):
 			limit=50,
 		)
 
+	def test_query_cache(self):
+		from frappe.model.utils.query_cache import get_stats
+		frappe.db.commit()
+		frappe.local.conf.query_cache = {'ToDo': 60}
+		try:
+			description = frappe.generate_hash(length=10)
+			filters = {'description': description}
+			self.assertEqual(frappe.get_all('ToDo', filters), [])
+
+			stats = get_stats().get('ToDo')
+			self.assertEqual(frappe.get_all('ToDo', filters), [])
+			self.assertEqual(get_stats()['ToDo']['hits'], stats['hits'] + 1)
+
+			# writes are visible in the same transaction, and to everyone after commit
+			todo = frappe.get_doc(dict(doctype='ToDo', description=description)).insert()
+			self.assertEqual(frappe.get_all('ToDo', filters)[0].name, todo.name)
+			frappe.db.commit()
+			self.assertEqual(frappe.get_all('ToDo', filters)[0].name, todo.name)
+		finally:
+			frappe.local.conf.query_cache = None
+
+	def test_query_cache_after_concurrent_commit(self):
+		from frappe.model.utils.query_cache import bump_table_versions, get_stats
+		frappe.db.commit()
+		frappe.local.conf.query_cache = {'ToDo': 60}
+		try:
+			filters = {'description': frappe.generate_hash(length=10)}
+			frappe.db.sql("select name from `tabToDo` limit 1")
+
+			# another transaction commits a ToDo after this one started, this transaction
+			# still reads its old snapshot which must not be cached under the new version
+			bump_table_versions(['tabToDo'])
+			hits = get_stats().get('ToDo', {}).get('hits', 0)
+			self.assertEqual(frappe.get_all('ToDo', filters), [])
+			frappe.db.commit()
+
+			self.assertEqual(frappe.get_all('ToDo', filters), [])
+			self.assertEqual(get_stats()['ToDo']['hits'], hits)
+			self.assertEqual(frappe.get_all('ToDo', filters), [])
+			self.assertEqual(get_stats()['ToDo']['hits'], hits + 1)
+		finally:
+			frappe.local.conf.query_cache = None
+
 def create_event(subject="_Test Event", starts_on=None):
 	""" create a test event """
 
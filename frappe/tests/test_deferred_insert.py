@@ -0,0 +1,33 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest, json
+from frappe.deferred_insert import deferred_insert, save_to_db, get_stats
+
+class TestDeferredInsert(unittest.TestCase):
+	def test_bulk_flush(self):
+		route = 'List/ToDo/' + frappe.generate_hash(length=8)
+		records = [{'user': 'Administrator', 'route': route} for i in range(25)]
+
+		# entries can hold a single record or a list of records
+		deferred_insert('Route History', json.dumps(records[:20]))
+		for record in records[20:]:
+			deferred_insert('Route History', json.dumps(record))
+
+		save_to_db()
+
+		self.assertEqual(frappe.db.count('Route History', {'route': route}), 25)
+		self.assertEqual(frappe.cache().llen('insert_queue_for_Route History'), 0)
+
+		stats = get_stats('Route History')
+		self.assertEqual(stats.get('last_run_records'), 25)
+		self.assertEqual(stats.get('last_run_batches'), 1)
+
+	def test_bulk_insert_chunking(self):
+		prefix = frappe.generate_hash(length=8)
+		values = [(prefix + str(i), 'Administrator', 'List/' + prefix) for i in range(7)]
+
+		frappe.db.bulk_insert('Route History', ['name', 'user', 'route'], values, chunk_size=3)
+
+		self.assertEqual(frappe.db.count('Route History', {'route': 'List/' + prefix}), 7)
@@ -20,6 +20,75 @@ class TestDocument(unittest.TestCase):
 		self.assertTrue(isinstance(d.permissions, list))
 		self.assertTrue(filter(lambda d: d.fieldname=="email", d.fields))
 
+	def test_get_docs(self):
+		names = ["Administrator", "Guest"]
+		docs = frappe.get_docs("User", names)
+
+		self.assertEqual([d.name for d in docs], names)
+		for doc in docs:
+			expected = frappe.get_doc("User", doc.name)
+			self.assertEqual(doc.as_dict(), expected.as_dict())
+			self.assertTrue(all(d.parent_doc is doc for d in doc.roles))
+
+		self.assertRaises(frappe.DoesNotExistError, frappe.get_docs, "User", ["_Test Missing User"])
+
+	def test_save_loaded_children(self):
+		doc = frappe.get_doc("User", "Administrator")
+		self.assertTrue(doc.roles)
+		self.assertTrue(all(d.flags is not None for d in doc.roles))
+		doc.save()
+
+		doc = frappe.get_docs("User", ["Administrator"])[0]
+		self.assertTrue(all(d.flags is not None for d in doc.roles))
+		doc.save()
+
+	def test_document_cache(self):
+		from frappe.model.utils.document_cache import get_cached_values
+
+		d = frappe.get_doc({"doctype": "ToDo", "description": "test document cache"}).insert()
+		frappe.db.commit()
+
+		cached = frappe.get_cached_doc("ToDo", d.name)
+		cached.description = "changed without saving"
+		self.assertEqual(frappe.get_cached_doc("ToDo", d.name).description, "test document cache")
+
+		# served from redis in the next request
+		frappe.local.document_cache = {}
+		self.assertEqual(get_cached_values("ToDo", d.name)[1], None)
+		self.assertEqual(frappe.get_cached_value("ToDo", d.name, "description"), "test document cache")
+
+		d.db_set("description", "updated")
+		self.assertEqual(frappe.get_cached_value("ToDo", d.name, "description"), "updated")
+
+		# uncommitted values are only cached for the current request
+		frappe.db.rollback()
+		self.assertEqual(frappe.get_cached_value("ToDo", d.name, "description"), "test document cache")
+
+		frappe.delete_doc("ToDo", d.name)
+		frappe.db.commit()
+		self.assertRaises(frappe.DoesNotExistError, frappe.get_cached_doc, "ToDo", d.name)
+
+	def test_document_cache_stale_reader(self):
+		from frappe.model.utils.document_cache import get_shared, set_shared, delete
+
+		d = frappe.get_doc({"doctype": "ToDo", "description": "test stale reader"}).insert()
+		frappe.db.commit()
+		key = frappe.get_document_cache_key("ToDo", d.name)
+
+		values, version = get_shared("ToDo", key)
+		self.assertEqual(values, None)
+		stale = frappe.get_doc("ToDo", d.name).as_dict()
+
+		# another request commits a change after the document was loaded
+		delete([key])
+		set_shared("ToDo", key, stale, 60, version)
+		self.assertEqual(get_shared("ToDo", key)[0], None)
+
+		values, version = get_shared("ToDo", key)
+		set_shared("ToDo", key, stale, 60, version)
+		self.assertEqual(get_shared("ToDo", key)[0], stale)
+		d.delete()
+
 	def test_load_single(self):
 		d = frappe.get_doc("Website Settings", "Website Settings")
 		self.assertEqual(d.name, "Website Settings")
@@ -125,6 +194,47 @@ class TestDocument(unittest.TestCase):
 
 		self.assertEqual(frappe.db.get_value("User", d.name), d.name)
 
+	def test_batched_link_validation(self):
+		from frappe.model.base_document import get_link_values
+		d = frappe.get_doc({
+			"doctype": "User",
+			"email": "test_link_validation@example.com",
+			"roles": [{"role": "System Manager"}, {"role": "Blogger"}, {"role": "ABC"}]
+		})
+
+		link_values = get_link_values(d.get_all_children())
+		self.assertEqual(set(link_values["Role"]), {"System Manager", "system manager", "Blogger", "blogger"}
+			if frappe.db.db_type != "postgres" else {"System Manager", "Blogger"})
+
+		todo = frappe.get_doc(dict(doctype="ToDo", description="links", assigned_by="Administrator"))
+		todo.get_invalid_links(link_values=get_link_values([todo]))
+		self.assertEqual(todo.assigned_by_full_name, frappe.db.get_value("User", "Administrator", "full_name"))
+
+	def test_child_rows_written(self):
+		frappe.delete_doc_if_exists("User", "test_child_rows@example.com", 1)
+		d = frappe.get_doc({
+			"doctype": "User",
+			"email": "test_child_rows@example.com",
+			"first_name": "Child Rows",
+			"roles": [{"role": "System Manager"}, {"role": "Blogger"}]
+		}).insert()
+
+		d.first_name = "Child Rows Updated"
+		d.save()
+		self.assertEqual(d.flags.child_rows_written.unchanged, 2)
+		self.assertEqual(d.flags.child_rows_written.updated, 0)
+
+		d.roles[0].role = "Website Manager"
+		d.remove(d.roles[1])
+		d.append("roles", {"role": "Blogger"})
+		d.append("roles", {"role": "Translator"})
+		d.save()
+		self.assertEqual(d.flags.child_rows_written,
+			{"inserted": 2, "updated": 1, "deleted": 1, "unchanged": 0})
+
+		roles = frappe.get_all("Has Role", {"parent": d.name, "parenttype": "User"}, ["role"])
+		self.assertEqual(sorted(r.role for r in roles), ["Blogger", "Translator", "Website Manager"])
+
 	def test_validate(self):
 		d = self.test_insert()
 		d.starts_on = "2014-01-01"
@@ -54,6 +54,43 @@ class TestEmail(unittest.TestCase):
 		self.assertEqual(len(queue_recipients), 2)
 		self.assertTrue('Unsubscribe' in frappe.safe_decode(frappe.flags.sent_mail))
 
+		from frappe.email.queue import get_stats
+		self.assertTrue(any(stats.get('last_run_sent') == 2 for stats in get_stats().values()))
+
+	def test_reset_stale_emails(self):
+		from frappe.email.queue import reset_stale_emails
+		from frappe.utils import add_to_date, now_datetime
+
+		self.test_email_queue()
+		name = frappe.db.get_value("Email Queue", {"status": "Not Sent"})
+
+		frappe.db.sql("""update `tabEmail Queue` set status='Sending', modified=%s where name=%s""",
+			(now_datetime(), name))
+		reset_stale_emails(auto_commit=False)
+		self.assertEqual(frappe.db.get_value("Email Queue", name, "status"), "Sending")
+
+		# left by a job that was killed
+		frappe.db.sql("""update `tabEmail Queue` set modified=%s where name=%s""",
+			(add_to_date(now_datetime(), hours=-1), name))
+		frappe.db.sql("""update `tabEmail Queue Recipient` set status='Sent'
+			where parent=%s and recipient='test@example.com'""", name)
+		reset_stale_emails(auto_commit=False)
+		self.assertEqual(frappe.db.get_value("Email Queue", name, "status"), "Partially Sent")
+
+	def test_recipient_status_written_per_batch(self):
+		from frappe.email.queue import claim_emails, send_tasks, prepare_message
+
+		self.test_email_queue()
+		email = claim_emails([frappe.db.get_value("Email Queue", {"status": "Not Sent"})],
+			auto_commit=False)[0]
+		recipient = email.recipients[0]
+		tasks = [(email, recipient, prepare_message(email, recipient.recipient, email.recipients))]
+
+		# written before the rest of the chunk is sent
+		send_tasks(frappe._dict(pool=None, sent=0, failed=0, auto_commit=False), tasks, {})
+		self.assertEqual(frappe.db.get_value("Email Queue Recipient", recipient.name, "status"), "Sent")
+		self.assertEqual(frappe.db.get_value("Email Queue", email.name, "status"), "Sending")
+
 	def test_cc_header(self):
 		# test if sending with cc's makes it into header
 		frappe.sendmail(recipients=['test@example.com'],
@@ -82,6 +82,21 @@ class TestGlobalSearch(unittest.TestCase):
 		results = global_search.search('Monthly')
 		self.assertEqual(len(results), 3)
 
+	def test_sync_latest_value(self):
+		def queue(name, content):
+			global_search.sync_value_in_queue(dict(doctype='Event', name=name, content=content,
+				published=0, title=name, route=''))
+
+		queue('_Test Queued Event', 'older value')
+		# more values than are synced in one batch
+		for i in range(500):
+			queue('_Test Queued Event {0}'.format(i), 'other value')
+		queue('_Test Queued Event', 'newer value')
+
+		global_search.sync_global_search()
+		self.assertEqual(frappe.db.sql('''select content from `__global_search`
+			where doctype='Event' and name='_Test Queued Event' '''), (('newer value',),))
+
 	def test_delete_doc(self):
 		self.insert_test_events()
 
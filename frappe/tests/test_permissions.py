@@ -185,6 +185,23 @@ class TestPermissions(unittest.TestCase):
 		self.assertRaises(frappe.CannotChangeConstantError, doc.save)
 		blog_post.get_field("title").set_only_once = 0
 
+	def test_permission_table(self):
+		from frappe.permissions import get_permission_table
+
+		frappe.set_user("test2@example.com")
+		table = get_permission_table("Blog Post")
+		self.assertTrue(table.rights.read)
+		self.assertEqual(len(frappe.cache().hget("role_permissions", "Blog Post")), 1)
+
+		# compiled once per set of roles, not per request
+		frappe.local.role_permissions = {}
+		self.assertEqual(get_permission_table("Blog Post"), table)
+		self.assertEqual(len(frappe.cache().hget("role_permissions", "Blog Post")), 1)
+
+		frappe.set_user("Administrator")
+		update('Blog Post', 'Blogger', 0, 'write', 0)
+		self.assertEqual(frappe.cache().hget("role_permissions", "Blog Post"), None)
+
 	def test_set_only_once_child_table_rows(self):
 		doctype_meta = frappe.get_meta("DocType")
 		doctype_meta.get_field("fields").set_only_once = 1
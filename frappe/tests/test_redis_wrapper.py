@@ -0,0 +1,134 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+from frappe.utils.redis_wrapper import process_cache
+
+class TestProcessCache(unittest.TestCase):
+	def setUp(self):
+		frappe.local.conf.process_cache_size = 100
+		process_cache.clear()
+
+	def tearDown(self):
+		frappe.local.conf.process_cache_size = 0
+		frappe.cache().delete_value('test_map')
+
+	def new_request(self):
+		frappe.local.cache = {}
+		frappe.local.process_cache_synced = False
+
+	def test_value_survives_request(self):
+		frappe.cache().set_value('test_map', {'a': 1})
+		self.new_request()
+		self.assertEqual(frappe.cache().get_value('test_map'), {'a': 1})
+
+		hits = process_cache.hits
+		self.new_request()
+		self.assertEqual(frappe.cache().get_value('test_map'), {'a': 1})
+		self.assertEqual(process_cache.hits, hits + 1)
+
+	def test_invalidation_from_other_process(self):
+		frappe.cache().set_value('test_map', 'old')
+		self.new_request()
+		frappe.cache().get_value('test_map')
+
+		# simulate a delete from another worker
+		frappe.cache().delete(frappe.cache().make_key('test_map'))
+		process_cache.bump_version(frappe.cache())
+
+		self.new_request()
+		self.assertEqual(frappe.cache().get_value('test_map'), None)
+
+	def test_overwrite_invalidates_other_processes(self):
+		cache = frappe.cache()
+		def get_version():
+			return cache.get(cache.make_key(process_cache.version_key))
+
+		# no process can hold a value that was not set yet
+		version = get_version()
+		cache.set_value('test_map', 'old')
+		cache.hset('test_hash_map', 'a', 'old')
+		self.assertEqual(get_version(), version)
+
+		cache.set_value('test_map', 'new')
+		self.assertNotEqual(get_version(), version)
+
+		version = get_version()
+		cache.hset_many('test_hash_map', {'a': 'new', 'b': 'new'})
+		self.assertNotEqual(get_version(), version)
+		cache.delete_value('test_hash_map')
+
+	def test_keys_not_in_allowlist(self):
+		frappe.cache().set_value('test_value_not_cached', 1)
+		self.new_request()
+		frappe.cache().get_value('test_value_not_cached')
+		self.assertNotIn((frappe.cache().make_key('test_value_not_cached'), None), process_cache.data)
+		frappe.cache().delete_value('test_value_not_cached')
+
+class TestWildcardKeys(unittest.TestCase):
+	def test_get_keys_with_scan(self):
+		for i in range(5):
+			frappe.cache().set_value('test_scan_{0}'.format(i), i)
+
+		keys = frappe.cache().get_keys('test_scan_')
+		self.assertEqual(len(keys), 5)
+
+		frappe.cache().delete_keys('test_scan_')
+		self.assertEqual(frappe.cache().get_keys('test_scan_'), [])
+
+	def test_delete_user_keys(self):
+		frappe.cache().set_value('test_key', 1, user='test@example.com')
+		frappe.cache().set_value('test_key_with_expiry', 1, user='test@example.com', expires_in_sec=60)
+		frappe.cache().hset('user:test@example.com:test_hash', 'a', 1)
+
+		self.assertEqual(len(frappe.cache().get_keys('user:test@example.com')), 3)
+
+		frappe.cache().delete_keys('user:test@example.com')
+		self.assertIsNone(frappe.cache().get_value('test_key', user='test@example.com'))
+		self.assertEqual(frappe.cache().get_keys('user:test@example.com'), [])
+
+	def test_key_index(self):
+		frappe.cache().set_value('test_indexed_1', 1)
+		frappe.cache().set_value('test_indexed_2', 2)
+		frappe.cache().add_to_key_index('test_indexed_', 'test_indexed_1', 'test_indexed_2')
+		self.assertEqual(len(frappe.cache().get_keys('test_indexed_', indexed=True)), 2)
+
+		# deleted keys are removed from the index
+		frappe.cache().delete_value('test_indexed_1')
+		self.assertEqual(frappe.cache().get_keys('test_indexed_', indexed=True),
+			[frappe.cache().make_key('test_indexed_2')])
+		self.assertEqual(frappe.cache().scard(frappe.cache().get_key_index_name('test_indexed_')), 1)
+
+		frappe.cache().delete_keys('test_indexed_')
+		self.assertEqual(frappe.cache().get_keys('test_indexed_', indexed=True), [])
+
+class TestMultiKeyAPI(unittest.TestCase):
+	def test_get_and_set_values(self):
+		frappe.cache().set_values({'test_k1': 1, 'test_k2': {'a': 2}})
+		frappe.local.cache = {}
+
+		values = frappe.cache().get_values(['test_k1', 'test_k2', 'test_missing'])
+		self.assertEqual(values, {'test_k1': 1, 'test_k2': {'a': 2}, 'test_missing': None})
+
+		# fetched values are cached for the request, missing ones are not
+		self.assertIn(frappe.cache().make_key('test_k1'), frappe.local.cache)
+		self.assertNotIn(frappe.cache().make_key('test_missing'), frappe.local.cache)
+
+		frappe.cache().delete_value(['test_k1', 'test_k2'])
+
+	def test_user_scoped_values(self):
+		frappe.cache().set_values({'test_k1': 'x'}, user='test@example.com', expires_in_sec=60)
+		self.assertEqual(frappe.cache().get_values(['test_k1'], user='test@example.com'), {'test_k1': 'x'})
+		self.assertIsNone(frappe.cache().get_value('test_k1'))
+		frappe.cache().delete_keys('user:test@example.com')
+
+	def test_hget_many(self):
+		frappe.cache().hset_many('test_hash', {'a': 1, 'b': [2]})
+		frappe.local.cache = {}
+
+		self.assertEqual(frappe.cache().hget_many('test_hash', ['a', 'b', 'c']),
+			{'a': 1, 'b': [2], 'c': None})
+		self.assertEqual(frappe.cache().hget('test_hash', 'b'), [2])
+
+		frappe.cache().delete_value('test_hash')
@@ -48,5 +48,45 @@ class TestSearch(unittest.TestCase):
 		result = [['found' for x in y if x=="Country"] for y in output]
 		self.assertTrue(['found'] in result)
 
+	def test_link_search_index(self):
+		frappe.local.conf.link_search_index = ['ToDo']
+		frappe.local.conf.link_search_cache_ttl = 0
+		try:
+			from frappe.desk.link_search import build_index, is_index_built, set_document_terms
+
+			frappe.cache().delete_value('link_search_built::ToDo')
+			todo = frappe.get_doc(dict(doctype='ToDo', description='zephyrine link search')).insert()
+			frappe.db.commit()
+
+			# searches use LIKE until the index is built, updates are queued for the build
+			self.assertFalse(is_index_built('ToDo'))
+			set_document_terms('ToDo', todo.name, [todo.name, 'zephyrine link search'])
+			self.assertEqual(frappe.cache().llen('link_search_pending::ToDo'), 1)
+			self.assertTrue(build_index('ToDo'))
+			self.assertTrue(is_index_built('ToDo'))
+
+			search_widget(doctype='ToDo', txt='zephyr', page_length=20)
+			self.assertEqual([v[0] for v in frappe.response['values']], [todo.name])
+
+			# the index is only updated once the change is committed
+			todo.description = 'renamed link search'
+			todo.save()
+			frappe.db.rollback()
+			search_widget(doctype='ToDo', txt='zephyr', page_length=20)
+			self.assertEqual([v[0] for v in frappe.response['values']], [todo.name])
+
+			todo.reload()
+			todo.description = 'renamed link search'
+			todo.save()
+			frappe.db.commit()
+			search_widget(doctype='ToDo', txt='zephyr', page_length=20)
+			self.assertEqual(frappe.response['values'], [])
+
+			todo.delete()
+			frappe.db.commit()
+		finally:
+			frappe.local.conf.link_search_index = None
+			frappe.local.conf.link_search_cache_ttl = None
+
 	def tearDown(self):
 		frappe.local.lang = 'en'
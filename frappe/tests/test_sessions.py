@@ -0,0 +1,46 @@
+# Copyright (c) 2020, Frappe Technologies Pvt. Ltd. and Contributors
+# MIT License. See license.txt
+from __future__ import unicode_literals
+
+import frappe, unittest
+from frappe.sessions import (decode_session_data, encode_session_data, get_cached_session,
+	set_cached_session, flush_sessions, get_expired_sessions, delete_session)
+
+class TestSessions(unittest.TestCase):
+	def tearDown(self):
+		frappe.local.conf.pop("session_store", None)
+
+	def test_session_data_encoding(self):
+		data = frappe._dict(user="test@example.com", session_expiry="06:00:00")
+		self.assertEqual(decode_session_data(encode_session_data(data)), data)
+
+		# stored as a Python repr before
+		self.assertEqual(decode_session_data(str(dict(data))), data)
+
+	def test_redis_session_store(self):
+		frappe.local.conf.session_store = "redis"
+		sid = frappe.generate_hash()
+		now = frappe.utils.now()
+		session = frappe._dict(user="test@example.com", sid=sid, data=frappe._dict(
+			user="test@example.com", session_expiry="06:00:00", last_updated=now))
+
+		frappe.db.sql("""insert into `tabSessions` (`sessiondata`, `user`, `lastupdate`, `sid`, `status`, `device`)
+			values (%s, %s, NOW(), %s, 'Active', 'desktop')""", (encode_session_data(session.data), session.user, sid))
+
+		set_cached_session(sid, session, updated=now)
+		self.assertEqual(get_cached_session(sid), session)
+		self.assertFalse(sid in get_expired_sessions())
+
+		# written to the database in the background
+		flush_sessions()
+		self.assertEqual(str(frappe.db.get_value("User", "test@example.com", "last_active")), now)
+
+		# not expired if only evicted from redis
+		frappe.cache().delete(frappe.sessions.get_session_key(sid))
+		self.assertFalse(sid in get_expired_sessions())
+
+		frappe.db.sql("""update `tabSessions` set lastupdate=%s where sid=%s""",
+			(frappe.utils.add_days(now, -30), sid))
+		self.assertTrue(sid in get_expired_sessions())
+		delete_session(sid)
+		self.assertFalse(frappe.db.exists("Sessions", {"sid": sid}))
@@ -32,6 +32,63 @@ class TestWebsite(unittest.TestCase):
 		self.assertTrue('<!-- login.html -->' in html)
 		frappe.set_user('Administrator')
 
+	def test_conditional_get(self):
+		developer_mode = frappe.conf.developer_mode
+		frappe.conf.developer_mode = 0
+		frappe.set_user('Guest')
+		render.clear_cache('about')
+
+		set_request(method='GET', path='about')
+		response = render.render()
+		self.assertEqual(response.status_code, 200)
+		etag = response.headers.get('ETag')
+		self.assertTrue(etag)
+		self.assertTrue('route:about' in response.headers.get('Surrogate-Key'))
+
+		set_request(method='GET', path='about', headers={'If-None-Match': etag})
+		response = render.render()
+		self.assertEqual(response.status_code, 304)
+		self.assertFalse(response.get_data())
+
+		render.clear_cache('about')
+		set_request(method='GET', path='about', headers={'If-None-Match': etag})
+		self.assertEqual(render.render().status_code, 200)
+
+		frappe.set_user('Administrator')
+		frappe.conf.developer_mode = developer_mode
+
+	def test_route_index(self):
+		from frappe.website.router import get_page_info_from_doctypes, rebuild_route_index
+
+		rebuild_route_index()
+		page = frappe.get_doc(dict(doctype='Web Page', title='Test Route Index',
+			route='test-route-index', published=1, main_section='route index')).insert()
+		frappe.db.commit()
+		self.assertEqual(get_page_info_from_doctypes('test-route-index')['name'], page.name)
+
+		page.route = 'test-route-index-moved'
+		page.save()
+		frappe.db.commit()
+		self.assertEqual(get_page_info_from_doctypes('test-route-index'), None)
+		self.assertEqual(get_page_info_from_doctypes('test-route-index-moved')['name'], page.name)
+
+		# a rolled back save leaves the index as it is
+		page.published = 0
+		page.save()
+		frappe.db.rollback()
+		self.assertEqual(get_page_info_from_doctypes('test-route-index-moved')['name'], page.name)
+
+		page.reload()
+		page.published = 0
+		page.save()
+		frappe.db.commit()
+		self.assertEqual(get_page_info_from_doctypes('test-route-index-moved'), None)
+
+		page.reload()
+		page.delete()
+		frappe.db.commit()
+		self.assertEqual(get_page_info_from_doctypes('test-route-index-moved'), None)
+
 	def test_redirect(self):
 		import frappe.hooks
 		frappe.hooks.website_redirects = [
@@ -267,6 +267,7 @@ def clear_cache():
 
 	# clear translations saved in boot cache
 	cache.delete_key("bootinfo")
+	cache.delete_key("boot_fragments")
 	cache.delete_key("lang_full_dict", shared=True)
 	cache.delete_key("translation_assets", shared=True)
 	cache.delete_key("lang_user_translations")
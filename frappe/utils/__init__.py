@@ -674,8 +674,12 @@ def get_safe_filters(filters):
 
 def create_batch(iterable, batch_size):
 	"""
-	Convert an iterable to multiple batches of constant size of batch_size
+	Convert an iterable (or a generator) to multiple batches (lists) of constant size of batch_size
 	"""
-	total_count = len(iterable)
-	for i in range(0, total_count, batch_size):
-		yield iterable[i:min(i + batch_size, total_count)]
+	from itertools import islice
+
+	iterator = iter(iterable)
+	batch = list(islice(iterator, batch_size))
+	while batch:
+		yield batch
+		batch = list(islice(iterator, batch_size))
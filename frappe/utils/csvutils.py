@@ -4,8 +4,10 @@
 from __future__ import unicode_literals
 import frappe
 from frappe import msgprint, _
+import io
 import json
 import csv
+import codecs
 import six
 from six import StringIO, text_type, string_types
 from frappe.utils import encode, cstr, cint, flt, comma_or
@@ -36,6 +38,65 @@ def read_csv_content_from_attached_file(doc):
 	except Exception:
 		frappe.throw(_("Unable to open attached file. Did you export it as CSV?"), title=_('Invalid CSV Format'))
 
+def read_csv_rows(fcontent=None, filepath=None):
+	"""Yields the rows of CSV content or of a CSV file one by one, parsed like `read_csv_content`.
+	The encoding of a file is guessed by decoding it in chunks of 64 KB."""
+	if six.PY2:
+		if filepath:
+			with open(filepath, "rb") as f:
+				fcontent = f.read()
+		for row in read_csv_content(fcontent):
+			yield row
+		return
+
+	if filepath:
+		encoding = guess_file_encoding(filepath)
+		with io.open(filepath, encoding=encoding, newline="") as f:
+			for row in parse_csv_rows(f):
+				yield row
+		return
+
+	if not isinstance(fcontent, text_type):
+		fcontent = text_type(fcontent, guess_csv_encoding(fcontent))
+
+	for row in parse_csv_rows(io.StringIO(fcontent, newline="")):
+		yield row
+
+def guess_file_encoding(filepath, chunk_size=65536):
+	"""Returns the first encoding the whole file can be decoded with, without reading it in memory"""
+	for encoding in ["utf-8", "windows-1250", "windows-1252"]:
+		decoder = codecs.getincrementaldecoder(encoding)()
+		try:
+			with io.open(filepath, "rb") as f:
+				for chunk in iter(lambda: f.read(chunk_size), b""):
+					decoder.decode(chunk)
+				decoder.decode(b"", final=True)
+			return encoding
+		except UnicodeDecodeError:
+			continue
+
+	frappe.msgprint(_("Unknown file encoding. Tried utf-8, windows-1250, windows-1252."), raise_exception=True)
+
+def guess_csv_encoding(content):
+	for encoding in ["utf-8", "windows-1250", "windows-1252"]:
+		try:
+			text_type(content, encoding)
+			return encoding
+		except UnicodeDecodeError:
+			continue
+
+	frappe.msgprint(_("Unknown file encoding. Tried utf-8, windows-1250, windows-1252."), raise_exception=True)
+
+def parse_csv_rows(lines):
+	try:
+		for row in csv.reader(lines):
+			# reason: in maraidb strict config, one cannot have blank strings for non string datatypes
+			yield [val.strip() or None for val in row]
+
+	except csv.Error:
+		frappe.msgprint(_("Not a valid Comma Separated Value (CSV File)"))
+		raise
+
 def read_csv_content(fcontent, ignore_encoding=False):
 	rows = []
 
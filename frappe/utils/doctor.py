@@ -94,6 +94,8 @@ def doctor(site=None):
 	"""
 	Prints diagnostic information for the scheduler
 	"""
+	from frappe.core.doctype.version.version import get_version_log_stats
+
 	with frappe.init_site(site):
 		workers_online = check_number_of_workers()
 		jobs_per_queue, job_count = get_jobs_by_queue(site)
@@ -120,6 +122,11 @@ def doctor(site=None):
 		if is_scheduler_inactive():
 			print("Scheduler inactive for", s)
 
+		version_log = get_version_log_stats()
+		if version_log.pending:
+			print("Versions pending for {0}: {1} (oldest {2}s)".format(s, version_log.pending,
+				int(version_log.oldest)))
+
 		frappe.destroy()
 
 	# TODO improve this
@@ -101,14 +101,12 @@ def rebuild_for_doctype(doctype):
 	parent_search_fields = meta.get_global_search_fields()
 	fieldnames = get_selected_fields(meta, parent_search_fields)
 
-	# Get all records from parent doctype table
-	all_records = frappe.get_all(doctype, fields=fieldnames, filters=_get_filters())
-
 	# Children data
 	all_children, child_search_fields = get_children_data(doctype, meta)
 	all_contents = []
 
-	for doc in all_records:
+	# Stream records from parent doctype table
+	for doc in frappe.iter_all(doctype, fields=fieldnames, filters=_get_filters()):
 		content = []
 		for field in parent_search_fields:
 			value = doc.get(field.fieldname)
@@ -137,13 +135,18 @@ def rebuild_for_doctype(doctype):
 				pass
 
 			all_contents.append({
-				"doctype": frappe.db.escape(doctype),
-				"name": frappe.db.escape(doc.name),
-				"content": frappe.db.escape(' ||| '.join(content or '')),
+				"doctype": doctype,
+				"name": doc.name,
+				"content": ' ||| '.join(content or ''),
 				"published": published,
-				"title": frappe.db.escape(title or '')[:int(frappe.db.VARCHAR_LEN)],
-				"route": frappe.db.escape(route or '')[:int(frappe.db.VARCHAR_LEN)]
+				"title": (title or '')[:int(frappe.db.VARCHAR_LEN)],
+				"route": (route or '')[:int(frappe.db.VARCHAR_LEN)]
 			})
+
+		if len(all_contents) >= 10000:
+			insert_values_for_multiple_docs(all_contents)
+			all_contents = []
+
 	if all_contents:
 		insert_values_for_multiple_docs(all_contents)
 
@@ -205,24 +208,12 @@ def get_children_data(doctype, meta):
 
 
 def insert_values_for_multiple_docs(all_contents):
-	values = []
-	for content in all_contents:
-		values.append("({doctype}, {name}, {content}, {published}, {title}, {route})"
-			.format(**content))
-
-	batch_size = 50000
-	for i in range(0, len(values), batch_size):
-		batch_values = values[i:i + batch_size]
-		# ignoring duplicate keys for doctype_name
-		frappe.db.multisql({
-			'mariadb': '''INSERT IGNORE INTO `__global_search`
-				(doctype, name, content, published, title, route)
-				VALUES {0} '''.format(", ".join(batch_values)),
-			'postgres': '''INSERT INTO `__global_search`
-				(doctype, name, content, published, title, route)
-				VALUES {0}
-				ON CONFLICT("name", "doctype") DO NOTHING'''.format(", ".join(batch_values))
-			})
+	fields = ["doctype", "name", "content", "published", "title", "route"]
+	values = [[content[field] for field in fields] for content in all_contents]
+
+	# ignoring duplicate keys for doctype_name
+	frappe.db.bulk_insert("__global_search", fields, values, on_duplicate="ignore",
+		conflict_fields=["name", "doctype"])
 
 
 def update_global_search(doc):
@@ -358,9 +349,28 @@ def sync_global_search():
 	:param flags:
 	:return:
 	"""
-	while frappe.cache().llen('global_search_queue') > 0:
-		value = json.loads(frappe.cache().lpop('global_search_queue').decode('utf-8'))
-		sync_value(value)
+	cache = frappe.cache()
+	queue = cache.make_key('global_search_queue')
+	fields = ["doctype", "name", "content", "published", "title", "route"]
+
+	while True:
+		# the queue is pushed from the left, drain the oldest values first so that values
+		# queued later overwrite them
+		pipe = cache.pipeline()
+		pipe.lrange(queue, -500, -1)
+		pipe.ltrim(queue, 0, -501)
+		entries = pipe.execute()[0]
+		if not entries:
+			break
+
+		# newest first within the batch, keep only the latest value of a document
+		values = {}
+		for entry in entries:
+			value = json.loads(frappe.safe_decode(entry))
+			values.setdefault((value['doctype'], value['name']), [value[field] for field in fields])
+
+		frappe.db.bulk_insert("__global_search", fields, list(values.values()),
+			on_duplicate="update", conflict_fields=["doctype", "name"])
 
 def sync_value_in_queue(value):
 	try:
@@ -3,10 +3,139 @@
 from __future__ import unicode_literals
 
 import redis, frappe, re
+import threading
+from collections import OrderedDict
+from fnmatch import fnmatch
+from time import time
 from six.moves import cPickle as pickle
-from frappe.utils import cstr
+from frappe.utils import cstr, cint
 from six import iteritems
 
+# keys that may be held in the process cache, override with `process_cache_keys` in site config
+process_cache_keys = ("meta", "form_meta", "table_columns", "defaults", "doctype_modules",
+	"is_table", "app_hooks", "installed_apps", "app_modules", "module_app", "*_map",
+	"role_permissions")
+
+
+class ProcessCache(object):
+	"""Bounded LRU cache local to the worker process that survives across requests.
+
+	It is enabled by setting `process_cache_size` (max number of entries) in site config.
+	Entries expire after `process_cache_ttl` seconds. Values are kept pickled, so callers
+	always get their own copy.
+
+	Deleting or overwriting a cached key in any process bumps the site's `process_cache_version`
+	in Redis (filling a missing key does not, no process can hold a value for it).
+	Every process checks this counter once per request and drops its entries for the site
+	if the counter changed."""
+	version_key = "process_cache_version"
+
+	def __init__(self):
+		self.data = OrderedDict()
+		self.versions = {}
+		self.lock = threading.Lock()
+		self.hits = self.misses = self.evictions = self.invalidations = 0
+
+	@staticmethod
+	def is_enabled():
+		return cint(frappe.conf.get("process_cache_size")) > 0
+
+	@staticmethod
+	def is_cacheable(name):
+		patterns = frappe.conf.get("process_cache_keys") or process_cache_keys
+		return any(fnmatch(name, pattern) for pattern in patterns)
+
+	def get(self, key):
+		"""Returns the pickled value stored against `key` or None"""
+		with self.lock:
+			entry = self.data.get(key)
+			if entry and entry[1] < time():
+				del self.data[key]
+				entry = None
+
+			if not entry:
+				self.misses += 1
+				return None
+
+			self.data.move_to_end(key)
+			self.hits += 1
+			return entry[0]
+
+	def set(self, key, pickled_value):
+		ttl = cint(frappe.conf.get("process_cache_ttl")) or 60
+		size = cint(frappe.conf.get("process_cache_size"))
+		with self.lock:
+			self.data[key] = (pickled_value, time() + ttl)
+			self.data.move_to_end(key)
+			while len(self.data) > size:
+				self.data.popitem(last=False)
+				self.evictions += 1
+
+	def delete(self, name, field=None):
+		"""Delete the value (all fields if the key is a hash) of the given made key"""
+		with self.lock:
+			for key in list(self.data):
+				if key[0] == name and (field is None or key[1] == field):
+					del self.data[key]
+
+	def clear(self, prefix=None):
+		with self.lock:
+			if prefix:
+				for key in list(self.data):
+					if key[0].startswith(prefix):
+						del self.data[key]
+			else:
+				self.data.clear()
+			self.invalidations += 1
+
+	def sync(self, redis_server):
+		"""Drop the current site's entries if they were invalidated by another process.
+		Checked once per request."""
+		if getattr(frappe.local, "process_cache_synced", False):
+			return
+
+		frappe.local.process_cache_synced = True
+		site = frappe.conf.db_name
+		try:
+			version = redis.Redis.get(redis_server, redis_server.make_key(self.version_key))
+		except redis.exceptions.ConnectionError:
+			version = None
+
+		if self.versions.get(site) != version:
+			self.clear("{0}|".format(site).encode("utf-8"))
+			self.versions[site] = version
+
+	def bump_version(self, redis_server):
+		try:
+			redis.Redis.incr(redis_server, redis_server.make_key(self.version_key))
+		except redis.exceptions.ConnectionError:
+			pass
+
+	def get_stats(self):
+		lookups = self.hits + self.misses
+		return {
+			"size": len(self.data),
+			"hits": self.hits,
+			"misses": self.misses,
+			"hit_rate": round(self.hits * 100.0 / lookups, 2) if lookups else 0,
+			"evictions": self.evictions,
+			"invalidations": self.invalidations
+		}
+
+process_cache = ProcessCache()
+
+
+# removes the keys (ARGV) that do not exist from the key index (KEYS[1]), atomically so that a key
+# written after it was found missing stays in the index
+prune_key_index_script = """
+for _, key in ipairs(ARGV) do
+	if redis.call('exists', key) == 0 then
+		redis.call('srem', KEYS[1], key)
+	end
+end
+return 0
+"""
+
 
 class RedisWrapper(redis.Redis):
 	"""Redis client that will automatically prefix conf.db_name"""
@@ -28,6 +157,15 @@ class RedisWrapper(redis.Redis):
 
 		return "{0}|{1}".format(frappe.conf.db_name, key).encode('utf-8')
 
+	@staticmethod
+	def use_process_cache(name):
+		"""Returns True if the (unprefixed) key `name` can be held in the process cache"""
+		return process_cache.is_enabled() and process_cache.is_cacheable(cstr(name))
+
+	def get_process_cache_stats(self):
+		"""Returns hit / miss counters of the process cache"""
+		return process_cache.get_stats()
+
 	def set_value(self, key, val, user=None, expires_in_sec=None):
 		"""Sets cache value.
 
@@ -36,20 +174,30 @@ class RedisWrapper(redis.Redis):
 		:param user: Prepends key with User
 		:param expires_in_sec: Expire value of this key in X seconds
 		"""
+		original_key = key
+		if user == True:
+			user = frappe.session.user
 		key = self.make_key(key, user)
 
 		if not expires_in_sec:
 			frappe.local.cache[key] = val
 
-		try:
-			if expires_in_sec:
-				self.setex(key, pickle.dumps(val), expires_in_sec)
-			else:
-				self.set(key, pickle.dumps(val))
+		use_process_cache = self.use_process_cache(original_key)
+		if use_process_cache:
+			process_cache.delete(key)
 
+		try:
+			pipe = self.pipeline()
+			if use_process_cache:
+				pipe.exists(key)
+			pipe.set(key, pickle.dumps(val), ex=expires_in_sec or None)
+			overwritten = pipe.execute()[0] if use_process_cache else False
 		except redis.exceptions.ConnectionError:
 			return None
 
+		if overwritten:
+			process_cache.bump_version(self)
+
 	def get_value(self, key, generator=None, user=None, expires=False):
 		"""Returns cache value. If not found and generator function is
 			given, it will call the generator.
@@ -61,15 +209,25 @@ class RedisWrapper(redis.Redis):
 		original_key = key
 		key = self.make_key(key, user)
 
+		use_process_cache = not expires and self.use_process_cache(original_key)
+
 		if key in frappe.local.cache:
 			val = frappe.local.cache[key]
 
 		else:
 			val = None
-			try:
-				val = self.get(key)
-			except redis.exceptions.ConnectionError:
-				pass
+			if use_process_cache:
+				process_cache.sync(self)
+				val = process_cache.get((key, None))
+
+			if val is None:
+				try:
+					val = self.get(key)
+				except redis.exceptions.ConnectionError:
+					pass
+
+				if val is not None and use_process_cache:
+					process_cache.set((key, None), val)
 
 			if val is not None:
 				val = pickle.loads(val)
@@ -84,6 +242,83 @@ class RedisWrapper(redis.Redis):
 
 		return val
 
+	def get_values(self, keys, user=None):
+		"""Returns a dict of cache values for the given keys. Keys not found in
+		`frappe.local.cache` (or the process cache) are fetched with a single `MGET`.
+		Missing keys are returned as `None`.
+
+		:param keys: List of cache keys.
+		:param user: Prepends keys with User
+		"""
+		out = {}
+		to_fetch = {}
+		for key in keys:
+			_key = self.make_key(key, user)
+			if _key in frappe.local.cache:
+				out[key] = frappe.local.cache[_key]
+				continue
+
+			val = None
+			if self.use_process_cache(key):
+				process_cache.sync(self)
+				val = process_cache.get((_key, None))
+
+			if val is None:
+				to_fetch[_key] = key
+			else:
+				out[key] = frappe.local.cache[_key] = pickle.loads(val)
+
+		if to_fetch:
+			_keys = list(to_fetch)
+			try:
+				values = self.mget(_keys)
+			except redis.exceptions.ConnectionError:
+				values = [None] * len(_keys)
+
+			for _key, val in zip(_keys, values):
+				key = to_fetch[_key]
+				if val is not None:
+					if self.use_process_cache(key):
+						process_cache.set((_key, None), val)
+					val = frappe.local.cache[_key] = pickle.loads(val)
+				out[key] = val
+
+		return out
+
+	def set_values(self, mapping, user=None, expires_in_sec=None):
+		"""Sets multiple cache values in a single round trip.
+
+		:param mapping: Dict of cache key and value to be cached
+		:param user: Prepends keys with User
+		:param expires_in_sec: Expire values in X seconds
+		"""
+		if user == True:
+			user = frappe.session.user
+
+		try:
+			pipe = self.pipeline()
+			# positions of the `EXISTS` replies of keys in the process cache
+			exists_replies = []
+			for key, val in iteritems(mapping):
+				_key = self.make_key(key, user)
+				if not expires_in_sec:
+					frappe.local.cache[_key] = val
+
+				if self.use_process_cache(key):
+					process_cache.delete(_key)
+					exists_replies.append(len(pipe))
+					pipe.exists(_key)
+
+				pipe.set(_key, pickle.dumps(val), ex=expires_in_sec or None)
+
+			replies = pipe.execute()
+
+		except redis.exceptions.ConnectionError:
+			return None
+
+		if any(replies[i] for i in exists_replies):
+			process_cache.bump_version(self)
+
 	def get_all(self, key):
 		ret = {}
 		for k in self.get_keys(key):
@@ -91,11 +326,18 @@ class RedisWrapper(redis.Redis):
 
 		return ret
 
-	def get_keys(self, key):
-		"""Return keys starting with `key`."""
+	def get_keys(self, key, indexed=False):
+		"""Return keys starting with `key`.
+
+		The keyspace is walked with `SCAN`, which unlike `KEYS` does not block the server. If
+		`indexed` is set, the members of the key index of `key` (see `add_to_key_index`) that
+		still exist are returned instead."""
 		try:
+			if indexed:
+				return self.get_indexed_keys(key)
+
 			key = self.make_key(key + "*")
-			return self.keys(key)
+			return list(self.scan_iter(match=key, count=cint(frappe.conf.redis_scan_count) or 1000))
 
 		except redis.exceptions.ConnectionError:
 			regex = re.compile(cstr(key).replace("|", "\|").replace("*", "[\w]*"))
@@ -105,6 +347,53 @@ class RedisWrapper(redis.Redis):
 		"""Delete keys with wildcard `*`."""
 		try:
 			self.delete_value(self.get_keys(key), make_keys=False)
+			self.delete(self.get_key_index_name(key))
+		except redis.exceptions.ConnectionError:
+			pass
+
+	def get_key_index_name(self, prefix):
+		return self.make_key("key_index:" + prefix)
+
+	def get_indexed_keys(self, prefix):
+		"""Returns the keys in the index of `prefix` that exist, members of keys that expired
+		or were deleted are removed from the index"""
+		name = self.get_key_index_name(prefix)
+		self.seed_key_index(prefix)
+
+		keys = list(super(RedisWrapper, self).smembers(name))
+		if not keys:
+			return []
+
+		pipe = self.pipeline()
+		for key in keys:
+			pipe.exists(key)
+		exists = pipe.execute()
+
+		missing = [key for key, key_exists in zip(keys, exists) if not key_exists]
+		if missing:
+			# checked again in the script, the key may have been written since
+			self.register_script(prune_key_index_script)(keys=[name], args=missing)
+
+		return [key for key, key_exists in zip(keys, exists) if key_exists]
+
+	def seed_key_index(self, prefix):
+		"""Add the keys of `prefix` written before the index was used, with a one-off `SCAN`"""
+		seeded = self.make_key("key_index_seeded:" + prefix)
+		if super(RedisWrapper, self).get(seeded):
+			return
+
+		keys = self.get_keys(prefix)
+		if keys:
+			super(RedisWrapper, self).sadd(self.get_key_index_name(prefix), *keys)
+		super(RedisWrapper, self).set(seeded, 1)
+
+	def add_to_key_index(self, prefix, *keys):
+		"""Record `keys` (unprefixed) in the index of `prefix` so that `get_keys(prefix, indexed=True)`
+		costs O(matching keys). Only for prefixes whose keys are all written with an index entry,
+		as keys that are not in the index are not found."""
+		try:
+			super(RedisWrapper, self).sadd(self.get_key_index_name(prefix),
+				*[self.make_key(key) for key in keys])
 		except redis.exceptions.ConnectionError:
 			pass
 
@@ -116,18 +405,27 @@ class RedisWrapper(redis.Redis):
 		if not isinstance(keys, (list, tuple)):
 			keys = (keys, )
 
+		invalidate_process_cache = False
 		for key in keys:
+			name = key if make_keys else cstr(key).split("|", 1)[-1]
 			if make_keys:
 				key = self.make_key(key, shared=shared)
 
 			if key in frappe.local.cache:
 				del frappe.local.cache[key]
 
+			if not shared and self.use_process_cache(name):
+				process_cache.delete(key)
+				invalidate_process_cache = True
+
 			try:
 				self.delete(key)
 			except redis.exceptions.ConnectionError:
 				pass
 
+		if invalidate_process_cache:
+			process_cache.bump_version(self)
+
 	def lpush(self, key, value):
 		super(RedisWrapper, self).lpush(self.make_key(key), value)
 
@@ -154,12 +452,19 @@ class RedisWrapper(redis.Redis):
 			frappe.local.cache[_name] = {}
 		frappe.local.cache[_name][key] = value
 
+		use_process_cache = not shared and self.use_process_cache(name)
+		if use_process_cache:
+			process_cache.delete(_name, key)
+
 		# set in redis
 		try:
-			super(RedisWrapper, self).hset(_name,
+			added = super(RedisWrapper, self).hset(_name,
 				key, pickle.dumps(value))
 		except redis.exceptions.ConnectionError:
-			pass
+			return
+
+		if use_process_cache and not added:
+			process_cache.bump_version(self)
 
 	def hgetall(self, name):
 		return {key: pickle.loads(value) for key, value in
@@ -174,10 +479,19 @@ class RedisWrapper(redis.Redis):
 			return frappe.local.cache[_name][key]
 
 		value = None
-		try:
-			value = super(RedisWrapper, self).hget(_name, key)
-		except redis.exceptions.ConnectionError:
-			pass
+		use_process_cache = not shared and self.use_process_cache(name)
+		if use_process_cache:
+			process_cache.sync(self)
+			value = process_cache.get((_name, key))
+
+		if value is None:
+			try:
+				value = super(RedisWrapper, self).hget(_name, key)
+			except redis.exceptions.ConnectionError:
+				pass
+
+			if value and use_process_cache:
+				process_cache.set((_name, key), value)
 
 		if value:
 			value = pickle.loads(value)
@@ -190,6 +504,77 @@ class RedisWrapper(redis.Redis):
 				pass
 		return value
 
+	def hget_many(self, name, keys, shared=False):
+		"""Returns a dict of values for the given keys of hash `name`, fetching the ones
+		not cached locally with a single `HMGET`. Missing keys are returned as `None`."""
+		_name = self.make_key(name, shared=shared)
+		if not _name in frappe.local.cache:
+			frappe.local.cache[_name] = {}
+		local_cache = frappe.local.cache[_name]
+
+		use_process_cache = not shared and self.use_process_cache(name)
+		if use_process_cache:
+			process_cache.sync(self)
+
+		out = {}
+		to_fetch = []
+		for key in keys:
+			if key in local_cache:
+				out[key] = local_cache[key]
+				continue
+
+			value = use_process_cache and process_cache.get((_name, key))
+			if value:
+				out[key] = local_cache[key] = pickle.loads(value)
+			else:
+				to_fetch.append(key)
+
+		if to_fetch:
+			try:
+				values = super(RedisWrapper, self).hmget(_name, to_fetch)
+			except redis.exceptions.ConnectionError:
+				values = [None] * len(to_fetch)
+
+			for key, value in zip(to_fetch, values):
+				if value:
+					if use_process_cache:
+						process_cache.set((_name, key), value)
+					out[key] = local_cache[key] = pickle.loads(value)
+				else:
+					out[key] = None
+
+		return out
+
+	def hset_many(self, name, mapping, shared=False):
+		"""Set multiple keys of hash `name` with a single `HMSET`"""
+		if not mapping:
+			return
+
+		_name = self.make_key(name, shared=shared)
+		local_cache = frappe.local.cache.setdefault(_name, {})
+		local_cache.update(mapping)
+
+		use_process_cache = not shared and self.use_process_cache(name)
+		if use_process_cache:
+			for key in mapping:
+				process_cache.delete(_name, key)
+
+		try:
+			if use_process_cache:
+				# count the fields that are added, the others are overwritten
+				pipe = self.pipeline()
+				for key, value in iteritems(mapping):
+					pipe.hset(_name, key, pickle.dumps(value))
+				added = sum(pipe.execute())
+			else:
+				super(RedisWrapper, self).hmset(_name,
+					{key: pickle.dumps(value) for key, value in iteritems(mapping)})
+		except redis.exceptions.ConnectionError:
+			return
+
+		if use_process_cache and added < len(mapping):
+			process_cache.bump_version(self)
+
 	def hdel(self, name, key, shared=False):
 		_name = self.make_key(name, shared=shared)
 
@@ -201,10 +586,14 @@ class RedisWrapper(redis.Redis):
 		except redis.exceptions.ConnectionError:
 			pass
 
+		if not shared and self.use_process_cache(name):
+			process_cache.delete(_name, key)
+			process_cache.bump_version(self)
+
 	def hdel_keys(self, name_starts_with, key):
 		"""Delete hash names with wildcard `*` and key"""
 		for name in frappe.cache().get_keys(name_starts_with):
-			name = name.split("|", 1)[1]
+			name = cstr(name).split("|", 1)[1]
 			self.hdel(name, key)
 
 	def hkeys(self, name):
@@ -87,15 +87,17 @@ def read_xlsx_file_from_attached_file(file_url=None, fcontent=None, filepath=Non
 	else:
 		return
 
-	rows = []
-	wb1 = load_workbook(filename=filename, read_only=True, data_only=True)
-	ws1 = wb1.active
-	for row in ws1.iter_rows():
-		tmp_list = []
-		for cell in row:
-			tmp_list.append(cell.value)
-		rows.append(tmp_list)
-	return rows
+	return list(read_xlsx_rows(filename))
+
+def read_xlsx_rows(filename):
+	"""Yields the rows of the active sheet of a xlsx file (path or file object) one by one,
+	the workbook is opened in read only mode and not loaded in memory"""
+	wb = load_workbook(filename=filename, read_only=True, data_only=True)
+	try:
+		for row in wb.active.iter_rows():
+			yield [cell.value for cell in row]
+	finally:
+		wb.close()
 
 def read_xls_file_from_attached_file(content):
 	book = xlrd.open_workbook(file_contents=content)
@@ -6,18 +6,20 @@ import frappe
 from frappe import _
 import frappe.sessions
 from frappe.utils import cstr
-import os, mimetypes, json
+import os, mimetypes, json, hashlib, time
+from datetime import datetime
 
 import six
 from six import iteritems
 from werkzeug.wrappers import Response
 from werkzeug.routing import Map, Rule, NotFound
 from werkzeug.wsgi import wrap_file
+from werkzeug.http import is_resource_modified
 
 from frappe.website.context import get_context
 from frappe.website.redirect import resolve_redirect
 from frappe.website.utils import (get_home_page, can_cache, delete_page_cache,
-	get_toc, get_next_link)
+	get_toc, get_next_link, get_surrogate_keys, purge_page_cache)
 from frappe.website.router import clear_sitemap
 from frappe.translate import guess_language
 
@@ -30,6 +32,12 @@ def render(path=None, http_status_code=None):
 
 	try:
 		path = path.strip('/ ')
+		frappe.flags.cached_page = None
+
+		response = get_not_modified_response(path)
+		if response:
+			return response
+
 		raise_if_disabled(path)
 		resolve_redirect(path)
 		path = resolve_path(path)
@@ -128,22 +136,65 @@ def build_response(path, data, http_status_code, headers=None):
 	response.headers["X-Page-Name"] = path.encode("ascii", errors="xmlcharrefreplace")
 	response.headers["X-From-Cache"] = frappe.local.response.from_cache or False
 
+	if (http_status_code in (200, 304) and frappe.flags.cached_page
+		and frappe.session.user == "Guest"):
+		set_cache_headers(response, frappe.flags.cached_page)
+
 	if headers:
 		for key, val in iteritems(headers):
 			response.headers[key] = val.encode("ascii", errors="xmlcharrefreplace")
 
 	return response
 
-def render_page_by_language(path):
+def set_cache_headers(response, page):
+	"""Set the validators of the cached page and the headers for reverse proxies / CDNs,
+	`Cache-Control` can be set with `website_cache_control` in site config"""
+	response.set_etag(page.etag)
+	response.last_modified = datetime.utcfromtimestamp(page.last_modified)
+	response.headers["Cache-Control"] = (frappe.conf.website_cache_control
+		or "public, max-age=0, must-revalidate")
+	response.headers["Surrogate-Key"] = " ".join(page.surrogate_keys)
+
+def get_not_modified_response(path):
+	"""Returns a 304 response if the request's `If-None-Match` / `If-Modified-Since` match
+	the page cached for the path, before rendering or querying the database.
+
+	This runs before `raise_if_disabled` and `resolve_redirect`, it relies on Portal Settings
+	and Website Settings (route redirects) clearing the cached pages when they are changed."""
+	request = frappe.local.request
+	if not (request.if_none_match or request.if_modified_since):
+		return
+
+	# cached pages of logged in users would have a stale csrf token
+	if frappe.session.user != "Guest" or not can_cache():
+		return
+
+	path = resolve_path(path)
+	lang_path = get_language_path(path)
+	page = (lang_path and get_cached_page(lang_path)) or get_cached_page(path)
+	if not page:
+		return
+
+	if not is_resource_modified(request.environ, etag=page.etag,
+		last_modified=datetime.utcfromtimestamp(page.last_modified)):
+		frappe.flags.cached_page = page
+		frappe.local.response.from_cache = True
+		return build_response(path, "", 304)
+
+def get_language_path(path):
+	"""Returns the path of the page translated in the user's language, if the website is translated"""
 	translated_languages = frappe.get_hooks("translated_languages_for_website")
 	user_lang = guess_language(translated_languages)
 	if translated_languages and user_lang in translated_languages:
-		try:
-			if path and path != "index":
-				lang_path = '{0}/{1}'.format(user_lang, path)
-			else:
-				lang_path = user_lang # index
+		if path and path != "index":
+			return '{0}/{1}'.format(user_lang, path)
+		else:
+			return user_lang # index
 
+def render_page_by_language(path):
+	lang_path = get_language_path(path)
+	if lang_path:
+		try:
 			return render_page(lang_path)
 		except frappe.DoesNotExistError:
 			return render_page(path)
@@ -153,20 +204,29 @@ def render_page_by_language(path):
 
 def render_page(path):
 	"""get page html"""
-	out = None
+	page = None
 
 	if can_cache():
 		# return rendered page
-		page_cache = frappe.cache().hget("website_page", path)
-		if page_cache and frappe.local.lang in page_cache:
-			out = page_cache[frappe.local.lang]
+		page = get_cached_page(path)
 
-	if out:
+	if page:
 		frappe.local.response.from_cache = True
-		return out
+		frappe.flags.cached_page = page
+		return page.html
 
 	return build(path)
 
+def get_cached_page(path):
+	"""Returns the page cached for the path in the current language as a dict of `html`, its
+	`etag`, `last_modified` (timestamp of the build) and `surrogate_keys`"""
+	page_cache = frappe.cache().hget("website_page", path)
+	page = page_cache and page_cache.get(frappe.local.lang)
+
+	# pages cached as html, without validators
+	if isinstance(page, dict):
+		return frappe._dict(page)
+
 def build(path):
 	if not frappe.db:
 		frappe.connect()
@@ -205,9 +265,17 @@ def build_page(path):
 	# html = frappe.get_template(context.base_template_path).render(context)
 
 	if can_cache(context.no_cache):
+		page = frappe._dict(
+			html=html,
+			etag=hashlib.md5(frappe.safe_encode(html)).hexdigest(),
+			last_modified=int(time.time()),
+			surrogate_keys=get_surrogate_keys(route=context.route or path,
+				doctype=context.doc.doctype if context.doc else None)
+		)
 		page_cache = frappe.cache().hget("website_page", path) or {}
-		page_cache[frappe.local.lang] = html
+		page_cache[frappe.local.lang] = page
 		frappe.cache().hset("website_page", path, page_cache)
+		frappe.flags.cached_page = page
 
 	return html
 
@@ -282,8 +350,7 @@ def clear_cache(path=None):
 	'''Clear website caches
 
 	:param path: (optional) for the given path'''
-	for key in ('website_generator_routes', 'website_pages',
-		'website_full_index'):
+	for key in ('website_pages', 'website_full_index'):
 		frappe.cache().delete_value(key)
 
 	frappe.cache().delete_value("website_404")
@@ -295,12 +362,14 @@ def clear_cache(path=None):
 		frappe.clear_cache("Guest")
 		for key in ('portal_menu_items', 'home_page', 'website_route_rules',
 			'doctypes_with_web_view', 'website_redirects', 'page_context',
-			'website_page'):
+			'website_page', 'website_route_index'):
 			frappe.cache().delete_value(key)
 
 	for method in frappe.get_hooks("website_clear_cache"):
 		frappe.get_attr(method)(path)
 
+	purge_page_cache(route=path)
+
 def render_403(e, pathname):
 	frappe.local.message = cstr(e.message if six.PY2 else e)
 	frappe.local.message_title = _("Not Permitted")
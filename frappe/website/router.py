@@ -7,9 +7,12 @@ import frappe, os
 from frappe.website.utils import (can_cache, delete_page_cache, extract_title,
 	extract_comment_tag)
 from frappe.model.document import get_controller
-from six import text_type
+from six import text_type, iteritems
 import io
 
+ROUTE_INDEX_KEY = "website_route_index"
+ROUTE_INDEX_BUILT = "__built"
+
 def resolve_route(path):
 	"""Returns the page route object based on searching in pages and generators.
 	The `www` folder is also a part of generator **Web Page**.
@@ -85,18 +88,86 @@ def clear_sitemap():
 
 def get_all_page_context_from_doctypes():
 	'''Get all doctype generated routes (for sitemap.xml)'''
-	routes = frappe.cache().get_value("website_generator_routes")
-	if not routes:
-		routes = get_page_info_from_doctypes()
-		frappe.cache().set_value("website_generator_routes", routes)
+	return get_route_index()
+
+def get_page_info_from_doctypes(path=None):
+	'''Returns the doctype, name and modified of the published document of the route (or of
+	all routes if path is not set) from the route index'''
+	if not path:
+		return get_route_index()
+
+	cache = frappe.cache()
+	if not cache.hget(ROUTE_INDEX_KEY, ROUTE_INDEX_BUILT):
+		return get_route_index().get(path)
+
+	return cache.hget(ROUTE_INDEX_KEY, path)
+
+def get_route_index():
+	'''Returns all routes in the index, building it if required'''
+	routes = frappe.cache().hgetall(ROUTE_INDEX_KEY)
+	if not routes.pop(ROUTE_INDEX_BUILT.encode(), None):
+		return rebuild_route_index()
+
+	return {frappe.safe_decode(route): page for route, page in iteritems(routes)}
+
+def rebuild_route_index():
+	'''Index the routes of published documents of all doctypes with web view in Redis.
+	The index is updated by WebsiteGenerator on save, rename and delete.'''
+	with get_route_index_lock():
+		routes = get_routes_from_doctypes()
+
+		mapping = dict(routes)
+		mapping[ROUTE_INDEX_BUILT] = 1
+		frappe.cache().delete_value(ROUTE_INDEX_KEY)
+		frappe.cache().hset_many(ROUTE_INDEX_KEY, mapping)
 
 	return routes
 
-def get_page_info_from_doctypes(path=None):
+def get_route_index_lock():
+	'''Updates wait for a rebuild of the index, so that they are not overwritten by routes read
+	before they were committed'''
+	cache = frappe.cache()
+	return cache.lock(cache.make_key("website_route_index_lock"), timeout=120, blocking_timeout=150)
+
+def update_route_index(doc, old_route=None):
+	'''Update the route of the document in the index once the transaction is committed,
+	called after it is saved or renamed'''
+	if old_route and old_route != doc.route:
+		remove_from_route_index(doc, old_route)
+
+	if not doc.route:
+		return
+
+	if doc.is_website_published():
+		frappe.db.after_commit(set_indexed_route, doc.route,
+			{"doctype": doc.doctype, "name": doc.name, "modified": doc.modified})
+	else:
+		remove_from_route_index(doc)
+
+def remove_from_route_index(doc, route=None):
+	'''Remove the route of the document from the index once the transaction is committed'''
+	route = route or doc.route
+	if not route:
+		return
+
+	frappe.db.after_commit(remove_indexed_route, route, doc.doctype, doc.name)
+
+def set_indexed_route(route, page):
+	with get_route_index_lock():
+		frappe.cache().hset(ROUTE_INDEX_KEY, route, page)
+
+def remove_indexed_route(route, doctype, name):
+	'''Remove the route from the index, if it is indexed for the document'''
+	with get_route_index_lock():
+		page = frappe.cache().hget(ROUTE_INDEX_KEY, route)
+		if page and page.get("doctype") == doctype and page.get("name") == name:
+			frappe.cache().hdel(ROUTE_INDEX_KEY, route)
+
+def get_routes_from_doctypes():
+	'''Returns the routes of published documents'''
 	routes = {}
 	for doctype in get_doctypes_with_web_view():
 		condition = ""
-		values = []
 		controller = get_controller(doctype)
 		meta = frappe.get_meta(doctype)
 
@@ -107,18 +178,11 @@ def get_page_info_from_doctypes(path=None):
 		if condition_field:
 			condition ="where {0}=1".format(condition_field)
 
-		if path:
-			condition += ' {0} `route`=%s limit 1'.format('and' if 'where' in condition else 'where')
-			values.append(path)
-
 		try:
 			for r in frappe.db.sql("""select route, name, modified from `tab{0}`
-					{1}""".format(doctype, condition), values=values, as_dict=True):
-				routes[r.route] = {"doctype": doctype, "name": r.name, "modified": r.modified}
-
-				# just want one path, return it!
-				if path:
-					return routes[r.route]
+					{1}""".format(doctype, condition), as_dict=True):
+				if r.route:
+					routes[r.route] = {"doctype": doctype, "name": r.name, "modified": r.modified}
 		except Exception as e:
 			if not frappe.db.is_missing_column(e): raise e
 
@@ -5,6 +5,7 @@ from __future__ import unicode_literals
 import functools
 import frappe, re, os
 from six import iteritems
+from six.moves.urllib.parse import quote
 from past.builtins import cmp
 from frappe.utils import markdown
 
@@ -19,6 +20,39 @@ def delete_page_cache(path):
 		for name in groups:
 			cache.delete_key(name)
 
+def get_surrogate_keys(route=None, doctype=None):
+	"""Returns the `Surrogate-Key`s of a page, by which it can be purged from reverse proxy / CDN caches"""
+	keys = ["website"]
+	if route:
+		keys.append("route:" + quote(route.strip("/")))
+	if doctype:
+		keys.append("doctype:" + frappe.scrub(doctype))
+	return keys
+
+def purge_page_cache(route=None, doctype=None):
+	"""Purge the pages of the route or the DocType (all pages if neither is set) from reverse
+	proxy / CDN caches. The surrogate keys are passed to the `website_purge_cache` hooks and
+	sent in a `PURGE` request to `website_purge_url` if set in site config."""
+	keys = get_surrogate_keys(route, doctype)
+	if route or doctype:
+		# keep the page specific keys only
+		keys = keys[1:]
+
+	for method in frappe.get_hooks("website_purge_cache"):
+		frappe.get_attr(method)(keys)
+
+	if frappe.conf.website_purge_url:
+		from frappe.utils.background_jobs import enqueue
+		enqueue("frappe.website.utils.send_purge_request", queue="short",
+			keys=keys, enqueue_after_commit=True)
+
+def send_purge_request(keys):
+	import requests
+
+	response = requests.request("PURGE", frappe.conf.website_purge_url,
+		headers={"Surrogate-Key": " ".join(keys)}, timeout=10)
+	response.raise_for_status()
+
 def find_first_image(html):
 	m = re.finditer("""<img[^>]*src\s?=\s?['"]([^'"]*)['"]""", html)
 	try:
@@ -4,8 +4,9 @@
 from __future__ import unicode_literals
 import frappe
 from frappe.model.document import Document
-from frappe.website.utils import cleanup_page_name
+from frappe.website.utils import cleanup_page_name, purge_page_cache
 from frappe.website.render import clear_cache
+from frappe.website.router import update_route_index, remove_from_route_index
 from frappe.modules import get_module_name
 
 class WebsiteGenerator(Document):
@@ -73,6 +74,11 @@ class WebsiteGenerator(Document):
 	def clear_cache(self):
 		super(WebsiteGenerator, self).clear_cache()
 		clear_cache(self.route)
+		# list pages of the doctype show the document too
+		purge_page_cache(doctype=self.doctype)
+
+		doc_before_save = self.get_doc_before_save()
+		update_route_index(self, doc_before_save and doc_before_save.route)
 
 	def scrub(self, text):
 		return cleanup_page_name(text).replace('_', '-')
@@ -83,6 +89,11 @@ class WebsiteGenerator(Document):
 
 	def on_trash(self):
 		self.clear_cache()
+		remove_from_route_index(self)
+
+	def after_rename(self, old, new, merge):
+		remove_from_route_index(frappe._dict(doctype=self.doctype, name=old), self.route)
+		update_route_index(self)
 
 	def is_website_published(self):
 		"""Return true if published in website"""
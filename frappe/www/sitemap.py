@@ -4,7 +4,6 @@
 from __future__ import unicode_literals
 
 import frappe
-from frappe.model.document import get_controller
 from frappe.utils import get_request_site_address, get_datetime, nowdate
 from frappe.website.router import get_pages, get_all_page_context_from_doctypes
 from six import iteritems
@@ -39,27 +38,10 @@ def get_context(context):
 
 def get_public_pages_from_doctypes():
 	'''Returns pages from doctypes that are publicly accessible'''
+	routes = {}
+	for route, page in iteritems(get_all_page_context_from_doctypes()):
+		meta = frappe.get_meta(page["doctype"])
+		if meta.has_web_view and meta.allow_guest_to_view:
+			routes[route] = page
 
-	def get_sitemap_routes():
-		routes = {}
-		doctypes_with_web_view = [d.name for d in frappe.db.get_all('DocType', {
-			'has_web_view': 1,
-			'allow_guest_to_view': 1
-		})]
-
-		for doctype in doctypes_with_web_view:
-			controller = get_controller(doctype)
-			meta = frappe.get_meta(doctype)
-			condition_field = meta.is_published_field or controller.website.condition_field
-
-			try:
-				res = frappe.db.get_all(doctype, ['route', 'name', 'modified'], { condition_field: 1 })
-				for r in res:
-					routes[r.route] = {"doctype": doctype, "name": r.name, "modified": r.modified}
-
-			except Exception as e:
-				if not frappe.db.is_missing_column(e): raise e
-
-		return routes
-
-	return frappe.cache().get_value("sitemap_routes", get_sitemap_routes)
+	return routes